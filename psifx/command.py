@@ -7,6 +7,7 @@ from psifx.utils.command import Command, register_command, register_main_command
 from psifx.video.command import VideoCommand
 from psifx.audio.command import AudioCommand
 from psifx.text.command import TextCommand
+from psifx.io.command import IOCommand
 
 
 class PsifxCommand(Command):
@@ -25,6 +26,8 @@ class PsifxCommand(Command):
         register_command(subparsers, "audio", AudioCommand)
         register_command(subparsers, "video", VideoCommand)
         register_command(subparsers, "text", TextCommand)
+        register_command(subparsers, "io", IOCommand)
+
     @staticmethod
     def execute(parser: argparse.ArgumentParser, args: argparse.Namespace):
         """
@@ -0,0 +1,199 @@
+"""archive I/O command-line interface."""
+
+import argparse
+from pathlib import Path
+
+from psifx.utils.command import Command, register_command
+from psifx.io.tool import ConversionTool, FORMATS
+
+
+class IOCommand(Command):
+    """
+    Command-line interface for managing pose and feature archives.
+    """
+
+    @staticmethod
+    def setup(parser: argparse.ArgumentParser):
+        """
+        Sets up the command.
+
+        :param parser: The argument parser.
+        :return:
+        """
+        subparsers = parser.add_subparsers(title="available commands")
+
+        register_command(subparsers, "convert", ConvertCommand)
+        register_command(subparsers, "benchmark", BenchmarkCommand)
+
+    @staticmethod
+    def execute(parser: argparse.ArgumentParser, args: argparse.Namespace):
+        """
+        Executes the command.
+
+        :param parser: The argument parser.
+        :param args: The arguments.
+        :return:
+        """
+        parser.print_help()
+
+
+class ConvertCommand(Command):
+    """
+    Command-line interface for converting pose and feature archives between formats.
+    """
+
+    @staticmethod
+    def setup(parser: argparse.ArgumentParser):
+        """
+        Sets up the command.
+
+        :param parser: The argument parser.
+        :return:
+        """
+        parser.add_argument(
+            "--input",
+            type=Path,
+            required=True,
+            help="path to the input archive, such as ``/path/to/poses.tar.gz``, or to a directory tree of archives",
+        )
+        parser.add_argument(
+            "--output",
+            type=Path,
+            default=None,
+            help="path to the output archive or directory, by default the archives are converted next to the inputs",
+        )
+        parser.add_argument(
+            "--format",
+            type=str,
+            default="npz",
+            choices=FORMATS,
+            help="format of the output archives",
+        )
+        parser.add_argument(
+            "--num_workers",
+            type=int,
+            default=None,
+            help="number of worker processes, by default the number of CPUs",
+        )
+        parser.add_argument(
+            "--level",
+            type=int,
+            default=None,
+            help="compression level of the TAR archives, by default the usual level of the compression",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="number of compression threads of the TAR archives, per worker process",
+        )
+        parser.add_argument(
+            "--shard_size",
+            type=int,
+            default=None,
+            help="number of frames per shard, to write sharded TAR archives that can be read in parallel",
+        )
+        parser.add_argument(
+            "--overwrite",
+            default=False,
+            action=argparse.BooleanOptionalAction,
+            help="overwrite existing files, otherwise raises an error",
+        )
+        parser.add_argument(
+            "--verbose",
+            default=True,
+            action=argparse.BooleanOptionalAction,
+            help="verbosity of the script",
+        )
+
+    @staticmethod
+    def execute(parser: argparse.ArgumentParser, args: argparse.Namespace):
+        """
+        Executes the command.
+
+        :param parser: The argument parser.
+        :param args: The arguments.
+        :return:
+        """
+        tool = ConversionTool(
+            num_workers=args.num_workers,
+            level=args.level,
+            threads=args.threads,
+            shard_size=args.shard_size,
+            overwrite=args.overwrite,
+            verbose=args.verbose,
+        )
+        tool.convert(
+            input_path=args.input,
+            output_path=args.output,
+            format=args.format,
+        )
+        del tool
+
+
+class BenchmarkCommand(Command):
+    """
+    Command-line interface for comparing the archive formats on an existing archive.
+    """
+
+    @staticmethod
+    def setup(parser: argparse.ArgumentParser):
+        """
+        Sets up the command.
+
+        :param parser: The argument parser.
+        :return:
+        """
+        parser.add_argument(
+            "--input",
+            type=Path,
+            required=True,
+            help="path to the input TAR archive, such as ``/path/to/poses.tar.gz``",
+        )
+        parser.add_argument(
+            "--formats",
+            type=str,
+            nargs="+",
+            default=["tar", "tar.gz", "tar.zst", "npz"],
+            choices=FORMATS,
+            help="formats to compare",
+        )
+        parser.add_argument(
+            "--level",
+            type=int,
+            default=None,
+            help="compression level of the TAR archives, by default the usual level of the compression",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            nargs="+",
+            default=[1, 4],
+            help="numbers of compression threads to compare",
+        )
+        parser.add_argument(
+            "--verbose",
+            default=True,
+            action=argparse.BooleanOptionalAction,
+            help="verbosity of the script",
+        )
+
+    @staticmethod
+    def execute(parser: argparse.ArgumentParser, args: argparse.Namespace):
+        """
+        Executes the command.
+
+        :param parser: The argument parser.
+        :param args: The arguments.
+        :return:
+        """
+        tool = ConversionTool(
+            level=args.level,
+            verbose=args.verbose,
+        )
+        tool.benchmark(
+            input_path=args.input,
+            formats=args.formats,
+            threads=args.threads,
+        )
+        del tool
@@ -1,11 +1,154 @@
 """JSON I/O module."""
 
-from typing import Dict, List, Union
+from typing import Any, Dict, List, Union
 
 import json
+import math
 from pathlib import Path
 from tqdm import tqdm
 
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONCodec:
+    """
+    Codec encoding to and decoding from JSON, with the standard library.
+
+    NumPy arrays and scalars are converted to Python objects first.
+    """
+
+    name = "json"
+
+    @staticmethod
+    def default(obj: Any) -> Any:
+        """
+        Converts the objects that are not natively serializable.
+
+        :param obj: Object to serialize.
+        :return: Serializable object.
+        """
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(self, obj: Any) -> bytes:
+        """
+        Serializes an object into JSON.
+
+        :param obj: Object to serialize.
+        :return: UTF-8 encoded JSON.
+        """
+        return json.dumps(obj, default=self.default).encode()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """
+        Deserializes JSON.
+
+        :param data: JSON, either encoded or not.
+        :return: Deserialized object.
+        """
+        return json.loads(data)
+
+
+def has_nan(obj: Any) -> bool:
+    """
+    Checks whether an object holds non-finite floats, e.g. NaN, in its arrays, scalars, lists or dictionaries.
+
+    :param obj: Object to check.
+    :return: Whether a non-finite float was found.
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.dtype.kind in "fc" and not np.isfinite(obj).all()
+    if isinstance(obj, (float, np.floating)):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(has_nan(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(has_nan(value) for value in obj)
+    return False
+
+
+class ORJSONCodec(JSONCodec):
+    """
+    Codec encoding to and decoding from JSON with ``orjson``.
+
+    The NumPy arrays are serialized natively, without going through Python lists. ``orjson`` writes NaN and
+    infinities as ``null``, so the objects holding any are encoded with the standard library instead, which keeps them.
+    """
+
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        if has_nan(obj):
+            return super().dumps(obj)
+        # The arrays orjson does not serialize natively, e.g. non-contiguous ones, fall back to ``default``.
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # E.g. NaN, which the standard library writes but orjson does not parse.
+            return json.loads(data)
+
+
+CODECS = {"json": JSONCodec}
+if orjson is not None:
+    CODECS["orjson"] = ORJSONCodec
+
+_codec: JSONCodec = CODECS["orjson" if orjson is not None else "json"]()
+
+
+def get_codec() -> JSONCodec:
+    """
+    Returns the codec in use, ``orjson`` if installed, the standard library otherwise.
+
+    :return: The codec.
+    """
+    return _codec
+
+
+def set_codec(codec: Union[str, JSONCodec]):
+    """
+    Sets the codec in use.
+
+    :param codec: Name of the codec, e.g. ``json`` or ``orjson``, or codec instance.
+    :return:
+    """
+    global _codec
+    if isinstance(codec, str):
+        if codec not in CODECS:
+            raise ValueError(f"Unavailable JSON codec {codec}, expected one of {list(CODECS)}.")
+        codec = CODECS[codec]()
+    _codec = codec
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializes an object, e.g. a per-frame payload holding NumPy arrays, into JSON with the codec in use.
+
+    :param obj: Object to serialize.
+    :return: UTF-8 encoded JSON.
+    """
+    return _codec.dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Deserializes JSON with the codec in use.
+
+    :param data: JSON, either encoded or not.
+    :return: Deserialized object.
+    """
+    return _codec.loads(data)
+
 
 class JSONReader:
     """
@@ -0,0 +1,716 @@
+"""Mask I/O module."""
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from pathlib import Path
+import shutil
+
+import cv2
+import numpy as np
+
+from psifx.io import json
+from psifx.io.npz import NPZReader, NPZWriter
+from psifx.io.video import VideoReader, VideoWriter, concat_videos, scaled_size
+
+MASK_VERSION = 1
+MASK_SUFFIXES = [".mp4", ".npz"]
+
+
+def encode_rle(mask: np.ndarray) -> np.ndarray:
+    """
+    Run-length encodes a binary mask in row-major order, the runs alternate between background and foreground,
+    starting with the background.
+
+    :param mask: [H, W] binary mask.
+    :return: Lengths of the runs.
+    """
+    flat = np.asarray(mask, dtype=bool).ravel()
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate([[0], changes, [flat.size]]))
+    if flat.size and flat[0]:
+        runs = np.concatenate([[0], runs])
+    return runs.astype(np.uint32)
+
+
+def decode_rle(runs: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Decodes a run-length encoded binary mask.
+
+    :param runs: Lengths of the runs, starting with the background.
+    :param shape: Shape of the mask.
+    :return: [H, W] binary mask.
+    """
+    values = np.arange(len(runs)) % 2 == 1
+    return np.repeat(values, runs).reshape(shape)
+
+
+class RunLengthMask:
+    """
+    Run-length encoded binary mask, a compact in-memory representation of the masks, e.g. of a whole chunk of
+    frames, supporting the IoU without decoding.
+
+    :param runs: Lengths of the runs, starting with the background, see :func:`encode_rle`.
+    :param shape: Shape of the mask.
+    """
+
+    def __init__(self, runs: np.ndarray, shape: Tuple[int, int]):
+        self.runs = runs
+        self.shape = tuple(shape)
+
+    @classmethod
+    def encode(cls, mask: np.ndarray) -> "RunLengthMask":
+        """
+        Run-length encodes a binary mask.
+
+        :param mask: [H, W] binary mask.
+        :return: The encoded mask.
+        """
+        return cls(encode_rle(mask), mask.shape)
+
+    def decode(self) -> np.ndarray:
+        """
+        Decodes the mask.
+
+        :return: [H, W] binary mask.
+        """
+        return decode_rle(self.runs, self.shape)
+
+    def resize(self, size: Tuple[int, int]) -> np.ndarray:
+        """
+        Decodes the mask at another resolution, with nearest neighbour sampling, without decoding it at its own.
+
+        :param size: Width and height of the decoded mask.
+        :return: [H, W] binary mask.
+        """
+        width, height = size
+        rows = np.arange(height, dtype=np.int64) * self.shape[0] // height
+        columns = np.arange(width, dtype=np.int64) * self.shape[1] // width
+        positions = (rows[:, None] * self.shape[1] + columns[None, :]).ravel()
+        starts, ends = self.intervals()
+        # The last interval starting at or before every position, which contains it if it ends after it.
+        index = np.searchsorted(starts, positions, side="right") - 1
+        inside = index >= 0
+        inside[inside] = positions[inside] < ends[index[inside]]
+        return inside.reshape(height, width)
+
+    @property
+    def area(self) -> int:
+        return int(self.runs[1::2].sum())
+
+    def intervals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the foreground intervals of the flattened mask.
+
+        :return: Starts and ends, excluded, of the intervals.
+        """
+        bounds = np.cumsum(self.runs, dtype=np.int64)
+        ends = bounds[1::2]
+        return bounds[0::2][:len(ends)], ends
+
+    def intersection(self, other: "RunLengthMask") -> int:
+        """
+        Computes the area of the intersection with another mask.
+
+        :param other: The other mask, of the same shape.
+        :return: Number of pixels in both masks.
+        """
+        starts, ends = self.intervals()
+        other_starts, other_ends = other.intervals()
+        if len(starts) == 0 or len(other_starts) == 0:
+            return 0
+        cumulated = np.concatenate([[0], np.cumsum(other_ends - other_starts)])
+
+        def coverage(positions: np.ndarray) -> np.ndarray:
+            # Area of the other mask before every position: the intervals ending before, plus the one containing it.
+            index = np.searchsorted(other_ends, positions, side="right")
+            inside = index < len(other_starts)
+            partial = np.zeros_like(positions)
+            partial[inside] = np.maximum(positions[inside] - other_starts[index[inside]], 0)
+            return cumulated[index] + partial
+
+        return int((coverage(ends) - coverage(starts)).sum())
+
+    def iou(self, other: "RunLengthMask") -> float:
+        """
+        Computes the intersection over union with another mask.
+
+        :param other: The other mask, of the same shape.
+        :return: The IoU, zero if both masks are empty.
+        """
+        intersection = self.intersection(other)
+        union = self.area + other.area - intersection
+        return intersection / union if union > 0 else 0.0
+
+
+def _flat_masks(masks: List[RunLengthMask], size: Tuple[int, int]) -> np.ndarray:
+    # Every row holds a flattened mask, as floats for the matrix product.
+    width, height = size
+    flat = np.empty((len(masks), height * width), dtype=np.float32)
+    for row, mask in zip(flat, masks):
+        decoded = mask.decode() if mask.shape == (height, width) else mask.resize(size)
+        row[:] = decoded.ravel()
+    return flat
+
+
+def iou_matrix(
+        masks: List[RunLengthMask],
+        other_masks: List[RunLengthMask],
+        max_side: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Computes the intersection over union between every pair of masks at once, as a matrix product of the flattened
+    masks, downscaled with nearest neighbour sampling.
+
+    :param masks: Masks, of the same shape.
+    :param other_masks: Other masks, of the same shape.
+    :param max_side: Maximum size of the longest side of the downscaled masks, the IoU being exact without it.
+    :return: [N, M] IoU of every pair, zero if both masks are empty.
+    """
+    if not masks or not other_masks:
+        return np.zeros((len(masks), len(other_masks)), dtype=np.float32)
+    height, width = masks[0].shape
+    size = scaled_size(width, height, max_side=max_side)
+    flat = _flat_masks(masks, size)
+    other_flat = _flat_masks(other_masks, size)
+    intersection = flat @ other_flat.T
+    union = flat.sum(axis=1)[:, None] + other_flat.sum(axis=1)[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+class MaskWriter:
+    """
+    Mask archive writer.
+
+    The binary masks of every object of a video are run-length encoded into a single uncompressed NPZ file,
+    which :class:`MaskReader` memory-maps for random access by frame. Frames where an object is missing or
+    empty are not stored at all.
+
+    :param path: Path to the file.
+    :param size: Width and height of the masks.
+    :param overwrite: Whether to overwrite, in case of an existing file.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, Path],
+            size: Tuple[int, int],
+            overwrite: bool = False,
+    ):
+        self.path = Path(path)
+        self.width, self.height = size
+        self.num_frames = 0
+        self._writer = NPZWriter(path=self.path, overwrite=overwrite)
+        self.object_ids: Set[int] = set()
+        self._offset = 0
+
+    def add(self, frame: int, object_id: int, mask: np.ndarray):
+        """
+        Appends the mask of an object, the frames must be added in order.
+
+        :param frame: Frame number.
+        :param object_id: Identifier of the object.
+        :param mask: [H, W] binary mask.
+        :return:
+        """
+        if mask.shape != (self.height, self.width):
+            raise ValueError(f"Expected a mask of shape {(self.height, self.width)}, got {mask.shape}.")
+        self.add_runs(frame=frame, object_id=object_id, runs=encode_rle(mask))
+
+    def add_runs(self, frame: int, object_id: int, runs: np.ndarray):
+        """
+        Appends the run-length encoded mask of an object, see :func:`encode_rle`, the frames must be added in order.
+
+        :param frame: Frame number.
+        :param object_id: Identifier of the object.
+        :param runs: Lengths of the runs, starting with the background.
+        :return:
+        """
+        if runs.sum() != self.width * self.height:
+            raise ValueError(f"Expected runs covering {self.width * self.height} pixels, got {runs.sum()}.")
+        if frame + 1 < self.num_frames:
+            raise ValueError(f"Frame {frame} added after frame {self.num_frames - 1}.")
+        self.num_frames = frame + 1
+        if not runs[1::2].any():
+            return
+        runs = runs.astype(np.uint32, copy=False)
+        self._writer.append(key="entries", value=np.array([[frame, object_id]], dtype=np.int64))
+        self._writer.append(key="offsets", value=np.array([self._offset], dtype=np.int64))
+        self._writer.append(key="runs", value=runs)
+        self._offset += len(runs)
+        self.object_ids.add(object_id)
+
+    def advance(self, num_frames: int):
+        """
+        Extends the archive up to a number of frames, e.g. trailing frames without any mask.
+
+        :param num_frames: Number of frames of the video.
+        :return:
+        """
+        self.num_frames = max(self.num_frames, num_frames)
+
+    def close(self):
+        """
+        Writes the archive.
+
+        :return:
+        """
+        if self._writer is None:
+            return
+        self._writer.append(key="entries", value=np.empty((0, 2), dtype=np.int64))
+        self._writer.append(key="offsets", value=np.array([self._offset], dtype=np.int64))
+        self._writer.append(key="runs", value=np.empty(0, dtype=np.uint32))
+        self._writer.set(key="version", value=MASK_VERSION)
+        self._writer.set(key="size", value=np.array([self.width, self.height], dtype=np.int64))
+        self._writer.set(key="num_frames", value=self.num_frames)
+        self._writer.set(key="object_ids", value=np.array(sorted(self.object_ids), dtype=np.int64))
+        self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        self._writer.__exit__(exc_type, exc_val, exc_tb)
+        self._writer = None
+
+
+class MaskReader:
+    """
+    Mask archive reader, see :class:`MaskWriter`.
+
+    :param path: Path to the file.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._reader = NPZReader(path=self.path)
+        if int(self._reader["version"]) != MASK_VERSION:
+            raise ValueError(f"Unsupported mask archive version: {int(self._reader['version'])}")
+        self.width, self.height = (int(value) for value in self._reader["size"])
+        self.num_frames = int(self._reader["num_frames"])
+        self.object_ids: List[int] = [int(value) for value in self._reader["object_ids"]]
+        self._entries = np.asarray(self._reader["entries"])
+        self._offsets = self._reader["offsets"]
+        self._runs = self._reader["runs"]
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def masks(self, frame: int) -> Dict[int, np.ndarray]:
+        """
+        Decodes the masks of the objects present in a frame.
+
+        :param frame: Frame number.
+        :return: [H, W] binary mask of every object present in the frame.
+        """
+        start, end = np.searchsorted(self._entries[:, 0], [frame, frame + 1])
+        return {
+            int(self._entries[entry, 1]): decode_rle(
+                self._runs[self._offsets[entry]:self._offsets[entry + 1]],
+                shape=(self.height, self.width),
+            )
+            for entry in range(start, end)
+        }
+
+    def mask(self, frame: int, object_id: int) -> np.ndarray:
+        """
+        Decodes the mask of an object in a frame.
+
+        :param frame: Frame number.
+        :param object_id: Identifier of the object.
+        :return: [H, W] binary mask, empty if the object is missing.
+        """
+        start, end = np.searchsorted(self._entries[:, 0], [frame, frame + 1])
+        for entry in range(start, end):
+            if self._entries[entry, 1] == object_id:
+                return decode_rle(
+                    self._runs[self._offsets[entry]:self._offsets[entry + 1]],
+                    shape=(self.height, self.width),
+                )
+        return np.zeros((self.height, self.width), dtype=bool)
+
+    def labels(self, frame: int) -> np.ndarray:
+        """
+        Decodes the label map of a frame, where each pixel holds the position of its object in ``object_ids``
+        plus one, or zero for the background. Overlapping objects are resolved in favour of the last one.
+
+        :param frame: Frame number.
+        :return: [H, W] label map.
+        """
+        labels = np.zeros((self.height, self.width), dtype=np.uint16)
+        for object_id, mask in self.masks(frame).items():
+            labels[mask] = self.object_ids.index(object_id) + 1
+        return labels
+
+    def entries(self) -> Iterator[Tuple[int, int, np.ndarray]]:
+        """
+        Iterates over the stored masks, in order, without decoding them.
+
+        :return: Iterator over the frame numbers, the object identifiers and the run lengths.
+        """
+        for entry, (frame, object_id) in enumerate(self._entries):
+            yield int(frame), int(object_id), self._runs[self._offsets[entry]:self._offsets[entry + 1]]
+
+    def sparse_track(self, object_id: int, start_frame: int = 0) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Iterates over the masks of an object, only on the frames where it is present.
+
+        :param object_id: Identifier of the object.
+        :param start_frame: Index of the first frame.
+        :return: Iterator over the frame numbers and the [H, W] binary masks.
+        """
+        selected = (self._entries[:, 1] == object_id) & (self._entries[:, 0] >= start_frame)
+        for entry in np.flatnonzero(selected):
+            yield int(self._entries[entry, 0]), decode_rle(
+                self._runs[self._offsets[entry]:self._offsets[entry + 1]],
+                shape=(self.height, self.width),
+            )
+
+    def track(self, object_id: int, start_frame: int = 0) -> Iterator[np.ndarray]:
+        """
+        Iterates over the masks of an object, frame by frame.
+
+        :param object_id: Identifier of the object.
+        :param start_frame: Index of the first frame.
+        :return: Iterator over the [H, W] binary masks, empty where the object is missing.
+        """
+        for frame in range(start_frame, self.num_frames):
+            yield self.mask(frame, object_id)
+
+    def close(self):
+        """
+        Releases the memory-mapped arrays.
+
+        :return:
+        """
+        self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def track_index_path(path: Union[str, Path]) -> Path:
+    """
+    Gives the path to the index of a mask video, see :class:`MaskTrackWriter`.
+
+    :param path: Path to the ``.mp4`` mask video.
+    :return: Path to the ``.json`` index next to it.
+    """
+    return Path(path).with_suffix(".json")
+
+
+def read_track_index(path: Union[str, Path]) -> Optional[Dict]:
+    """
+    Reads the index of a mask video, see :class:`MaskTrackWriter`.
+
+    :param path: Path to the ``.mp4`` mask video.
+    :return: The index, ``None`` for the mask videos holding a mask on every frame.
+    """
+    index_path = track_index_path(path)
+    if not index_path.exists():
+        return None
+    index = json.loads(index_path.read_bytes())
+    if index["version"] != MASK_VERSION:
+        raise ValueError(f"Unsupported mask index version: {index['version']}")
+    return index
+
+
+class MaskTrackWriter:
+    """
+    Mask video writer, for the masks of a single object.
+
+    Only the frames where the object is present are encoded, the spans of frames they cover being stored in a
+    ``.json`` index next to the video, so that the objects appearing late or briefly cost next to nothing.
+    :func:`read_sparse_track` reads them back along with their frame numbers, and :func:`read_track` as a mask
+    on every frame.
+
+    :param path: Path to the ``.mp4`` video.
+    :param size: Width and height of the masks.
+    :param frame_rate: Frame rate of the original video.
+    :param overwrite: Whether to overwrite, in case of an existing file.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, Path],
+            size: Tuple[int, int],
+            frame_rate,
+            overwrite: bool = False,
+    ):
+        self.path = Path(path)
+        self.width, self.height = size
+        self.frame_rate = frame_rate
+        self.overwrite = overwrite
+        if track_index_path(self.path).exists() and not overwrite:
+            raise FileExistsError(f"File {track_index_path(self.path)} already exists.")
+        self.num_frames = 0
+        self.spans: List[List[int]] = []
+        self._writer: Optional[VideoWriter] = None
+        self._image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+    def add(self, frame: int, mask: np.ndarray):
+        """
+        Appends the mask of the object, the frames must be added in order.
+
+        :param frame: Frame number.
+        :param mask: [H, W] binary mask.
+        :return:
+        """
+        if mask.shape != (self.height, self.width):
+            raise ValueError(f"Expected a mask of shape {(self.height, self.width)}, got {mask.shape}.")
+        if frame < self.num_frames:
+            raise ValueError(f"Frame {frame} added after frame {self.num_frames - 1}.")
+        self.num_frames = frame + 1
+        if not mask.any():
+            return
+        if self._writer is None:
+            # Opened on the first mask, the objects which are never present have no video.
+            self._writer = VideoWriter(
+                path=self.path,
+                input_dict={"-r": self.frame_rate},
+                output_dict={"-c:v": "libx264", "-crf": "0", "-pix_fmt": "yuv420p"},
+                overwrite=self.overwrite,
+            )
+        np.multiply(mask[..., None], np.uint8(255), out=self._image)
+        self._writer.write(image=self._image)
+        if self.spans and self.spans[-1][1] == frame:
+            self.spans[-1][1] += 1
+        else:
+            self.spans.append([frame, frame + 1])
+
+    def advance(self, num_frames: int):
+        """
+        Extends the track up to a number of frames, e.g. trailing frames without the object.
+
+        :param num_frames: Number of frames of the video.
+        :return:
+        """
+        self.num_frames = max(self.num_frames, num_frames)
+
+    def close(self):
+        """
+        Writes the video and its index.
+
+        :return:
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        write_track_index(self.path, spans=self.spans, size=(self.width, self.height), num_frames=self.num_frames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_track_index(
+        path: Union[str, Path],
+        spans: List[List[int]],
+        size: Tuple[int, int],
+        num_frames: int,
+):
+    """
+    Writes the index of a mask video, see :class:`MaskTrackWriter`.
+
+    :param path: Path to the ``.mp4`` mask video.
+    :param spans: Starts and ends, excluded, of the spans of frames encoded in the video, in order.
+    :param size: Width and height of the masks.
+    :param num_frames: Number of frames of the original video.
+    :return:
+    """
+    index = {"version": MASK_VERSION, "size": list(size), "num_frames": num_frames, "spans": spans}
+    track_index_path(path).write_bytes(json.dumps(index))
+
+
+def concat_tracks(
+        paths: List[Union[str, Path]],
+        path: Union[str, Path],
+        num_frames: Optional[int] = None,
+        overwrite: bool = False,
+):
+    """
+    Concatenates the mask videos of an object over consecutive ranges of frames, e.g. the segments of an
+    interrupted computation, along with their indices.
+
+    :param paths: Paths to the ``.mp4`` mask videos, in order.
+    :param path: Path to the concatenated mask video.
+    :param num_frames: Number of frames of the original video, by default that of the last mask video.
+    :param overwrite: Whether to overwrite, in case of an existing file.
+    :return:
+    """
+    if not paths:
+        raise ValueError("Expected at least one mask video to concatenate.")
+    if Path(path).exists() and not overwrite:
+        raise FileExistsError(path)
+    indices = [read_track_index(segment_path) for segment_path in paths]
+    missing = [str(segment_path) for segment_path, index in zip(paths, indices) if index is None]
+    if missing:
+        raise ValueError(f"Mask videos without index, only indexed mask videos can be concatenated: {missing}")
+    spans: List[List[int]] = []
+    for index in indices:
+        for start, end in index["spans"]:
+            if spans and spans[-1][1] == start:
+                spans[-1][1] = end
+            else:
+                spans.append([start, end])
+    # The index is written first, an interrupted concatenation being detected from the segments left.
+    num_frames = index["num_frames"] if num_frames is None else num_frames
+    write_track_index(path, spans=spans, size=index["size"], num_frames=num_frames)
+    if len(paths) == 1:
+        shutil.copyfile(paths[0], path)
+    else:
+        concat_videos(paths, path, overwrite=overwrite)
+
+
+def mask_tracks(paths: List[Union[str, Path]]) -> List[Tuple[str, Path, Optional[int]]]:
+    """
+    Lists the objects of mask videos, directories of mask videos, and mask archives.
+
+    :param paths: Paths to ``.mp4`` mask videos, directories of mask videos, or ``.npz`` mask archives.
+    :return: Name, path and, for the mask archives, identifier of every object.
+    """
+    tracks = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            # The indices of the mask videos are listed with them, and the hidden entries, e.g. the checkpoint of
+            # an inference in progress, are skipped.
+            files = [
+                file for file in sorted(path.iterdir())
+                if not file.name.startswith(".")
+                and not (file.suffix == ".json" and file.with_suffix(".mp4").is_file())
+            ]
+            invalid = [str(file) for file in files if not (file.is_file() and file.suffix in MASK_SUFFIXES)]
+            if invalid:
+                raise ValueError(f"Directory {path} contains files which are not masks: {invalid}")
+            tracks.extend(mask_tracks(files))
+        elif path.is_file() and path.suffix == ".mp4":
+            tracks.append((path.stem, path, None))
+        elif path.is_file() and path.suffix == ".npz":
+            with MaskReader(path) as reader:
+                tracks.extend((str(object_id), path, object_id) for object_id in reader.object_ids)
+        else:
+            raise FileNotFoundError(f"{path} is not a directory, a .mp4 mask or a .npz mask archive")
+    return tracks
+
+
+def _read_video_masks(
+        path: Path,
+        start_frame: int = 0,
+        max_side: Optional[int] = None,
+        prefetch: int = 0,
+) -> Iterator[np.ndarray]:
+    # Decoded as single-channel frames, thresholded into the same buffer. ffmpeg converts them to grayscale while
+    # decoding, the other backends only after decoding the full frames.
+    with VideoReader(
+            path=path,
+            start_frame=start_frame,
+            max_side=max_side,
+            prefetch=prefetch,
+            buffers=1,
+            gray=True,
+            backend="ffmpeg" if shutil.which("ffmpeg") is not None else None,
+    ) as reader:
+        mask = np.empty((reader.outputheight, reader.outputwidth), dtype=bool)
+        for frame in reader:
+            yield np.greater(frame, 127, out=mask)
+
+
+def _resize_mask(mask: np.ndarray, max_side: Optional[int] = None) -> np.ndarray:
+    height, width = mask.shape
+    if max_side is None or max(width, height) <= max_side:
+        return mask
+    return cv2.resize(
+        mask.view(np.uint8),
+        scaled_size(width, height, max_side=max_side),
+        interpolation=cv2.INTER_NEAREST,
+    ).view(bool)
+
+
+def read_sparse_track(
+        path: Union[str, Path],
+        object_id: Optional[int] = None,
+        start_frame: int = 0,
+        max_side: Optional[int] = None,
+        prefetch: int = 0,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Iterates over the binary masks of an object, from a mask video or a mask archive, only on the frames where
+    it is stored, see :class:`MaskTrackWriter`. The mask videos without index hold a mask on every frame.
+
+    :param path: Path to the ``.mp4`` mask video or the ``.npz`` mask archive.
+    :param object_id: Identifier of the object in the mask archive.
+    :param start_frame: Index of the first frame.
+    :param max_side: Maximum size of the longest side of the masks, as for the frames in :class:`VideoReader`.
+    :param prefetch: Number of mask frames decoded ahead, for the mask videos.
+    :return: Iterator over the frame numbers and the [H, W] binary masks, for the mask videos the same buffer is
+        refilled with every mask.
+    """
+    path = Path(path)
+    if path.suffix == ".npz":
+        with MaskReader(path) as reader:
+            for frame, mask in reader.sparse_track(object_id, start_frame=start_frame):
+                yield frame, _resize_mask(mask, max_side=max_side)
+        return
+
+    index = read_track_index(path)
+    if index is None:
+        masks = _read_video_masks(path, start_frame=start_frame, max_side=max_side, prefetch=prefetch)
+        yield from enumerate(masks, start=start_frame)
+        return
+    spans = index["spans"]
+    # Position in the video of the first frame to read.
+    position = sum(max(min(end, start_frame) - start, 0) for start, end in spans)
+    frames = (frame for start, end in spans for frame in range(max(start, start_frame), end))
+    yield from zip(frames, _read_video_masks(path, start_frame=position, max_side=max_side, prefetch=prefetch))
+
+
+def read_track(
+        path: Union[str, Path],
+        object_id: Optional[int] = None,
+        start_frame: int = 0,
+        max_side: Optional[int] = None,
+        prefetch: int = 0,
+) -> Iterator[np.ndarray]:
+    """
+    Iterates over the binary masks of an object, from a mask video or a mask archive, on every frame.
+
+    :param path: Path to the ``.mp4`` mask video or the ``.npz`` mask archive.
+    :param object_id: Identifier of the object in the mask archive.
+    :param start_frame: Index of the first frame.
+    :param max_side: Maximum size of the longest side of the masks, as for the frames in :class:`VideoReader`.
+    :param prefetch: Number of mask frames decoded ahead, for the mask videos.
+    :return: Iterator over the [H, W] binary masks, empty where the object is missing, for the mask videos the same
+        buffer is refilled with every mask.
+    """
+    path = Path(path)
+    if path.suffix == ".npz":
+        with MaskReader(path) as reader:
+            for mask in reader.track(object_id, start_frame=start_frame):
+                yield _resize_mask(mask, max_side=max_side)
+        return
+
+    index = read_track_index(path)
+    if index is None:
+        yield from _read_video_masks(path, start_frame=start_frame, max_side=max_side, prefetch=prefetch)
+        return
+    # The frames missing from the sparse track are filled with an empty mask.
+    width, height = scaled_size(*index["size"], max_side=max_side)
+    empty = np.zeros((height, width), dtype=bool)
+    next_frame = start_frame
+    for frame, mask in read_sparse_track(path, start_frame=start_frame, max_side=max_side, prefetch=prefetch):
+        for _ in range(next_frame, frame):
+            yield empty
+        yield mask
+        next_frame = frame + 1
+    for _ in range(next_frame, index["num_frames"]):
+        yield empty
@@ -0,0 +1,378 @@
+"""NPZ I/O module."""
+
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import json
+import shutil
+import struct
+import tempfile
+import zipfile
+from collections.abc import Mapping
+from pathlib import Path
+from tqdm import tqdm
+
+import numpy as np
+
+# Size of the fixed part of a ZIP local file header, followed by the file name and extra field.
+LOCAL_HEADER_SIZE = 30
+FRAMES_KEY = "frames"
+EDGES_KEY = "edges"
+
+
+class NPZReader:
+    """
+    Safe NPZ reader.
+
+    Arrays stored without compression, as written by :class:`NPZWriter`, are memory-mapped,
+    so that loading them is zero-copy and only the accessed rows are actually read from disk.
+
+    Archives holding a ``frames`` array are frame-indexed: every other array with the same
+    first dimension holds one row per frame, see :meth:`frames`.
+
+    :param path: Path to the file.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        path = Path(path)
+        NPZReader.check(path=path)
+
+        self.path = path
+        self.arrays: Dict[str, np.ndarray] = {}
+        with zipfile.ZipFile(path, mode="r") as archive, path.open(mode="rb") as file:
+            for info in archive.infolist():
+                if not info.filename.endswith(".npy"):
+                    continue
+                key = info.filename[: -len(".npy")]
+                self.arrays[key] = NPZReader._load_array(archive, info, file, path)
+
+    @staticmethod
+    def check(path: Union[str, Path]):
+        """
+        Checks that a file has the correct extension and exists.
+
+        :param path: Path to the file.
+        :return:
+        """
+        path = Path(path)
+        if path.suffix != ".npz":
+            raise NameError(f"Path {path} does not have a .npz extension.")
+        if not path.exists():
+            raise FileNotFoundError(f"File missing at path {path}")
+
+    @staticmethod
+    def _load_array(archive: zipfile.ZipFile, info: zipfile.ZipInfo, file, path: Path) -> np.ndarray:
+        if info.compress_type != zipfile.ZIP_STORED:
+            with archive.open(info) as member:
+                return np.lib.format.read_array(member)
+
+        file.seek(info.header_offset)
+        header = file.read(LOCAL_HEADER_SIZE)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        file.seek(info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length)
+
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+
+        if dtype.hasobject or 0 in shape or not shape:
+            with archive.open(info) as member:
+                return np.lib.format.read_array(member)
+
+        return np.memmap(
+            path,
+            dtype=dtype,
+            mode="r",
+            shape=shape,
+            order="F" if fortran_order else "C",
+            offset=file.tell(),
+        )
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.arrays[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.arrays
+
+    def keys(self) -> List[str]:
+        return list(self.arrays.keys())
+
+    @property
+    def edges(self) -> Optional[Dict[str, Any]]:
+        """
+        Edges metadata stored along the arrays, if any.
+
+        :return: Deserialized edges.
+        """
+        if EDGES_KEY not in self.arrays:
+            return None
+        return json.loads(str(self.arrays[EDGES_KEY]))
+
+    def frames(self) -> "NPZFrames":
+        """
+        Returns a lazy mapping from frame number to the rows of every per-frame array.
+
+        :return: Lazy mapping.
+        """
+        return NPZFrames(reader=self)
+
+    def close(self):
+        """
+        Releases the memory-mapped arrays.
+
+        :return:
+        """
+        self.arrays = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def read(
+        path: Union[str, Path],
+        verbose: Union[bool, int] = True,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Loads the arrays of an NPZ file, memory-mapped whenever possible.
+
+        :param path: Path to the file.
+        :param verbose: Verbosity of the method.
+        :return: Arrays.
+        """
+        return NPZReader(path=path).arrays
+
+
+class NPZFrames(Mapping):
+    """
+    Lazy mapping from frame number to the rows of every per-frame array of an NPZ file.
+
+    :param reader: The NPZ reader.
+    """
+
+    def __init__(self, reader: NPZReader):
+        self.reader = reader
+        frames = reader.arrays.get(FRAMES_KEY, np.empty(0, dtype=np.int64))
+        self.keys_ = [
+            key
+            for key, array in reader.arrays.items()
+            if key != FRAMES_KEY and array.ndim > 0 and array.shape[0] == frames.shape[0]
+        ]
+        self.rows = {int(frame): row for row, frame in enumerate(frames)}
+
+    def __getitem__(self, frame: int) -> Dict[str, np.ndarray]:
+        row = self.rows[frame]
+        return {key: self.reader[key][row] for key in self.keys_}
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def close(self):
+        """
+        Closes the underlying reader.
+
+        :return:
+        """
+        self.reader.close()
+
+
+def _pad(rows: np.ndarray, shape: tuple) -> np.ndarray:
+    if rows.shape[1:] == shape:
+        return rows
+    padding = [(0, 0)] + [(0, b - a) for a, b in zip(rows.shape[1:], shape)]
+    return np.pad(rows, padding)
+
+
+class NPZWriter:
+    """
+    Safe NPZ writer.
+
+    The arrays are stored without compression so that they can be memory-mapped by :class:`NPZReader`,
+    while remaining a regular NPZ file readable with ``numpy.load``.
+
+    Besides the one-shot :meth:`write`, it can be used as a context manager to append rows to the
+    arrays as they are produced; they are spooled to disk, so the memory footprint stays flat::
+
+        with NPZWriter(path=path, overwrite=True) as writer:
+            writer.set(key="edges", value=edges)
+            for frame, values in items:
+                writer.add_frame(frame=frame, values=values)
+
+    :param path: Path to the file.
+    :param overwrite: Whether to overwrite, in case of an existing file.
+    :param pad: Whether to zero-pad rows of different sizes to the largest one, instead of raising an error,
+        e.g. for legacy archives where missing parts were filled with fewer zeros.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        overwrite: bool = False,
+        pad: bool = False,
+    ):
+        path = Path(path)
+        NPZWriter.check(path=path, overwrite=overwrite)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and overwrite:
+            path.unlink()
+
+        self.path = path
+        self.pad = pad
+        self._tmp_dir = Path(tempfile.mkdtemp(prefix=f".{path.name}.", dir=path.parent))
+        self._spools = {}
+        self._dtypes: Dict[str, np.dtype] = {}
+        self._shapes: Dict[str, tuple] = {}
+        self._lengths: Dict[str, int] = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def check(path: Union[str, Path], overwrite: bool = False):
+        """
+        Checks that a file has the correct extension and verifies that we can overwrite it if it exists.
+
+        :param path: Path to the file.
+        :param overwrite: Whether to overwrite, in case of an existing file.
+        :return:
+        """
+        path = Path(path)
+        if path.suffix != ".npz":
+            raise NameError(f"Path {path} does not have a .npz extension.")
+        if path.exists() and not overwrite:
+            raise FileExistsError(f"File {path} already exists.")
+
+    def append(self, key: str, value: np.ndarray):
+        """
+        Appends rows to an array, the dtype and trailing shape are set by the first call.
+
+        :param key: Name of the array.
+        :param value: [N, ...] rows.
+        :return:
+        """
+        value = np.asarray(value)
+        if key not in self._spools:
+            self._dtypes[key] = value.dtype
+            self._shapes[key] = value.shape[1:]
+            self._lengths[key] = 0
+            self._spools[key] = (self._tmp_dir / f"{len(self._spools)}.bin").open(mode="wb")
+        if value.shape[1:] != self._shapes[key]:
+            if not self.pad or value.ndim - 1 != len(self._shapes[key]):
+                raise ValueError(f"Expected rows of shape {self._shapes[key]} for {key}, got {value.shape[1:]}.")
+            shape = tuple(max(a, b) for a, b in zip(self._shapes[key], value.shape[1:]))
+            if shape != self._shapes[key]:
+                self._widen(key=key, shape=shape)
+            value = _pad(value, shape=shape)
+        value = np.ascontiguousarray(value, dtype=self._dtypes[key])
+        self._spools[key].write(value.tobytes())
+        self._lengths[key] += value.shape[0]
+
+    def _widen(self, key: str, shape: tuple):
+        spool = self._spools[key]
+        spool.close()
+        path = Path(spool.name)
+        rows = np.memmap(path, dtype=self._dtypes[key], mode="r", shape=(self._lengths[key],) + self._shapes[key])
+        widened_path = path.with_suffix(".tmp")
+        with widened_path.open(mode="wb") as file:
+            for start in range(0, rows.shape[0], 4096):
+                file.write(_pad(rows[start : start + 4096], shape=shape).tobytes())
+        del rows
+        widened_path.replace(path)
+        self._spools[key] = path.open(mode="ab")
+        self._shapes[key] = shape
+
+    def set(self, key: str, value: Any):
+        """
+        Stores a whole array, e.g. metadata. Dictionaries are stored as JSON strings.
+
+        :param key: Name of the array.
+        :param value: Array or JSON-serializable dictionary.
+        :return:
+        """
+        if isinstance(value, dict):
+            value = json.dumps(value)
+        self._arrays[key] = np.asarray(value)
+
+    def add_frame(self, frame: int, values: Dict[str, np.ndarray]):
+        """
+        Appends a frame to a frame-indexed archive.
+
+        :param frame: Frame number.
+        :param values: Per-frame arrays.
+        :return:
+        """
+        self.append(key=FRAMES_KEY, value=np.array([frame], dtype=np.int64))
+        for key, value in values.items():
+            self.append(key=key, value=np.asarray(value, dtype=np.float32)[np.newaxis])
+
+    def _finalize(self):
+        for spool in self._spools.values():
+            spool.close()
+
+    def close(self):
+        """
+        Assembles the arrays into the NPZ file.
+
+        :return:
+        """
+        if self._tmp_dir is None:
+            return
+        self._finalize()
+        try:
+            with zipfile.ZipFile(self.path, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+                for key, spool in self._spools.items():
+                    header = {
+                        "descr": np.lib.format.dtype_to_descr(self._dtypes[key]),
+                        "fortran_order": False,
+                        "shape": (self._lengths[key],) + self._shapes[key],
+                    }
+                    with archive.open(f"{key}.npy", mode="w", force_zip64=True) as member:
+                        np.lib.format.write_array_header_1_0(member, header)
+                        with Path(spool.name).open(mode="rb") as file:
+                            shutil.copyfileobj(file, member)
+                for key, value in self._arrays.items():
+                    with archive.open(f"{key}.npy", mode="w", force_zip64=True) as member:
+                        np.lib.format.write_array(member, value, allow_pickle=False)
+        finally:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        self._finalize()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        self._tmp_dir = None
+
+    @staticmethod
+    def write(
+        arrays: Dict[str, Any],
+        path: Union[str, Path],
+        overwrite: bool = False,
+        verbose: Union[bool, int] = True,
+    ):
+        """
+        Writes arrays into an uncompressed NPZ file.
+
+        :param arrays: Arrays, or JSON-serializable dictionaries.
+        :param path: Path to the file.
+        :param overwrite: Whether to overwrite, in case of an existing file.
+        :param verbose: Verbosity of the method.
+        :return:
+        """
+        with NPZWriter(path=path, overwrite=overwrite) as writer:
+            for key, value in tqdm(
+                arrays.items(),
+                desc="Writing",
+                disable=not verbose,
+            ):
+                writer.set(key=key, value=value)
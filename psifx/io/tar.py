@@ -1,17 +1,387 @@
 """TAR I/O module."""
 
-from typing import Any, Dict, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-import tarfile
+import bisect
+import bz2
+import collections
+import gzip
 import io
+import json
+import lzma
+import os
+import shutil
+import tarfile
+import zlib
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 
+from psifx.utils.cache import cache_enabled, cache_file, evict
+
+# Compressed archives are written as a sequence of independently compressed blocks of that size,
+# so that reading a single member never requires decompressing the archive from the start.
+BLOCK_SIZE = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+INDEX_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+MAGIC_NUMBERS = {
+    "gz": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zst": b"\x28\xb5\x2f\xfd",
+}
+DEFAULT_LEVELS = {
+    "gz": 9,
+    "bz2": 9,
+    "xz": 6,
+    "zst": 3,
+}
+
+
+def import_zstandard():
+    """
+    Imports the ``zstandard`` package, only required for ``.tar.zst`` archives.
+
+    :return: The ``zstandard`` module.
+    """
+    try:
+        import zstandard
+    except ImportError as error:
+        raise ImportError("Reading or writing .tar.zst archives requires the zstandard package.") from error
+    return zstandard
+
+
+def get_compression(path: Union[str, Path]) -> str:
+    """
+    Infers the compression of a TAR archive from its extension, e.g. ``.tar.gz`` gives ``gz``.
+
+    :param path: Path to the file.
+    :return: Compression name, empty if uncompressed.
+    """
+    path = Path(path)
+    index = path.suffixes.index(".tar")
+    if index == len(path.suffixes) - 1:
+        return ""
+    return path.suffixes[index + 1].replace(".", "")
+
+
+def compress_block(data: bytes, compression: str, level: Optional[int] = None) -> bytes:
+    """
+    Compresses a block into a standalone stream, which can be concatenated to the other blocks.
+
+    :param data: Uncompressed block.
+    :param compression: Compression name.
+    :param level: Compression level, defaults to the usual level of the compression.
+    :return: Compressed block.
+    """
+    if level is None:
+        level = DEFAULT_LEVELS.get(compression)
+    if compression == "gz":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if compression == "bz2":
+        return bz2.compress(data, compresslevel=level)
+    if compression == "xz":
+        return lzma.compress(data, preset=level)
+    if compression == "zst":
+        return import_zstandard().ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def new_decompressor(compression: str):
+    """
+    Instantiates a decompressor for a single compressed block.
+
+    :param compression: Compression name.
+    :return: Decompressor object, with ``decompress()``, ``eof`` and ``unused_data``.
+    """
+    if compression == "gz":
+        return zlib.decompressobj(wbits=31)
+    if compression == "bz2":
+        return bz2.BZ2Decompressor()
+    if compression == "xz":
+        return lzma.LZMADecompressor()
+    if compression == "zst":
+        return import_zstandard().ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def index_path(path: Union[str, Path]) -> Path:
+    """
+    Returns the location of the cached index of a TAR archive.
+
+    :param path: Path to the file.
+    :return: Path to the index.
+    """
+    return cache_file(path=path, namespace="tar")
+
+
+def save_index(path: Union[str, Path], index: Dict[str, Any]):
+    """
+    Caches the index of a TAR archive, unless the persistent caches are disabled.
+
+    :param path: Path to the archive.
+    :param index: Index of the archive.
+    :return:
+    """
+    if not cache_enabled():
+        return
+    cache_path = index_path(path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    with tmp_path.open(mode="w") as file:
+        json.dump(index, file)
+    tmp_path.replace(cache_path)
+    evict(namespace="tar")
+
+
+def is_sharded(path: Union[str, Path]) -> bool:
+    """
+    Checks whether a path is a sharded TAR archive, i.e. a directory holding a manifest and the shards.
+
+    :param path: Path to the archive.
+    :return: Whether the archive is sharded.
+    """
+    return (Path(path) / MANIFEST_NAME).is_file()
+
+
+def load_manifest(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Loads the manifest of a sharded TAR archive.
+
+    :param path: Path to the archive.
+    :return: Manifest, listing the shards and whether the archive is complete.
+    """
+    with (Path(path) / MANIFEST_NAME).open(mode="r") as file:
+        return json.load(file)
+
+
+def frame_number(key: str) -> Optional[int]:
+    """
+    Parses the frame number of a file named after it, e.g. ``000000000000042.json`` gives ``42``.
+
+    :param key: Name of the file.
+    :return: Frame number, ``None`` if the file is not named after a frame.
+    """
+    try:
+        return int(Path(key).stem)
+    except ValueError:
+        return None
+
+
+def read_shard(
+    path: Union[str, Path],
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    decoder: Optional[Callable[[bytes], Any]] = None,
+) -> List[Tuple[int, Any]]:
+    """
+    Reads the frames within a range from a single shard, in a worker thread or process.
 
-class TarReader:
+    :param path: Path to the shard.
+    :param start: First frame number, included.
+    :param end: Last frame number, excluded.
+    :param decoder: Function decoding the content of a file, e.g. ``json.loads``.
+    :return: Frame numbers and decoded contents.
     """
-    Safe TAR reader
+    with TarReader(path, verbose=False) as reader:
+        return list(reader.iter_frames(start=start, end=end, decoder=decoder))
+
+
+class BlockWriter:
     """
+    File-like object compressing its input as a sequence of independent blocks.
+
+    The concatenation of the blocks is a regular compressed stream, but each block can also be
+    decompressed on its own, starting from its offset in the file. Since the blocks are independent,
+    they can be compressed by several threads at once, the compressors releasing the GIL.
+
+    :param file: Binary file object to write into.
+    :param compression: Compression name.
+    :param block_size: Size of the uncompressed blocks.
+    :param level: Compression level, defaults to the usual level of the compression.
+    :param threads: Number of compression threads.
+    """
+
+    def __init__(
+        self,
+        file,
+        compression: str,
+        block_size: int = BLOCK_SIZE,
+        level: Optional[int] = None,
+        threads: int = 1,
+    ):
+        self.file = file
+        self.compression = compression
+        self.block_size = block_size
+        self.level = level
+        self.threads = threads
+        self.blocks: List[Tuple[int, int]] = []
+        self._buffer = bytearray()
+        self._offset = 0
+        self._compressed_offset = 0
+        self._executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self._pending = collections.deque()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._flush_block(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset + len(self._buffer)
+
+    def _flush_block(self, data: bytes):
+        if self._executor is None:
+            self._write_block(compress_block(data, self.compression, self.level), self._offset)
+        else:
+            future = self._executor.submit(compress_block, data, self.compression, self.level)
+            self._pending.append((future, self._offset))
+            # Bound the number of blocks in flight, the blocks are written in order.
+            while len(self._pending) > 2 * self.threads:
+                self._write_pending()
+        self._offset += len(data)
+
+    def _write_pending(self):
+        future, offset = self._pending.popleft()
+        self._write_block(future.result(), offset)
+
+    def _write_block(self, compressed: bytes, offset: int):
+        self.blocks.append((self._compressed_offset, offset))
+        self.file.write(compressed)
+        self._compressed_offset += len(compressed)
+
+    def close(self):
+        if self._buffer:
+            self._flush_block(bytes(self._buffer))
+            self._buffer.clear()
+        if self._executor is not None:
+            while self._pending:
+                self._write_pending()
+            self._executor.shutdown()
+            self._executor = None
+
+
+class DecompressedStream:
+    """
+    Read-only file-like object decompressing a sequence of compressed blocks, starting from a given block.
+
+    It records where every block starts, both in the compressed and the uncompressed stream.
+
+    :param file: Binary file object to read from.
+    :param compression: Compression name.
+    :param compressed_offset: Offset of the first block in the file.
+    :param offset: Offset of the first block in the uncompressed stream.
+    """
+
+    def __init__(
+        self,
+        file,
+        compression: str,
+        compressed_offset: int = 0,
+        offset: int = 0,
+    ):
+        self.file = file
+        self.compression = compression
+        self.position = offset
+        self.blocks: List[Tuple[int, int]] = []
+        self._magic_number = MAGIC_NUMBERS[compression]
+        self._compressed_offset = compressed_offset
+        self._decoded = offset
+        self._decompressor = None
+        self._pending = b""
+        self._buffer = bytearray()
+        self.file.seek(compressed_offset)
+
+    def _fill(self) -> bool:
+        if len(self._pending) < len(self._magic_number):
+            self._pending += self.file.read(CHUNK_SIZE)
+            if not self._pending:
+                return False
+
+        if self._decompressor is None:
+            # Anything but a new block, e.g. zero padding, marks the end of the stream.
+            if not self._pending.startswith(self._magic_number):
+                return False
+            self._decompressor = new_decompressor(self.compression)
+            self.blocks.append((self._compressed_offset, self._decoded))
+
+        data = self._decompressor.decompress(self._pending)
+        unused = b""
+        if self._decompressor.eof:
+            unused = self._decompressor.unused_data
+            self._decompressor = None
+        self._compressed_offset += len(self._pending) - len(unused)
+        self._pending = unused
+
+        self._buffer += data
+        self._decoded += len(data)
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self._buffer) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.position += len(data)
+        return data
+
+    def skip(self, size: int):
+        while size > 0:
+            data = self.read(min(size, CHUNK_SIZE))
+            if not data:
+                break
+            size -= len(data)
+
+
+class TarReader(Mapping):
+    """
+    Safe TAR reader.
+
+    Besides the one-shot :meth:`read`, it gives lazy random access to the files of the archive, using
+    an index from file name to offset. The index is built on the first opening, then cached on disk.
+    Compressed archives written by :class:`TarWriter` are made of independent blocks, so reading a file
+    only decompresses the block it belongs to; other compressed archives are decompressed sequentially.
+    Opening a sharded archive returns a :class:`ShardedTarReader`.
+
+    :param path: Path to the file.
+    :param verbose: Verbosity of the method.
+    """
+
+    def __new__(cls, path: Union[str, Path], *args, **kwargs):
+        if cls is TarReader and is_sharded(path):
+            cls = ShardedTarReader
+        return super().__new__(cls)
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        verbose: Union[bool, int] = True,
+    ):
+        path = Path(path)
+        TarReader.check(path=path)
+
+        self.path = path
+        self.verbose = verbose
+        self.compression = get_compression(path)
+        self._file = None
+        self._stream: Optional[DecompressedStream] = None
+
+        index = self._load_index()
+        self.names: List[str] = index["names"]
+        self.offsets: List[int] = index["offsets"]
+        self.sizes: List[int] = index["sizes"]
+        self.blocks: List[Tuple[int, int]] = [tuple(block) for block in index["blocks"]]
+        self._block_offsets = [offset for _, offset in self.blocks]
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._frame_index = None
 
     @staticmethod
     def check(path: Union[str, Path]):
@@ -27,6 +397,163 @@ class TarReader:
         if not path.exists():
             raise FileNotFoundError(f"File missing at path {path}")
 
+    def _load_index(self) -> Dict[str, Any]:
+        if cache_enabled():
+            try:
+                cache_path = index_path(self.path)
+                with cache_path.open(mode="r") as file:
+                    index = json.load(file)
+                if index.get("version") == INDEX_VERSION:
+                    # Marked as recently used, to be evicted last.
+                    cache_path.touch()
+                    return index
+            except (OSError, ValueError):
+                pass
+
+        index = self._build_index()
+        try:
+            save_index(path=self.path, index=index)
+        except OSError:
+            pass
+        return index
+
+    def _build_index(self) -> Dict[str, Any]:
+        names, offsets, sizes = [], [], []
+        with self.path.open(mode="rb") as file:
+            if self.compression:
+                fileobj = DecompressedStream(file, compression=self.compression)
+                mode = "r|"
+            else:
+                fileobj = file
+                mode = "r:"
+            with tarfile.open(fileobj=fileobj, mode=mode) as archive:
+                for tarinfo in tqdm(
+                    archive,
+                    desc="Indexing",
+                    disable=not self.verbose,
+                ):
+                    if tarinfo.isfile():
+                        names.append(tarinfo.name.split("/")[-1])
+                        offsets.append(tarinfo.offset_data)
+                        sizes.append(tarinfo.size)
+                    archive.members.clear()
+            blocks = fileobj.blocks if self.compression else []
+        return {
+            "version": INDEX_VERSION,
+            "names": names,
+            "offsets": offsets,
+            "sizes": sizes,
+            "blocks": blocks,
+        }
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._file is None:
+            self._file = self.path.open(mode="rb")
+
+        if not self.compression:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+        index = max(bisect.bisect_right(self._block_offsets, offset) - 1, 0)
+        compressed_offset, block_offset = self.blocks[index] if self.blocks else (0, 0)
+        # Keep decompressing from the current position when it is on the way, e.g. sequential access.
+        stream = self._stream
+        if stream is None or not block_offset <= stream.position <= offset:
+            stream = DecompressedStream(
+                self._file,
+                compression=self.compression,
+                compressed_offset=compressed_offset,
+                offset=block_offset,
+            )
+            self._stream = stream
+        stream.skip(offset - stream.position)
+        return stream.read(size)
+
+    def __getitem__(self, key: str) -> bytes:
+        i = self._positions[key]
+        return self._read(self.offsets[i], self.sizes[i])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def read_many(self, keys: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """
+        Reads several files, in the order in which they are stored.
+
+        :param keys: Names of the files.
+        :return: Iterator over the names and contents.
+        """
+        keys = sorted(keys, key=lambda key: self.offsets[self._positions[key]])
+        for key in keys:
+            yield key, self[key]
+
+    @property
+    def frame_index(self) -> Dict[int, str]:
+        """
+        Index from frame number to file name, for the files named after a frame number, e.g. ``000000000000042.json``.
+
+        :return: Sorted frame index.
+        """
+        if self._frame_index is None:
+            frame_index = {}
+            for name in self._positions:
+                frame = frame_number(name)
+                if frame is not None:
+                    frame_index[frame] = name
+            self._frame_index = dict(sorted(frame_index.items()))
+        return self._frame_index
+
+    def iter_frames(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        decoder: Optional[Callable[[bytes], Any]] = None,
+    ) -> Iterator[Tuple[int, Any]]:
+        """
+        Reads the frames within a range.
+
+        :param start: First frame number, included.
+        :param end: Last frame number, excluded.
+        :param decoder: Function decoding the content of a file, e.g. ``json.loads``.
+        :return: Iterator over the frame numbers and decoded contents.
+        """
+        frames = {
+            name: frame
+            for frame, name in self.frame_index.items()
+            if (start is None or frame >= start) and (end is None or frame < end)
+        }
+        for name, value in self.read_many(frames):
+            yield frames[name], value if decoder is None else decoder(value)
+
+    def frames(self, decoder: Optional[Callable[[bytes], Any]] = None) -> "TarFrames":
+        """
+        Returns a lazy mapping from frame number to decoded content.
+
+        :param decoder: Function decoding the content of a file, e.g. ``json.loads``.
+        :return: Lazy mapping.
+        """
+        return TarFrames(reader=self, decoder=decoder)
+
+    def close(self):
+        """
+        Closes the underlying file.
+
+        :return:
+        """
+        self._stream = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     @staticmethod
     def read(
         path: Union[str, Path],
@@ -39,28 +566,285 @@ class TarReader:
         :param verbose: Verbosity of the method.
         :return: Extracted data.
         """
+        with TarReader(path=path, verbose=verbose) as reader:
+            dictionary = {
+                key: value
+                for key, value in tqdm(
+                    reader.read_many(reader),
+                    desc="Reading",
+                    total=len(reader),
+                    disable=not verbose,
+                )
+            }
+        return dictionary
+
+
+class TarFrames(Mapping):
+    """
+    Lazy mapping from frame number to the decoded content of a TAR archive.
+
+    :param reader: The TAR reader.
+    :param decoder: Function decoding the content of a file, e.g. ``json.loads``.
+    """
+
+    def __init__(
+        self,
+        reader: TarReader,
+        decoder: Optional[Callable[[bytes], Any]] = None,
+    ):
+        self.reader = reader
+        self.decoder = decoder
+
+    def __getitem__(self, frame: int) -> Any:
+        value = self.reader[self.reader.frame_index[frame]]
+        return value if self.decoder is None else self.decoder(value)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.reader.frame_index)
+
+    def __len__(self) -> int:
+        return len(self.reader.frame_index)
+
+    def iter_range(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> Iterator[Tuple[int, Any]]:
+        """
+        Decodes the frames within a range.
+
+        :param start: First frame number, included.
+        :param end: Last frame number, excluded.
+        :return: Iterator over the frame numbers and decoded contents.
+        """
+        return self.reader.iter_frames(start=start, end=end, decoder=self.decoder)
+
+    def close(self):
+        """
+        Closes the underlying reader.
+
+        :return:
+        """
+        self.reader.close()
+
+
+class ShardedTarReader(TarReader):
+    """
+    Reader of a sharded TAR archive: a directory holding a manifest and one TAR archive per range of frames.
+
+    It is returned when opening a sharded archive with :class:`TarReader`. A file is read from the
+    shard holding it, and the frames within a range are decoded concurrently across the shards.
+
+    :param path: Path to the directory.
+    :param verbose: Verbosity of the method.
+    :param workers: Number of shards decoded concurrently, defaults to the number of CPUs.
+    :param processes: Whether to decode the shards in worker processes instead of threads,
+        which scales better when decoding holds the GIL, e.g. JSON parsing.
+    :param allow_incomplete: Whether to read the completed shards of an archive whose writing was interrupted,
+        otherwise raises an error.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        verbose: Union[bool, int] = True,
+        workers: Optional[int] = None,
+        processes: bool = False,
+        allow_incomplete: bool = False,
+    ):
         path = Path(path)
-        TarReader.check(path=path)
+        ShardedTarReader.check(path=path)
 
-        with tarfile.open(path, mode="r") as tar:
-            dictionary = {}
-            for tarinfo in tqdm(
-                tar.getmembers(),
-                desc="Reading",
-                disable=not verbose,
-            ):
-                if tarinfo.isfile():
-                    key = tarinfo.name.split("/")[-1]
-                    value = tar.extractfile(tarinfo).read()
-                    dictionary[key] = value
-        return dictionary
+        self.path = path
+        self.verbose = verbose
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.processes = processes
+        self.manifest = load_manifest(path)
+        if not self.manifest["complete"] and not allow_incomplete:
+            raise ValueError(
+                f"Archive {path} is incomplete, its writing was interrupted, resume it or pass allow_incomplete=True "
+                f"to read its completed shards."
+            )
+        self.shard_size: int = self.manifest["shard_size"]
+        self.shards: List[Dict[str, Any]] = self.manifest["shards"]
+        self._starts = [shard["start"] for shard in self.shards]
+        self._files = {name: i for i, shard in enumerate(self.shards) for name in shard["files"]}
+        self._readers: Dict[int, TarReader] = {}
+        self._frame_index = None
+
+    @staticmethod
+    def check(path: Union[str, Path]):
+        """
+        Checks that a sharded archive is of the correct extension and exists.
+
+        :param path: Path to the directory.
+        :return:
+        """
+        path = Path(path)
+        if ".tar" not in path.suffixes:
+            raise NameError(f"Path {path} does not have a .tar extension.")
+        if not is_sharded(path):
+            raise FileNotFoundError(f"Manifest missing at path {path / MANIFEST_NAME}")
+
+    def _reader(self, i: int) -> TarReader:
+        if i not in self._readers:
+            self._readers[i] = TarReader(self.path / self.shards[i]["name"], verbose=False)
+        return self._readers[i]
+
+    def _locate(self, key: str) -> int:
+        if key in self._files:
+            return self._files[key]
+        frame = frame_number(key)
+        if frame is None:
+            raise KeyError(key)
+        i = bisect.bisect_right(self._starts, frame) - 1
+        if i < 0 or frame >= self.shards[i]["end"]:
+            raise KeyError(key)
+        return i
+
+    def __getitem__(self, key: str) -> bytes:
+        return self._reader(self._locate(key))[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self.shards)):
+            yield from self._reader(i)
+
+    def __len__(self) -> int:
+        return sum(shard["size"] for shard in self.shards)
+
+    def read_many(self, keys: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """
+        Reads several files, shard by shard, in the order in which they are stored.
+
+        :param keys: Names of the files.
+        :return: Iterator over the names and contents.
+        """
+        groups = collections.defaultdict(list)
+        for key in keys:
+            groups[self._locate(key)].append(key)
+        for i in sorted(groups):
+            yield from self._reader(i).read_many(groups[i])
+
+    @property
+    def frame_index(self) -> Dict[int, str]:
+        """
+        Index from frame number to file name, for the files named after a frame number, e.g. ``000000000000042.json``.
+
+        :return: Sorted frame index.
+        """
+        if self._frame_index is None:
+            self._frame_index = {}
+            for i in range(len(self.shards)):
+                self._frame_index.update(self._reader(i).frame_index)
+        return self._frame_index
+
+    def iter_frames(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        decoder: Optional[Callable[[bytes], Any]] = None,
+    ) -> Iterator[Tuple[int, Any]]:
+        """
+        Reads the frames within a range, decoding several shards concurrently.
+
+        :param start: First frame number, included.
+        :param end: Last frame number, excluded.
+        :param decoder: Function decoding the content of a file, e.g. ``json.loads``, it must be picklable
+            when decoding in worker processes.
+        :return: Iterator over the frame numbers and decoded contents, in order.
+        """
+        paths = [
+            self.path / shard["name"]
+            for shard in self.shards
+            if (start is None or shard["end"] > start) and (end is None or shard["start"] < end)
+        ]
+        executor_class = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with executor_class(max_workers=self.workers) as executor:
+            # Bound the number of decoded shards held in memory, the shards are yielded in order.
+            futures = collections.deque()
+            for path in paths:
+                futures.append(executor.submit(read_shard, path, start, end, decoder))
+                if len(futures) > 2 * self.workers:
+                    yield from futures.popleft().result()
+            while futures:
+                yield from futures.popleft().result()
+
+    def close(self):
+        """
+        Closes the underlying shards.
+
+        :return:
+        """
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
 
 
 class TarWriter:
     """
     Safe TAR writer.
+
+    Besides the one-shot :meth:`write`, it can be used as a context manager to stream
+    members into the archive as soon as they are produced, so that the whole content
+    never has to be held in memory::
+
+        with TarWriter(path=path, overwrite=True) as writer:
+            for key, value in items:
+                writer.add(key=key, value=value)
+
+    Compressed archives, e.g. ``.tar.gz`` or ``.tar.zst``, are compressed by blocks, optionally with several threads.
+    Giving a shard size returns a :class:`ShardedTarWriter`.
+
+    :param path: Path to the file.
+    :param overwrite: Whether to overwrite, in case of an existing file.
+    :param level: Compression level, defaults to the usual level of the compression.
+    :param threads: Number of compression threads.
+    :param shard_size: Number of frames per shard, to write a sharded archive.
     """
 
+    def __new__(cls, *args, **kwargs):
+        if cls is TarWriter and kwargs.get("shard_size") is not None:
+            cls = ShardedTarWriter
+        return super().__new__(cls)
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        overwrite: bool = False,
+        level: Optional[int] = None,
+        threads: int = 1,
+        shard_size: Optional[int] = None,
+    ):
+        path = Path(path)
+        TarWriter.check(path=path, overwrite=overwrite)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and overwrite:
+            if path.is_dir():
+                # E.g. a sharded archive.
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+
+        self.path = path
+        self.dir_name = path.stem.replace(".tar", "")
+        self.compression = get_compression(path)
+        self._names: List[str] = []
+        self._offsets: List[int] = []
+        self._sizes: List[int] = []
+
+        self._file = path.open(mode="wb")
+        if self.compression:
+            self._fileobj = BlockWriter(
+                self._file,
+                compression=self.compression,
+                level=level,
+                threads=threads,
+            )
+        else:
+            self._fileobj = self._file
+        self._tar = tarfile.open(fileobj=self._fileobj, mode="w")
+
     @staticmethod
     def check(path: Union[str, Path], overwrite: bool = False):
         """
@@ -75,12 +859,78 @@ class TarWriter:
         if path.exists() and not overwrite:
             raise FileExistsError(f"File {path} already exists.")
 
+    def add(self, key: str, value: Union[str, bytes]):
+        """
+        Appends a single file to the archive.
+
+        :param key: Name of the file inside the archive.
+        :param value: Content of the file.
+        :return:
+        """
+        if isinstance(value, str):
+            value = value.encode()
+        tarinfo = tarfile.TarInfo(name=f"{self.dir_name}/{key}")
+        tarinfo.size = len(value)
+
+        header = tarinfo.tobuf(self._tar.format, self._tar.encoding, self._tar.errors)
+        self._names.append(key.split("/")[-1])
+        self._offsets.append(self._tar.offset + len(header))
+        self._sizes.append(tarinfo.size)
+
+        self._tar.addfile(tarinfo, io.BytesIO(value))
+        # TarFile keeps track of every member written, which would grow with the archive.
+        self._tar.members.clear()
+
+    def _finalize(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+            if self.compression:
+                self._fileobj.close()
+            self._file.close()
+
+    def close(self):
+        """
+        Finalizes the archive and caches its index.
+
+        :return:
+        """
+        if self._tar is None:
+            return
+        self._finalize()
+        index = {
+            "version": INDEX_VERSION,
+            "names": self._names,
+            "offsets": self._offsets,
+            "sizes": self._sizes,
+            "blocks": self._fileobj.blocks if self.compression else [],
+        }
+        try:
+            save_index(path=self.path, index=index)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        self._finalize()
+        # Do not leave a truncated, yet valid-looking, archive behind.
+        if self.path.exists():
+            self.path.unlink()
+
     @staticmethod
     def write(
         dictionary: Dict[str, Any],
         path: Union[str, Path],
         overwrite: bool = False,
         verbose: Union[bool, int] = True,
+        level: Optional[int] = None,
+        threads: int = 1,
+        shard_size: Optional[int] = None,
     ):
         """
         Write a TAR archive of the dictionary, each key/value represents a single path name and associated file.
@@ -89,28 +939,187 @@ class TarWriter:
         :param path: Path to the file.
         :param overwrite: Whether to overwrite, in case of an existing file.
         :param verbose: Verbosity of the method.
+        :param level: Compression level, defaults to the usual level of the compression.
+        :param threads: Number of compression threads.
+        :param shard_size: Number of frames per shard, to write a sharded archive.
         :return:
         """
-        path = Path(path)
-        TarWriter.check(path=path, overwrite=overwrite)
-
-        path.parent.mkdir(parents=True, exist_ok=True)
-        if path.exists() and overwrite:
-            path.unlink()
-
-        index = path.suffixes.index(".tar")
-        if index == len(path.suffixes) - 1:
-            compression = ""
-        else:
-            compression = path.suffixes[index + 1].replace(".", "")
-
-        dir_name = path.stem.replace(".tar", "")
-        with tarfile.open(path, mode=f"w:{compression}") as tar:
+        with TarWriter(
+            path=path,
+            overwrite=overwrite,
+            level=level,
+            threads=threads,
+            shard_size=shard_size,
+        ) as writer:
             for key, value in tqdm(
                 dictionary.items(),
                 desc="Writing",
                 disable=not verbose,
             ):
-                tarinfo = tarfile.TarInfo(name=f"{dir_name}/{key}")
-                tarinfo.size = len(value)
-                tar.addfile(tarinfo, io.BytesIO(value.encode()))
+                writer.add(key=key, value=value)
+
+
+class ShardedTarWriter(TarWriter):
+    """
+    Writer of a sharded TAR archive: a directory holding a manifest and one TAR archive per range of frames.
+
+    It is returned by :class:`TarWriter` when given a shard size. The files named after a frame number,
+    e.g. ``000000000000042.json``, go to the shard of their range and must be added in increasing order;
+    the other files go to the first shard. Every shard is finalized as soon as a frame of the next range
+    arrives, and the manifest is updated right away.
+
+    :param path: Path to the directory, e.g. ``/path/to/poses.tar.gz``.
+    :param overwrite: Whether to overwrite, in case of an existing archive.
+    :param level: Compression level, defaults to the usual level of the compression.
+    :param threads: Number of compression threads.
+    :param shard_size: Number of frames per shard.
+    :param resume: Whether to resume an incomplete archive left by an interrupted run, in which case
+        the completed shards are kept, also when an error occurs, and the frames resume from :attr:`next_frame`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        overwrite: bool = False,
+        level: Optional[int] = None,
+        threads: int = 1,
+        shard_size: int = 1000,
+        resume: bool = False,
+    ):
+        path = Path(path)
+        assert shard_size > 0, "The shard size must be positive."
+
+        self.path = path
+        self.level = level
+        self.threads = threads
+        self.shard_size = shard_size
+        self.resume = resume
+        self.suffix = "".join(path.suffixes[path.suffixes.index(".tar"):])
+        self.shards: List[Dict[str, Any]] = []
+        self._shard: Optional[Dict[str, Any]] = None
+        self._writer: Optional[TarWriter] = None
+        self._files: List[Tuple[str, Union[str, bytes]]] = []
+
+        if resume and is_sharded(path):
+            manifest = load_manifest(path)
+            self.shard_size = manifest["shard_size"]
+            self.shards = manifest["shards"]
+            # Drop the shard that was being written when the previous run was interrupted.
+            names = {shard["name"] for shard in self.shards} | {MANIFEST_NAME}
+            for file in path.iterdir():
+                if file.name not in names:
+                    file.unlink()
+            return
+
+        TarWriter.check(path=path, overwrite=overwrite)
+        if path.exists() and overwrite:
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        path.mkdir(parents=True)
+        self._save_manifest(complete=False)
+
+    @property
+    def next_frame(self) -> int:
+        """
+        First frame number not covered by the completed shards, from which an interrupted run resumes.
+
+        :return: Frame number.
+        """
+        return self.shards[-1]["end"] if self.shards else 0
+
+    def _open_shard(self, bucket: int):
+        self._shard = {
+            "name": f"{bucket:05d}{self.suffix}",
+            "start": bucket * self.shard_size,
+            "end": (bucket + 1) * self.shard_size,
+            "size": 0,
+            "files": [],
+        }
+        self._writer = TarWriter(
+            path=self.path / self._shard["name"],
+            level=self.level,
+            threads=self.threads,
+        )
+        # The files that are not frames, e.g. edges.json, go to the first shard.
+        for key, value in self._files:
+            self._add(key=key, value=value, frame=None)
+        self._files = []
+
+    def _close_shard(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self.shards.append(self._shard)
+        self._writer = None
+        self._shard = None
+        self._save_manifest(complete=False)
+
+    def _save_manifest(self, complete: bool):
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "shard_size": self.shard_size,
+            "complete": complete,
+            "shards": self.shards,
+        }
+        tmp_path = self.path / f"{MANIFEST_NAME}.tmp"
+        with tmp_path.open(mode="w") as file:
+            json.dump(manifest, file)
+        tmp_path.replace(self.path / MANIFEST_NAME)
+
+    def _add(self, key: str, value: Union[str, bytes], frame: Optional[int]):
+        self._writer.add(key=key, value=value)
+        self._shard["size"] += 1
+        if frame is None:
+            self._shard["files"].append(key.split("/")[-1])
+
+    def add(self, key: str, value: Union[str, bytes]):
+        """
+        Appends a single file to the archive, into the shard of its frame.
+
+        :param key: Name of the file inside the archive.
+        :param value: Content of the file.
+        :return:
+        """
+        frame = frame_number(key)
+        if frame is None:
+            if any(key.split("/")[-1] in shard["files"] for shard in self.shards):
+                # Already stored by the run being resumed.
+                return
+            if self._writer is None:
+                self._files.append((key, value))
+            else:
+                self._add(key=key, value=value, frame=None)
+            return
+
+        if self._shard is None or not self._shard["start"] <= frame < self._shard["end"]:
+            previous = self._shard or (self.shards[-1] if self.shards else None)
+            if previous is not None and frame < previous["end"]:
+                raise ValueError(f"Frames must be added in increasing order, got {key} after a later frame.")
+            self._close_shard()
+            self._open_shard(bucket=frame // self.shard_size)
+        self._add(key=key, value=value, frame=frame)
+
+    def close(self):
+        """
+        Finalizes the last shard and the manifest.
+
+        :return:
+        """
+        if self._files:
+            self._open_shard(bucket=0)
+        self._close_shard()
+        self._save_manifest(complete=True)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        if self._writer is not None:
+            self._writer.__exit__(exc_type, exc_val, exc_tb)
+        if self.resume:
+            # Keep the completed shards, the manifest marks the archive as incomplete.
+            return
+        # Do not leave a truncated, yet valid-looking, archive behind.
+        shutil.rmtree(self.path, ignore_errors=True)
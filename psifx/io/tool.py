@@ -0,0 +1,415 @@
+"""archive conversion tool."""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from tqdm import tqdm
+
+import numpy as np
+
+from psifx.tool import Tool
+from psifx.io import json, npz, tar
+
+FORMATS = ["npz", "tar", "tar.gz", "tar.bz2", "tar.xz", "tar.zst"]
+
+# Number of values of the keypoints of the pose archives: x, y and confidence.
+POINT_SIZE = 3
+
+
+def archive_format(path: Union[str, Path]) -> Optional[str]:
+    """
+    Infers the format of a pose or feature archive from its extension.
+
+    :param path: Path to the file.
+    :return: Format, e.g. ``tar.gz`` or ``npz``, ``None`` if it is not an archive.
+    """
+    path = Path(path)
+    if path.suffix == ".npz":
+        return "npz"
+    if ".tar" in path.suffixes:
+        return "".join(path.suffixes[path.suffixes.index(".tar"):])[1:]
+    return None
+
+
+def frame_rows(values: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Lays out the values of a frame as the rows of the NPZ format, the same as the pose estimation tools write them.
+
+    The keypoints of the pose archives, whose fields are all keypoints, are [n_points, 3] arrays, while the
+    features are kept as flat rows.
+
+    :param values: Values of the frame, e.g. decoded from a TAR archive.
+    :return: Float32 rows.
+    """
+    shape = (-1, POINT_SIZE) if all(key.endswith("_keypoints_2d") for key in values) else (-1,)
+    return {key: np.asarray(value, dtype=np.float32).reshape(shape) for key, value in values.items()}
+
+
+def archive_stem(path: Union[str, Path]) -> str:
+    """
+    Strips the archive extension from a file name, e.g. ``poses.tar.gz`` gives ``poses``.
+
+    :param path: Path to the file.
+    :return: File name without the archive extension.
+    """
+    path = Path(path)
+    return path.name[: -(len(archive_format(path)) + 1)]
+
+
+def checkpoint_path(path: Union[str, Path]) -> Path:
+    """
+    Locates the checkpoint of an archive being computed, a hidden uncompressed sharded TAR archive
+    next to it, e.g. ``poses.npz`` gives ``.poses.checkpoint.tar``.
+
+    :param path: Path to the archive.
+    :return: Path to the checkpoint.
+    """
+    path = Path(path)
+    return path.parent / f".{archive_stem(path)}.checkpoint.tar"
+
+
+def archive_size(path: Union[str, Path]) -> int:
+    """
+    Computes the size of an archive, summing the shards of a sharded archive.
+
+    :param path: Path to the archive.
+    :return: Size in bytes.
+    """
+    path = Path(path)
+    if path.is_dir():
+        return sum(file.stat().st_size for file in path.iterdir() if file.is_file())
+    return path.stat().st_size
+
+
+def iter_archives(directory: Path) -> Iterator[Path]:
+    """
+    Recursively lists the archives of a directory tree, a sharded archive counting as a single archive.
+
+    :param directory: Path to the directory.
+    :return: Iterator over the paths of the archives.
+    """
+    for path in sorted(directory.iterdir()):
+        if path.name.startswith("."):
+            # Hidden, e.g. the checkpoint of an archive being computed.
+            continue
+        if tar.is_sharded(path):
+            yield path
+        elif path.is_dir():
+            yield from iter_archives(path)
+        elif archive_format(path) is not None:
+            yield path
+
+
+def convert_archive(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    overwrite: bool = False,
+    level: Optional[int] = None,
+    threads: int = 1,
+    shard_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Converts a pose or feature archive between the TAR/JSON format and the columnar NPZ format.
+
+    The per-frame values are stored as float32 rows in the NPZ format, see :func:`frame_rows`, and as flat lists
+    in the TAR format.
+
+    :param input_path: Path to the input archive.
+    :param output_path: Path to the output archive.
+    :param overwrite: Whether to overwrite, in case of an existing file.
+    :param level: Compression level of the TAR archives, defaults to the usual level of the compression.
+    :param threads: Number of compression threads of the TAR archives.
+    :param shard_size: Number of frames per shard, to write sharded TAR archives.
+    :return: Statistics of the conversion: number of frames, sizes in bytes and duration in seconds.
+    """
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    start = time.perf_counter()
+
+    if archive_format(input_path) == "npz":
+        reader = npz.NPZReader(input_path)
+        edges = reader.edges
+        frames = reader.frames()
+        items = (
+            (frame, {key: np.asarray(value) for key, value in values.items()})
+            for frame, values in frames.items()
+        )
+    else:
+        reader = tar.TarReader(input_path, verbose=False)
+        try:
+            edges = json.loads(reader["edges.json"])
+        except KeyError:
+            edges = None
+        frames = reader.frames(decoder=json.loads)
+        items = frames.items()
+
+    n_frames = 0
+    try:
+        if archive_format(output_path) == "npz":
+            with npz.NPZWriter(path=output_path, overwrite=overwrite, pad=True) as writer:
+                if edges is not None:
+                    writer.set(key="edges", value=edges)
+                for frame, values in items:
+                    writer.add_frame(frame=frame, values=frame_rows(values))
+                    n_frames += 1
+        else:
+            with tar.TarWriter(
+                path=output_path,
+                overwrite=overwrite,
+                level=level,
+                threads=threads,
+                shard_size=shard_size,
+            ) as writer:
+                if edges is not None:
+                    writer.add(key="edges.json", value=json.dumps(edges))
+                for frame, values in items:
+                    values = {key: np.asarray(value).reshape(-1) for key, value in values.items()}
+                    writer.add(key=f"{frame: 015d}.json", value=json.dumps(values))
+                    n_frames += 1
+    finally:
+        reader.close()
+
+    return {
+        "frames": n_frames,
+        "input_size": archive_size(input_path),
+        "output_size": archive_size(output_path),
+        "duration": time.perf_counter() - start,
+    }
+
+
+class ConversionTool(Tool):
+    """
+    Tool for converting pose and feature archives in bulk.
+
+    :param num_workers: Number of worker processes, defaults to the number of CPUs.
+    :param level: Compression level of the TAR archives, defaults to the usual level of the compression.
+    :param threads: Number of compression threads of the TAR archives, per worker.
+    :param shard_size: Number of frames per shard, to write sharded TAR archives.
+    :param overwrite: Whether to overwrite existing files, otherwise raise an error.
+    :param verbose: Whether to execute the computation verbosely.
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        level: Optional[int] = None,
+        threads: int = 1,
+        shard_size: Optional[int] = None,
+        overwrite: bool = False,
+        verbose: Union[bool, int] = True,
+    ):
+        super().__init__(
+            device="cpu",
+            overwrite=overwrite,
+            verbose=verbose,
+        )
+        self.num_workers = num_workers
+        self.level = level
+        self.threads = threads
+        self.shard_size = shard_size
+
+    def collect(
+        self,
+        input_path: Union[str, Path],
+        output_path: Optional[Union[str, Path]],
+        format: str,
+    ) -> List[Tuple[Path, Path]]:
+        """
+        Lists the archives to convert, mirroring the directory tree of the input into the output.
+
+        :param input_path: Path to an archive or to a directory tree of archives.
+        :param output_path: Path to the output archive or directory, defaults to next to the input.
+        :param format: Target format.
+        :return: Pairs of input and output paths.
+        """
+        input_path = Path(input_path)
+        output_path = Path(output_path) if output_path is not None else None
+        assert format in FORMATS, f"Unknown format {format}, expected one of {FORMATS}."
+
+        if input_path.is_file() or tar.is_sharded(input_path):
+            if output_path is None:
+                output_path = input_path.parent / f"{archive_stem(input_path)}.{format}"
+            return [(input_path, output_path)]
+        if not input_path.is_dir():
+            raise FileNotFoundError(f"{input_path} is not a directory or an archive")
+
+        output_dir = output_path if output_path is not None else input_path
+        pairs = []
+        for path in iter_archives(input_path):
+            if output_path is None and archive_format(path) == format:
+                continue
+            relative = path.relative_to(input_path)
+            pairs.append((path, output_dir / relative.parent / f"{archive_stem(path)}.{format}"))
+        return pairs
+
+    def convert(
+        self,
+        input_path: Union[str, Path],
+        output_path: Optional[Union[str, Path]] = None,
+        format: str = "npz",
+    ):
+        """
+        Converts an archive, or every archive of a directory tree, in parallel across processes.
+
+        :param input_path: Path to an archive or to a directory tree of archives.
+        :param output_path: Path to the output archive or directory, defaults to next to the input.
+        :param format: Target format, one of ``npz``, ``tar``, ``tar.gz``, ``tar.bz2``, ``tar.xz``, ``tar.zst``.
+        :return:
+        """
+        pairs = self.collect(input_path=input_path, output_path=output_path, format=format)
+
+        if self.verbose:
+            print(f"input       =   {input_path}")
+            print(f"output      =   {output_path if output_path is not None else input_path}")
+            print(f"format      =   {format}")
+            print(f"archives    =   {len(pairs)}")
+
+        for source, target in pairs:
+            if source == target:
+                raise ValueError(f"Cannot convert {source} onto itself.")
+            if target.exists() and not self.overwrite:
+                raise FileExistsError(f"File {target} already exists.")
+
+        total = {"frames": 0, "input_size": 0, "output_size": 0}
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            futures = {
+                executor.submit(
+                    convert_archive,
+                    source,
+                    target,
+                    self.overwrite,
+                    self.level,
+                    self.threads,
+                    self.shard_size,
+                ): source
+                for source, target in pairs
+            }
+            for future in tqdm(
+                as_completed(futures),
+                total=len(futures),
+                desc="Converting",
+                disable=not self.verbose,
+            ):
+                stats = future.result()
+                for key in total:
+                    total[key] += stats[key]
+                if self.verbose:
+                    tqdm.write(f"{futures[future]}: {format_stats(stats)}")
+
+        if self.verbose:
+            total["duration"] = time.perf_counter() - start
+            print(f"total: {format_stats(total)}")
+
+    def benchmark(
+        self,
+        input_path: Union[str, Path],
+        formats: List[str],
+        threads: List[int],
+        n_random: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """
+        Compares the write time, read time and size of a TAR archive once re-encoded in several formats.
+
+        The write time covers the encoding of the in-memory content, the read time covers the decoding
+        of every frame, and the random access time covers the decoding of randomly chosen frames.
+
+        :param input_path: Path to a TAR archive, e.g. a pose archive.
+        :param formats: Formats to compare.
+        :param threads: Numbers of compression threads to compare.
+        :param n_random: Number of frames read in random order.
+        :return: Results of every configuration.
+        """
+        input_path = Path(input_path)
+        members = tar.TarReader.read(input_path, verbose=False)
+        edges = json.loads(members["edges.json"]) if "edges.json" in members else None
+        frames = {}
+        for key, value in members.items():
+            try:
+                frame = int(Path(key).stem)
+            except ValueError:
+                continue
+            frames[frame] = {k: np.asarray(v, dtype=np.float32).reshape(-1) for k, v in json.loads(value).items()}
+        frames = dict(sorted(frames.items()))
+        sample = random.Random(0).sample(list(frames), min(n_random, len(frames)))
+
+        results = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for format in formats:
+                for n_threads in threads if format.startswith("tar.") else [1]:
+                    path = Path(tmp_dir) / f"{archive_stem(input_path)}.{format}"
+
+                    start = time.perf_counter()
+                    if format == "npz":
+                        with npz.NPZWriter(path=path, overwrite=True, pad=True) as writer:
+                            if edges is not None:
+                                writer.set(key="edges", value=edges)
+                            for frame, values in frames.items():
+                                writer.add_frame(frame=frame, values=values)
+                    else:
+                        tar.TarWriter.write(
+                            members,
+                            path=path,
+                            overwrite=True,
+                            verbose=False,
+                            level=self.level,
+                            threads=n_threads,
+                        )
+                    write_time = time.perf_counter() - start
+
+                    read_times = []
+                    for order in [list(frames), sample]:
+                        start = time.perf_counter()
+                        if format == "npz":
+                            with npz.NPZReader(path) as reader:
+                                decoded = reader.frames()
+                                for frame in order:
+                                    # Copy the rows out of the memory map, so that they are actually read.
+                                    {key: np.array(value) for key, value in decoded[frame].items()}
+                        else:
+                            with tar.TarReader(path, verbose=False) as reader:
+                                decoded = reader.frames(decoder=json.loads)
+                                for frame in order:
+                                    decoded[frame]
+                        read_times.append(time.perf_counter() - start)
+
+                    results.append(
+                        {
+                            "format": format,
+                            "threads": n_threads,
+                            "size": path.stat().st_size,
+                            "write": write_time,
+                            "read": read_times[0],
+                            "random": read_times[1],
+                        }
+                    )
+                    path.unlink()
+
+        if self.verbose:
+            print(f"input = {input_path}, {len(frames)} frames, {input_path.stat().st_size / 1e6:.2f} MB")
+            print(f"{'format':<10}{'threads':>8}{'size (MB)':>12}{'write (s)':>12}{'read (s)':>12}{'random (s)':>12}")
+            for result in results:
+                print(
+                    f"{result['format']:<10}{result['threads']:>8}{result['size'] / 1e6:>12.2f}"
+                    f"{result['write']:>12.3f}{result['read']:>12.3f}{result['random']:>12.3f}"
+                )
+        return results
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """
+    Formats the statistics of a conversion into a human-readable throughput summary.
+
+    :param stats: Statistics as returned by :func:`convert_archive`.
+    :return: Summary.
+    """
+    duration = max(stats["duration"], 1e-9)
+    return (
+        f"{stats['frames']} frames in {stats['duration']:.2f}s "
+        f"({stats['frames'] / duration:.0f} frames/s, {stats['input_size'] / duration / 1e6:.1f} MB/s), "
+        f"{stats['input_size'] / 1e6:.1f} MB -> {stats['output_size'] / 1e6:.1f} MB"
+    )
@@ -1,46 +1,821 @@
 """Video I/O module."""
 
-from typing import Dict, Optional, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
+import json
+import math
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from fractions import Fraction
 from pathlib import Path
 
+import cv2
+import numpy as np
 from numpy import ndarray
+from tqdm import tqdm
 
 from skvideo.io import FFmpegReader, FFmpegWriter
 
+from psifx.utils.cache import cache_enabled, cache_file, evict, file_key
+from psifx.utils.constants import PROBE_CACHE, VIDEO_BACKEND
 
-class VideoReader(FFmpegReader):
+# Decoding backends, see ``VideoReader``.
+BACKENDS = ["ffmpeg", "opencv", "pyav"]
+
+# Frame rate assumed when the container does not specify it.
+DEFAULT_FRAME_RATE = 25.0
+
+PROBE_VERSION = 1
+
+# Probe results of the videos opened by this process, keyed by path, size and modification time.
+_probes: Dict[str, Dict[str, Any]] = {}
+
+# Number of frames decoded ahead, or buffered for encoding, by the tools, a few hundred megabytes at most for full HD videos.
+PREFETCH_SIZE = 16
+
+
+def seconds_to_frame(seconds: float, frame_rate: float) -> int:
+    """
+    Converts a time into the index of the first frame at or after it.
+
+    :param seconds: Time in seconds.
+    :param frame_rate: Frame rate of the video.
+    :return: Frame index.
+    """
+    return math.ceil(round(seconds * frame_rate, 6))
+
+
+def scaled_size(
+        width: int,
+        height: int,
+        max_side: Optional[int] = None,
+        scale: Optional[float] = None,
+) -> Tuple[int, int]:
+    """
+    Computes the size of downscaled frames, rounded to even dimensions for the video codecs.
+
+    :param width: Original width.
+    :param height: Original height.
+    :param max_side: Maximum size of the longest side.
+    :param scale: Scaling factor, instead of ``max_side``.
+    :return: Scaled width and height, the original ones if no downscaling is needed.
+    """
+    if scale is None:
+        scale = max_side / max(width, height) if max_side is not None else 1.0
+    if scale >= 1.0:
+        return width, height
+    return max(2, 2 * round(width * scale / 2)), max(2, 2 * round(height * scale / 2))
+
+
+def load_probe(path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """
+    Loads the cached probe results of a video, from memory or, if ``PROBE_CACHE`` is set, from disk.
+
+    :param path: Path to the video.
+    :return: Probe results, ``None`` if the video was never probed since it last changed.
+    """
+    key = file_key(path)
+    if key in _probes:
+        return _probes[key]
+    if PROBE_CACHE and cache_enabled():
+        try:
+            cache_path = cache_file(path=path, namespace="video")
+            with cache_path.open(mode="r") as file:
+                probe = json.load(file)
+            if probe.get("version") == PROBE_VERSION:
+                cache_path.touch()
+                _probes[key] = probe
+                return probe
+        except (OSError, ValueError):
+            pass
+    return None
+
+
+def save_probe(path: Union[str, Path], probe: Dict[str, Any]):
+    """
+    Caches the probe results of a video, in memory and, if ``PROBE_CACHE`` is set, on disk.
+
+    :param path: Path to the video.
+    :param probe: Probe results.
+    :return:
+    """
+    probe["version"] = PROBE_VERSION
+    _probes[file_key(path)] = probe
+    if PROBE_CACHE and cache_enabled():
+        cache_path = cache_file(path=path, namespace="video")
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            with tmp_path.open(mode="w") as file:
+                json.dump(probe, file)
+            tmp_path.replace(cache_path)
+            evict(namespace="video")
+        except OSError:
+            pass
+
+
+def import_av():
+    """
+    Imports the ``av`` package, only required by the PyAV decoding backend.
+
+    :return: The ``av`` module.
+    """
+    try:
+        import av
+    except ImportError as error:
+        raise ImportError("Decoding videos with the pyav backend requires the av package.") from error
+    return av
+
+
+def available_backends() -> List[str]:
+    """
+    Lists the decoding backends usable on this host.
+
+    :return: Names of the backends.
+    """
+    backends = []
+    if shutil.which("ffmpeg") is not None:
+        backends.append("ffmpeg")
+    backends.append("opencv")
+    try:
+        import_av()
+        backends.append("pyav")
+    except ImportError:
+        pass
+    return backends
+
+
+def concat_videos(
+        paths: List[Union[str, Path]],
+        path: Union[str, Path],
+        overwrite: bool = False,
+):
+    """
+    Concatenates videos encoded with the same settings, e.g. the segments of an interrupted computation, into one
+    video, without re-encoding them.
+
+    :param paths: Paths to the videos, in order.
+    :param path: Path to the concatenated video.
+    :param overwrite: Whether to overwrite, in case of an existing file.
+    :return:
+    """
+    path = Path(path)
+    if path.exists() and not overwrite:
+        raise FileExistsError(path)
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+        for video_path in paths:
+            escaped = str(Path(video_path).resolve()).replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\n")
+    try:
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", listing.name,
+                "-c", "copy", str(path),
+            ],
+            check=True,
+        )
+    finally:
+        Path(listing.name).unlink()
+
+
+class VideoReader:
     """
     Video reader object.
 
+    The frames are decoded by one of the backends in ``BACKENDS``: ``ffmpeg`` pipes the frames from an ffmpeg
+    subprocess, while ``opencv`` and ``pyav`` decode them in-process, without a subprocess per reader nor pipe
+    copies. Instantiating a ``VideoReader`` returns the reader of the requested backend.
+
     :param path: The path to the video file.
-    :param input_dict: Input options.
-    :param output_dict: Output options.
+    :param input_dict: Input options, only supported by the ffmpeg backend.
+    :param output_dict: Output options, only supported by the ffmpeg backend.
+    :param start_frame: Index of the first frame to read, e.g. to resume an interrupted computation.
+    :param end_frame: Index of the frame where to stop reading, excluded, by default the end of the video.
+    :param start: Time of the first frame to read in seconds, instead of ``start_frame``.
+    :param end: Time where to stop reading in seconds, excluded, instead of ``end_frame``.
+    :param max_side: Maximum size of the longest side of the frames, which are downscaled by the backend if needed.
+        The original size remains available as ``inputwidth`` and ``inputheight``.
+    :param scale: Downscaling factor of the frames, instead of ``max_side``.
+    :param prefetch: Number of frames decoded ahead by a background thread, so that decoding overlaps with
+        the processing of the frames, by default the frames are decoded on demand.
+    :param buffers: Number of frames the caller holds at once, the frames are then decoded into a ring of
+        preallocated buffers, each reused once ``buffers`` more frames were read, by default every frame is
+        a new array.
+    :param gray: Whether to decode [H, W] grayscale frames instead of [H, W, 3] RGB frames, e.g. for the masks.
+    :param backend: Decoding backend, by default ``VIDEO_BACKEND``.
     """
 
+    def __new__(cls, *args, backend: Optional[str] = None, **kwargs):
+        if cls is VideoReader:
+            backend = backend or VIDEO_BACKEND
+            if backend not in READERS:
+                raise ValueError(f"Unsupported video backend: {backend}, expected one of {BACKENDS}.")
+            cls = READERS[backend]
+        return super().__new__(cls)
+
     def __init__(
             self,
             path: Union[str, Path],
             input_dict: Optional[Dict[str, str]] = None,
             output_dict: Optional[Dict[str, str]] = None,
+            start_frame: int = 0,
+            end_frame: Optional[int] = None,
+            start: Optional[float] = None,
+            end: Optional[float] = None,
+            max_side: Optional[int] = None,
+            scale: Optional[float] = None,
+            prefetch: int = 0,
+            buffers: int = 0,
+            gray: bool = False,
+            backend: Optional[str] = None,
     ):
         path = Path(path)
 
         if not path.exists():
             raise FileNotFoundError(f"File missing at path {path}")
 
-        super().__init__(
-            filename=str(path),
-            inputdict=input_dict,
-            outputdict=output_dict,
+        self.prefetch = prefetch
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._exhausted = False
+        self.buffers = buffers
+        self._ring: List[ndarray] = []
+        self._ring_index = 0
+        self.gray = gray
+
+        # Sets the input and output sizes, the frame rate and the number of frames, 0 if unknown.
+        self._open(path, input_dict=dict(input_dict or {}), output_dict=dict(output_dict or {}))
+
+        if start is not None:
+            start_frame = seconds_to_frame(start, self.inputfps)
+        if end is not None:
+            end_frame = seconds_to_frame(end, self.inputfps)
+        if start_frame < 0 or (end_frame is not None and end_frame < start_frame):
+            self._release()
+            raise ValueError(f"Invalid frame range [{start_frame}, {end_frame}).")
+        # The number of frames from the container may be an estimate, only an explicit end stops the decoding early.
+        self._bounded = end_frame is not None
+        total = self.inputframenum
+        if end_frame is None or end_frame > total > 0:
+            end_frame = total if total > 0 else None
+        if end_frame is not None:
+            start_frame = min(start_frame, end_frame)
+            self.inputframenum = end_frame - start_frame
+
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.outputwidth, self.outputheight = scaled_size(
+            self.outputwidth, self.outputheight, max_side=max_side, scale=scale,
         )
+        self._empty = end_frame is not None and self.inputframenum == 0
+        if not self._empty:
+            self._start()
 
         self.num_frames = self.inputframenum
-        self.frame_rate = self.probeInfo["video"][self.INFO_AVERAGE_FRAMERATE]
+
+        self.stats = {
+            "frames": 0,
+            "starved": 0,
+            "consumer_wait": 0.0,
+            "decoder_wait": 0.0,
+        }
+
+    def _open(self, path: Path, input_dict: Dict[str, str], output_dict: Dict[str, str]):
+        """
+        Opens and probes the video, setting ``inputwidth``, ``inputheight``, ``outputwidth``, ``outputheight``,
+        ``inputfps``, ``frame_rate`` and ``inputframenum``.
+
+        :param path: The path to the video file.
+        :param input_dict: Input options.
+        :param output_dict: Output options.
+        :return:
+        """
+        raise NotImplementedError
+
+    def _start(self):
+        """
+        Starts decoding the ``inputframenum`` frames from ``start_frame``, at the output size.
+
+        :return:
+        """
+        raise NotImplementedError
+
+    def _read(self, out: Optional[ndarray] = None) -> Optional[ndarray]:
+        """
+        Decodes the next frame.
+
+        :param out: [H, W, 3] buffer where to decode the frame, or [H, W] with ``gray``, by default a new array.
+        :return: [H, W, 3] RGB frame, or [H, W] grayscale frame with ``gray``, ``None`` at the end of the video.
+        """
+        raise NotImplementedError
+
+    def _next_buffer(self) -> Optional[ndarray]:
+        if not self.buffers:
+            return None
+        if not self._ring:
+            # The frames in the prefetching queue and the one being decoded are held as well.
+            shape = (self.outputheight, self.outputwidth) if self.gray else (self.outputheight, self.outputwidth, 3)
+            self._ring = [np.empty(shape, dtype=np.uint8) for _ in range(self.buffers + self.prefetch + 1)]
+        buffer = self._ring[self._ring_index]
+        self._ring_index = (self._ring_index + 1) % len(self._ring)
+        return buffer
+
+    def _frames(self) -> Iterator[ndarray]:
+        while True:
+            frame = self._read(self._next_buffer())
+            if frame is None:
+                return
+            yield frame
+
+    def read(self, out: Optional[ndarray] = None) -> Optional[ndarray]:
+        """
+        Reads the next frame, into a caller-supplied buffer to avoid allocating a new array per frame.
+
+        :param out: [H, W, 3] uint8 buffer, or [H, W] with ``gray``, by default the frame is a new array, or a ring
+            buffer with ``buffers``.
+        :return: [H, W, 3] frame, or [H, W] with ``gray``, ``out`` if given, ``None`` at the end of the video.
+        """
+        if self._empty:
+            return None
+        if not self.prefetch:
+            return self._read(self._next_buffer() if out is None else out)
+        frame = next(self.nextFrame(), None)
+        if frame is not None and out is not None:
+            np.copyto(out, frame)
+            return out
+        return frame
+
+    def _interrupt(self):
+        """
+        Unblocks the background thread if it is waiting for the decoder.
+
+        :return:
+        """
+        pass
+
+    def _release(self):
+        """
+        Releases the decoder.
+
+        :return:
+        """
+        pass
 
     def __len__(self):
         return self.num_frames
 
+    def __iter__(self) -> Iterator[ndarray]:
+        return self.nextFrame()
+
+    def __next__(self) -> ndarray:
+        return next(self.nextFrame())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _put(self, frame: Optional[ndarray]):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(frame, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.stats["decoder_wait"] += time.perf_counter() - start
+
+    def _decode(self):
+        try:
+            for frame in self._frames():
+                self._put(frame)
+                if self._stop.is_set():
+                    return
+        except BaseException as error:
+            self._error = error
+        finally:
+            # Signal the end of the video, or the error.
+            self._put(None)
+
+    def nextFrame(self) -> Iterator[ndarray]:
+        """
+        Yields the frames, decoded ahead by a background thread when prefetching.
+
+        :return: Iterator over the [H, W, 3] frames.
+        """
+        if self._empty:
+            return
+        if not self.prefetch:
+            yield from self._frames()
+            return
+
+        if self._thread is None:
+            self._queue = queue.Queue(maxsize=self.prefetch)
+            self._thread = threading.Thread(target=self._decode, daemon=True)
+            self._thread.start()
+
+        while not self._exhausted:
+            try:
+                frame = self._queue.get_nowait()
+            except queue.Empty:
+                # The consumer is starved, decoding is the bottleneck.
+                start = time.perf_counter()
+                frame = self._queue.get()
+                self.stats["starved"] += 1
+                self.stats["consumer_wait"] += time.perf_counter() - start
+            if frame is None:
+                self._exhausted = True
+                if self._error is not None:
+                    raise self._error
+                return
+            self.stats["frames"] += 1
+            yield frame
+
+    def report(self) -> str:
+        """
+        Summarizes the prefetching statistics: how often the consumer waited for a frame, i.e. the job is
+        decode-bound, and how long the decoder waited for room in the queue, i.e. the job is compute-bound.
+
+        :return: Human-readable summary.
+        """
+        frames = max(self.stats["frames"], 1)
+        bound = "decode" if self.stats["consumer_wait"] > self.stats["decoder_wait"] else "compute"
+        return (
+            f"Prefetched {self.stats['frames']} frames: "
+            f"starved on {self.stats['starved']} ({100 * self.stats['starved'] / frames:.1f}%) "
+            f"waiting {self.stats['consumer_wait']:.1f}s, "
+            f"decoder blocked {self.stats['decoder_wait']:.1f}s, {bound}-bound."
+        )
+
+    def close(self):
+        """
+        Stops the background decoding, if any, and releases the decoder.
+
+        :return:
+        """
+        if self._thread is not None:
+            self._stop.set()
+            if self._thread.is_alive():
+                self._interrupt()
+            self._thread.join()
+            self._thread = None
+        self._release()
+
+
+class FFmpegVideoReader(VideoReader, FFmpegReader):
+    """
+    Video reader piping the frames from an ffmpeg subprocess, see :class:`VideoReader`.
+    """
+
+    def _open(self, path: Path, input_dict: Dict[str, str], output_dict: Dict[str, str]):
+        # Set before probing, since skvideo replaces an empty dict instead of completing it.
+        output_dict.setdefault("-f", self.OUTPUT_METHOD)
+        output_dict.setdefault("-pix_fmt", "gray" if self.gray else "rgb24")
+        self._input_dict = input_dict
+        self._output_dict = output_dict
+        # The decoding only starts once the video is probed, since the range and the size depend on it.
+        self._deferred = True
+        FFmpegReader.__init__(
+            self,
+            filename=str(path),
+            inputdict=input_dict,
+            outputdict=output_dict,
+        )
+        self._deferred = False
+        self._probed_size = (self.outputwidth, self.outputheight)
+        self.frame_rate = self.probeInfo["video"][self.INFO_AVERAGE_FRAMERATE]
+
+    def _start(self):
+        if self.start_frame > 0:
+            # Seeking the input half a frame earlier keeps it frame-accurate despite timestamp rounding,
+            # ffmpeg decodes from the previous keyframe and drops the earlier frames.
+            self._input_dict["-ss"] = f"{(self.start_frame - 0.5) / self.inputfps:.6f}"
+        if self.end_frame is not None:
+            self._output_dict["-vframes"] = str(self.inputframenum)
+        if (self.outputwidth, self.outputheight) != self._probed_size:
+            self._output_dict["-s"] = f"{self.outputwidth}x{self.outputheight}"
+            self._output_dict["-sws_flags"] = "area"
+        self._createProcess(self._input_dict, self._output_dict, self.verbosity)
+
+    def _probe(self):
+        # Repeated opens of the same video, e.g. once per person or per mask, skip ffprobe.
+        self._probe_cache = load_probe(self._filename)
+        if self._probe_cache is None:
+            self._probe_cache = {"info": FFmpegReader._probe(self)}
+            save_probe(self._filename, self._probe_cache)
+        return self._probe_cache["info"]
+
+    def _probCountFrames(self):
+        # Only needed when the container does not store the number of frames, it decodes the whole video.
+        if "frames" not in self._probe_cache:
+            self._probe_cache["frames"] = FFmpegReader._probCountFrames(self)
+            save_probe(self._filename, self._probe_cache)
+        return self._probe_cache["frames"]
+
+    def _createProcess(self, inputdict, outputdict, verbosity):
+        if self._deferred:
+            self._proc = None
+            return
+        FFmpegReader._createProcess(self, inputdict, outputdict, verbosity)
+
+    def _read(self, out: Optional[ndarray] = None) -> Optional[ndarray]:
+        if out is None or self.output_pix_fmt != ("gray" if self.gray else "rgb24"):
+            frame = self._readFrame()
+            if len(frame) == 0:
+                return None
+            if self.gray:
+                frame = frame[..., 0]
+            if out is None:
+                return frame
+            np.copyto(out, frame)
+            return out
+        # The frame is read straight from the pipe into the buffer.
+        view = memoryview(out).cast("B")
+        size = 0
+        while size < len(view):
+            count = self._proc.stdout.readinto(view[size:])
+            if not count:
+                return None
+            size += count
+        return out
+
+    def _interrupt(self):
+        self._terminate(timeout=0.2)
+
+    def _release(self):
+        FFmpegReader.close(self)
+
+
+class OpenCVVideoReader(VideoReader):
+    """
+    Video reader decoding the frames in-process with OpenCV, see :class:`VideoReader`.
+    """
+
+    def _open(self, path: Path, input_dict: Dict[str, str], output_dict: Dict[str, str]):
+        if input_dict or output_dict:
+            raise ValueError("Input and output options are only supported by the ffmpeg backend.")
+        self._path = path
+        self._capture = cv2.VideoCapture(str(path))
+        if not self._capture.isOpened():
+            raise ValueError(f"Failed to open video for reading: {path}")
+        self.inputwidth = int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.inputheight = int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.outputwidth, self.outputheight = self.inputwidth, self.inputheight
+        self.inputfps = self._capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FRAME_RATE
+        rate = Fraction(self.inputfps).limit_denominator(1001)
+        self.frame_rate = f"{rate.numerator}/{rate.denominator}"
+        self.inputframenum = max(int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        self._decoded = 0
+        self._bgr: Optional[ndarray] = None
+        self._resized: Optional[ndarray] = None
+        # Whether the next frame was already grabbed, to check the seek.
+        self._grabbed = False
+
+    def _start(self):
+        if self.start_frame > 0:
+            # The position read back is the one requested, only the timestamp of the frame landed on tells
+            # whether the seek was accurate.
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            self._grabbed = self._capture.grab()
+            timestamp = 1000.0 * self.start_frame / self.inputfps
+            if not self._grabbed or abs(self._capture.get(cv2.CAP_PROP_POS_MSEC) - timestamp) > 500.0 / self.inputfps:
+                # The container does not support accurate seeking, the earlier frames are skipped instead.
+                self._grabbed = False
+                self._capture.release()
+                self._capture = cv2.VideoCapture(str(self._path))
+                for _ in range(self.start_frame):
+                    if not self._capture.grab():
+                        break
+
+    def _read(self, out: Optional[ndarray] = None) -> Optional[ndarray]:
+        if self._bounded and self._decoded >= self.inputframenum:
+            return None
+        # The intermediate BGR frames are decoded into the same buffers, only the RGB frames are handed out.
+        if self._grabbed:
+            self._grabbed = False
+            success, self._bgr = self._capture.retrieve(self._bgr)
+        else:
+            success, self._bgr = self._capture.read(self._bgr)
+        if not success:
+            return None
+        self._decoded += 1
+        frame = self._bgr
+        if (self.outputwidth, self.outputheight) != (self.inputwidth, self.inputheight):
+            self._resized = cv2.resize(
+                frame,
+                (self.outputwidth, self.outputheight),
+                dst=self._resized,
+                interpolation=cv2.INTER_AREA,
+            )
+            frame = self._resized
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY if self.gray else cv2.COLOR_BGR2RGB, dst=out)
+
+    def _release(self):
+        self._capture.release()
+
+
+class PyAVVideoReader(VideoReader):
+    """
+    Video reader decoding the frames in-process with PyAV, see :class:`VideoReader`.
+    """
+
+    def _open(self, path: Path, input_dict: Dict[str, str], output_dict: Dict[str, str]):
+        if input_dict or output_dict:
+            raise ValueError("Input and output options are only supported by the ffmpeg backend.")
+        av = import_av()
+        self._container = av.open(str(path))
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = "AUTO"
+        self.inputwidth = self._stream.codec_context.width
+        self.inputheight = self._stream.codec_context.height
+        self.outputwidth, self.outputheight = self.inputwidth, self.inputheight
+        rate = self._stream.average_rate or self._stream.guessed_rate or Fraction(DEFAULT_FRAME_RATE)
+        self.inputfps = float(rate)
+        self.frame_rate = f"{rate.numerator}/{rate.denominator}"
+        self.inputframenum = self._stream.frames or 0
+        self._decoder = None
+        self._decoded = 0
+        self._skip_until = None
+
+    def _start(self):
+        if self.start_frame > 0:
+            time_base = self._stream.time_base
+            offset = (self._stream.start_time or 0) * time_base
+            # Half a frame earlier keeps it frame-accurate despite timestamp rounding, as with ffmpeg.
+            self._skip_until = float(offset) + (self.start_frame - 0.5) / self.inputfps
+            self._container.seek(
+                int(self._skip_until / time_base),
+                backward=True,
+                any_frame=False,
+                stream=self._stream,
+            )
+        self._decoder = self._container.decode(self._stream)
+
+    def _read(self, out: Optional[ndarray] = None) -> Optional[ndarray]:
+        if self._bounded and self._decoded >= self.inputframenum:
+            return None
+        for frame in self._decoder:
+            if self._skip_until is not None:
+                if frame.time is not None and frame.time < self._skip_until:
+                    # Decoded from the previous keyframe.
+                    continue
+                self._skip_until = None
+            self._decoded += 1
+            image = frame.reformat(
+                width=self.outputwidth,
+                height=self.outputheight,
+                format="gray" if self.gray else "rgb24",
+                interpolation="AREA",
+            ).to_ndarray()
+            if out is None:
+                return image
+            np.copyto(out, image)
+            return out
+        return None
+
+    def _release(self):
+        self._container.close()
+
+
+READERS = {
+    "ffmpeg": FFmpegVideoReader,
+    "opencv": OpenCVVideoReader,
+    "pyav": PyAVVideoReader,
+}
+
+
+def benchmark_backends(
+        path: Union[str, Path],
+        backends: Optional[List[str]] = None,
+        n_frames: Optional[int] = 300,
+        max_side: Optional[int] = None,
+) -> Dict[str, float]:
+    """
+    Measures the decoding throughput of the backends on a video.
+
+    :param path: The path to the video file.
+    :param backends: Backends to compare, by default the ones available on this host.
+    :param n_frames: Number of frames decoded per backend, by default the whole video if ``None``.
+    :param max_side: Maximum size of the longest side of the frames, as in :class:`VideoReader`.
+    :return: Frames per second of every backend, fastest first.
+    """
+    if backends is None:
+        backends = available_backends()
+    results = {}
+    for backend in backends:
+        start = time.perf_counter()
+        with VideoReader(path=path, end_frame=n_frames, max_side=max_side, backend=backend) as reader:
+            count = sum(1 for _ in reader)
+        results[backend] = count / max(time.perf_counter() - start, 1e-9)
+    return dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+
+
+class FrameBus:
+    """
+    Decodes a video once and dispatches every frame to several consumers, each running in its own thread,
+    e.g. one pose estimation model per person. The frames are shared read-only between the consumers,
+    which copy them before any modification.
+
+    :param reader: The video reader decoding the frames, if it reuses ``buffers``, they must cover the frames queued
+        for, and being processed by, each consumer, i.e. ``queue_size + 2``.
+    :param queue_size: Number of frames buffered per consumer, the slowest consumer sets the pace of the decoding.
+    """
+
+    def __init__(
+            self,
+            reader: VideoReader,
+            queue_size: int = PREFETCH_SIZE,
+    ):
+        buffers = getattr(reader, "buffers", 0)
+        if buffers and buffers < queue_size + 2:
+            raise ValueError(
+                f"The reader reuses its buffers after {buffers} frames, "
+                f"while the consumers hold up to {queue_size + 2} frames."
+            )
+        self.reader = reader
+        self.queue_size = queue_size
+        self.consumers: List[Callable[[int, ndarray], None]] = []
+
+    def register(self, consumer: Callable[[int, ndarray], None]):
+        """
+        Registers a consumer, called with the index and the frame for every frame, in order.
+
+        :param consumer: The consumer.
+        :return:
+        """
+        self.consumers.append(consumer)
+
+    def run(self, desc: str = "Processing", verbose: Union[bool, int] = True):
+        """
+        Decodes the video and feeds the consumers until the end of the video, or until a consumer fails.
+
+        :param desc: Description of the progress bar.
+        :param verbose: Whether to display a progress bar.
+        :return:
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.consumers]
+        errors: List[Optional[BaseException]] = [None] * len(self.consumers)
+
+        def consume(k: int):
+            try:
+                while True:
+                    item = queues[k].get()
+                    if item is None:
+                        return
+                    self.consumers[k](*item)
+            except BaseException as error:
+                errors[k] = error
+                # The other consumers are stopped as well, their results would be incomplete anyway.
+                stop.set()
+
+        def put(k: int, item: Optional[Tuple[int, ndarray]]):
+            while threads[k].is_alive():
+                try:
+                    queues[k].put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        threads = [threading.Thread(target=consume, args=(k,), daemon=True) for k in range(len(self.consumers))]
+        for thread in threads:
+            thread.start()
+        try:
+            for index, frame in enumerate(
+                tqdm(
+                    self.reader,
+                    desc=desc,
+                    initial=self.reader.start_frame,
+                    total=self.reader.start_frame + len(self.reader),
+                    disable=not verbose,
+                ),
+                start=self.reader.start_frame,
+            ):
+                if stop.is_set():
+                    break
+                # The reader may decode into the frame again, only the shared view is read-only.
+                frame = frame.view()
+                frame.flags.writeable = False
+                for k in range(len(self.consumers)):
+                    put(k, (index, frame))
+        finally:
+            for k in range(len(self.consumers)):
+                put(k, None)
+            for thread in threads:
+                thread.join()
+
+        for error in errors:
+            if error is not None:
+                raise error
+
 
 class VideoWriter(FFmpegWriter):
     """
@@ -50,6 +825,8 @@ class VideoWriter(FFmpegWriter):
     :param input_dict: Input options.
     :param output_dict: Output options.
     :param overwrite: Whether to overwrite existing files.
+    :param queue_size: Number of frames buffered for a background thread feeding the encoder, so that encoding
+        overlaps with the drawing of the frames, by default the frames are encoded on demand.
     """
 
     def __init__(
@@ -58,6 +835,7 @@ class VideoWriter(FFmpegWriter):
             input_dict: Optional[Dict[str, str]] = None,
             output_dict: Optional[Dict[str, str]] = None,
             overwrite: bool = False,
+            queue_size: int = 0,
     ):
         path = Path(path)
 
@@ -68,17 +846,83 @@ class VideoWriter(FFmpegWriter):
             else:
                 raise FileExistsError(f"File {path} already exists.")
 
+        self.queue_size = queue_size
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self._ring: List[ndarray] = []
+        self._ring_index = 0
+
         super().__init__(
             filename=str(path),
             inputdict=input_dict,
             outputdict=output_dict,
         )
 
+    def _put(self, image: Optional[ndarray]):
+        # Blocks while the queue is full, unless the encoder failed and will never drain it.
+        while self._error is None:
+            try:
+                self._queue.put(image, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise self._error
+
+    def _encode(self):
+        try:
+            while True:
+                image = self._queue.get()
+                if image is None:
+                    return
+                self.writeFrame(im=image)
+        except BaseException as error:
+            self._error = error
+
     def write(self, image: ndarray):
         """
         Appends an image to the existing video.
 
-        :param image: [H, W, 3] ndarray.
+        :param image: [H, W, 3] ndarray, copied when buffered so that the caller may reuse it.
+        :return:
+        """
+        if not self.queue_size:
+            self.writeFrame(im=image)
+            return
+
+        if self._thread is None:
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._thread = threading.Thread(target=self._encode, daemon=True)
+            self._thread.start()
+        self._put(self._copy(image))
+
+    def _copy(self, image: ndarray) -> ndarray:
+        # The copies go to a ring of buffers, each reused once the frames queued after it are being encoded.
+        if len(self._ring) < self.queue_size + 2:
+            self._ring.append(image.copy())
+            return self._ring[-1]
+        buffer = self._ring[self._ring_index]
+        if buffer.shape != image.shape or buffer.dtype != image.dtype:
+            buffer = self._ring[self._ring_index] = image.copy()
+        else:
+            np.copyto(buffer, image)
+        self._ring_index = (self._ring_index + 1) % len(self._ring)
+        return buffer
+
+    def close(self):
+        """
+        Flushes the buffered frames, if any, and finalizes the video.
+
         :return:
         """
-        self.writeFrame(im=image)
+        if self._thread is not None:
+            try:
+                self._put(None)
+            except BaseException:
+                pass
+            self._thread.join()
+            self._thread = None
+        super().close()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
@@ -0,0 +1,80 @@
+"""cache utilities."""
+
+from typing import Optional, Union
+
+import hashlib
+from pathlib import Path
+
+from psifx.utils.constants import CACHE, CACHE_PATH, CACHE_SIZE
+
+
+def file_key(path: Union[str, Path]) -> str:
+    """
+    Computes a key identifying the current version of a file, from its path, size and modification time.
+
+    :param path: Path to the file.
+    :return: Hexadecimal digest.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    content = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def cache_enabled() -> bool:
+    """
+    Checks whether the persistent caches are enabled, they are unless ``PSIFX_CACHE=0``.
+
+    :return: Whether the persistent caches are enabled.
+    """
+    return CACHE
+
+
+def cache_file(
+    path: Union[str, Path],
+    namespace: str,
+    suffix: str = ".json",
+) -> Path:
+    """
+    Returns the location of the cached data derived from a file, it is invalidated as soon as the file changes.
+
+    :param path: Path to the file.
+    :param namespace: Kind of cached data, e.g. ``tar``.
+    :param suffix: Extension of the cache file.
+    :return: Path to the cache file.
+    """
+    return CACHE_PATH / namespace / f"{file_key(path)}{suffix}"
+
+
+def evict(namespace: str, max_size: Optional[int] = None):
+    """
+    Deletes the oldest cached data of a kind until it fits in the given size.
+
+    :param namespace: Kind of cached data, e.g. ``tar``.
+    :param max_size: Maximum size in bytes, defaults to ``CACHE_SIZE``.
+    :return:
+    """
+    if max_size is None:
+        max_size = CACHE_SIZE
+    entries = []
+    for entry in (CACHE_PATH / namespace).glob("*"):
+        if entry.suffix == ".tmp":
+            # Still being written.
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+    # Most recently written or used first.
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    total_size = 0
+    for _, size, entry in entries:
+        total_size += size
+        if total_size > max_size:
+            try:
+                entry.unlink()
+            except OSError:
+                # Already evicted by another process.
+                pass
@@ -1,7 +1,25 @@
 """Shared runtime constants."""
 
 import os
+from pathlib import Path
+
+from platformdirs import user_cache_dir
 
 
 # Allow overriding the default SAM3 model path without editing source files.
 SAM3_PATH = os.environ.get("SAM3_PATH", "facebook/sam3")
+
+# Location of the persistent caches, e.g. archive indexes.
+CACHE_PATH = Path(os.environ.get("PSIFX_CACHE_PATH", user_cache_dir("psifx")))
+
+# Whether to use the persistent caches at all.
+CACHE = os.environ.get("PSIFX_CACHE", "1").lower() in ("1", "true", "yes")
+
+# Maximum size in bytes of each persistent cache, the oldest entries are evicted beyond it.
+CACHE_SIZE = int(os.environ.get("PSIFX_CACHE_SIZE", 256 * 1024 * 1024))
+
+# Default video decoding backend, one of ``psifx.io.video.BACKENDS``.
+VIDEO_BACKEND = os.environ.get("PSIFX_VIDEO_BACKEND", "ffmpeg")
+
+# Whether to also cache the video probe results on disk, they are always cached in memory.
+PROBE_CACHE = os.environ.get("PSIFX_PROBE_CACHE", "0").lower() in ("1", "true", "yes")
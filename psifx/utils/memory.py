@@ -0,0 +1,63 @@
+"""memory utilities."""
+
+from typing import Optional
+
+import os
+import sys
+import threading
+
+
+def current_rss() -> int:
+    """
+    Measures the resident set size of the process.
+
+    :return: Number of bytes, the peak rather than the current one where it is not available, e.g. on macOS.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+class PeakMemory:
+    """
+    Context manager sampling the resident set size of the process in a background thread, to measure the peak
+    memory usage of a computation.
+
+    :param interval: Number of seconds between the samples.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start: int = 0
+        self.peak: int = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def used(self) -> int:
+        """
+        Number of bytes allocated at the peak, on top of the memory used at the start.
+        """
+        return max(self.peak - self.start, 0)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.peak = max(self.peak, current_rss())
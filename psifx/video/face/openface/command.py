@@ -8,6 +8,8 @@ from pathlib import Path
 
 import torch
 
+from psifx.io import tar
+from psifx.io.mask import mask_tracks
 from psifx.utils.command import Command, register_command
 from psifx.video.face.openface.tool import OpenFaceTool
 from psifx.video.tracking.tool import TrackingTool
@@ -67,7 +69,7 @@ class OpenFaceSingleInferenceCommand(Command):
             "--features",
             type=Path,
             required=True,
-            help="path to the output feature archive, such as ``/path/to/openface.tar.gz``",
+            help="path to the output feature archive, such as ``/path/to/openface.tar.gz``, or columnar ``/path/to/openface.npz``",
         )
         parser.add_argument(
             "--mask",
@@ -80,6 +82,25 @@ class OpenFaceSingleInferenceCommand(Command):
             default="cuda" if torch.cuda.is_available() else "cpu",
             help="device on which to run the inference, either 'cpu' or 'cuda'",
         )
+        parser.add_argument(
+            "--shard_size",
+            type=int,
+            default=None,
+            help="number of frames per shard, to write sharded TAR archives that can be read in parallel",
+        )
+        parser.add_argument(
+            "--resume",
+            default=False,
+            action=argparse.BooleanOptionalAction,
+            help="resume an interrupted inference from the output of OpenFace, skipping the frames already processed",
+        )
+        parser.add_argument(
+            "--max_side",
+            type=int,
+            default=None,
+            help="maximum size of the longest side of the frames given to OpenFace, larger videos are downscaled "
+                 "and the landmarks are mapped back to the original video",
+        )
         parser.add_argument(
             "--overwrite",
             default=False,
@@ -104,6 +125,9 @@ class OpenFaceSingleInferenceCommand(Command):
         """
         if args.mask is None:
             openface_tool = OpenFaceTool(
+                shard_size=args.shard_size,
+                resume=args.resume,
+                max_side=args.max_side,
                 device=args.device,
                 overwrite=args.overwrite,
                 verbose=args.verbose,
@@ -123,16 +147,16 @@ class OpenFaceSingleInferenceCommand(Command):
                     verbose=args.verbose,
                 )
 
-                tracking_tool.visualize(
+                tracking_tool.isolate(
                     video_path=args.video,
-                    mask_paths=args.mask,
-                    visualization_path=tmp_dir / args.mask.name,
-                    blackout=True,
-                    color=False,
-                    labels=False,
+                    mask_paths=[args.mask],
+                    output_paths=[tmp_dir / args.mask.name],
                 )
                 del tracking_tool
                 openface_tool = OpenFaceTool(
+                    shard_size=args.shard_size,
+                    resume=args.resume,
+                    max_side=args.max_side,
                     device=args.device,
                     overwrite=args.overwrite,
                     verbose=args.verbose,
@@ -169,7 +193,7 @@ class OpenFaceMultiInferenceCommand(Command):
             type=Path,
             nargs='+',
             required=True,
-            help="list of path to mask directories or individual .mp4 mask files",
+            help="list of path to mask directories, individual .mp4 mask files or .npz mask archives",
         )
 
         def custom_error(message):
@@ -188,12 +212,38 @@ class OpenFaceMultiInferenceCommand(Command):
             required=True,
             help="path to the output feature directory, such as ``/path/to/openface``",
         )
+        parser.add_argument(
+            "--format",
+            type=str,
+            default="tar.gz",
+            choices=["tar.gz", "npz"],
+            help="format of the output archives, either JSON frames in a ``.tar.gz`` archive or columnar ``.npz`` arrays",
+        )
         parser.add_argument(
             "--device",
             type=str,
             default="cuda" if torch.cuda.is_available() else "cpu",
             help="device on which to run the inference, either 'cpu' or 'cuda'",
         )
+        parser.add_argument(
+            "--shard_size",
+            type=int,
+            default=None,
+            help="number of frames per shard, to write sharded TAR archives that can be read in parallel",
+        )
+        parser.add_argument(
+            "--resume",
+            default=False,
+            action=argparse.BooleanOptionalAction,
+            help="resume an interrupted inference from the output of OpenFace, skipping the frames already processed",
+        )
+        parser.add_argument(
+            "--max_side",
+            type=int,
+            default=None,
+            help="maximum size of the longest side of the frames given to OpenFace, larger videos are downscaled "
+                 "and the landmarks are mapped back to the original video",
+        )
         parser.add_argument(
             "--overwrite",
             default=False,
@@ -217,24 +267,13 @@ class OpenFaceMultiInferenceCommand(Command):
         :return:
         """
 
-        if args.features_dir.exists() and any(args.features_dir.iterdir()):
+        if args.features_dir.exists() and any(args.features_dir.iterdir()) and not args.resume:
             if args.overwrite:
                 print(f"Features directory {args.features_dir} is non-empty")
             else:
                 raise FileExistsError(f"Features directory {args.features_dir} is non-empty")
 
-        mask_files = []
-        for mask in args.masks:
-            if mask.is_dir():
-                dir_files = list(mask.iterdir())
-                non_mp4_files = [str(f) for f in dir_files if not (f.is_file() and f.suffix == '.mp4')]
-                if non_mp4_files:
-                    raise ValueError(f"Directory {mask} contains non-.mp4 files: {non_mp4_files}")
-                mask_files.extend(dir_files)
-            elif mask.is_file() and mask.suffix == '.mp4':
-                mask_files.append(mask)
-            else:
-                raise FileNotFoundError(f"{mask} is not a directory or a .mp4 file")
+        tracks = mask_tracks(args.masks)
 
         tracking_tool = TrackingTool(
             device=args.device,
@@ -243,6 +282,9 @@ class OpenFaceMultiInferenceCommand(Command):
         )
 
         openface_tool = OpenFaceTool(
+            shard_size=args.shard_size,
+            resume=args.resume,
+            max_side=args.max_side,
             device=args.device,
             overwrite=args.overwrite,
             verbose=args.verbose,
@@ -250,18 +292,17 @@ class OpenFaceMultiInferenceCommand(Command):
 
         with tempfile.TemporaryDirectory() as tmp_dir:
             tmp_dir = Path(tmp_dir)
-            for mask in mask_files:
-                tracking_tool.visualize(
-                    video_path=args.video,
-                    mask_paths=[mask],
-                    visualization_path=tmp_dir / mask.name,
-                    blackout=True,
-                    color=False,
-                    labels=False,
-                )
+            # The masked videos of all the people are written while decoding the video once.
+            tracking_tool.isolate(
+                video_path=args.video,
+                mask_paths=[path for _, path, _ in tracks],
+                output_paths=[tmp_dir / f"{name}.mp4" for name, _, _ in tracks],
+                object_ids=[object_id for _, _, object_id in tracks],
+            )
+            for name, _, _ in tracks:
                 openface_tool.inference(
-                    video_path=tmp_dir / mask.name,
-                    features_path=args.features_dir / f"{mask.stem}.tar.gz",
+                    video_path=tmp_dir / f"{name}.mp4",
+                    features_path=args.features_dir / f"{name}.{args.format}",
                 )
         del tracking_tool
         del openface_tool
@@ -291,7 +332,7 @@ class OpenFaceVisualizationCommand(Command):
             type=Path,
             required=True,
             nargs='+',
-            help="list of path to the input feature directories or individual archive ``.tar.gz`` files",
+            help="list of path to the input feature directories or individual archive ``.tar.gz`` or ``.npz`` files",
         )
         parser.add_argument(
             "--visualization",
@@ -353,7 +394,7 @@ class OpenFaceVisualizationCommand(Command):
         """
         feature_files = []
         for features in args.features:
-            if os.path.isdir(features):
+            if os.path.isdir(features) and not tar.is_sharded(features):
                 feature_files += [f for f in features.iterdir()]
             else:
                 feature_files.append(features)
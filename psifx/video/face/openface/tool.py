@@ -2,12 +2,13 @@
 
 from typing import Optional, Union
 
+import io
+import re
 import shlex
 import shutil
 import subprocess
 from pathlib import Path
 from PIL import Image
-import json
 import time
 from tqdm import tqdm
 
@@ -17,7 +18,8 @@ from numpy import ndarray
 
 from psifx.video.face.tool import FaceAnalysisTool
 from psifx.video.face.openface import skeleton, fields
-from psifx.io import tar, video
+from psifx.io import json, npz, tar, video
+from psifx.io.tool import archive_stem
 from psifx.utils import draw
 
 EXECUTABLE_PATH = shutil.which("FeatureExtraction")
@@ -26,6 +28,23 @@ if EXECUTABLE_PATH is not None:
 DEFAULT_OPTIONS = "-2Dfp -3Dfp -pdmparams -pose -aus -gaze -au_static"
 
 
+def read_segment(path: Path, start_frame: int) -> pd.DataFrame:
+    """
+    Reads the features extracted by OpenFace from a segment of the video.
+
+    :param path: The path to the .csv file written by OpenFace.
+    :param start_frame: The index of the first frame of the segment in the video.
+    :return: The features, with the frame numbers of the whole video.
+    """
+    with path.open(mode="rb") as file:
+        data = file.read()
+    # OpenFace writes the rows as it goes, the last one may be cut short by an interruption.
+    data = data[: data.rfind(b"\n") + 1]
+    dataframe = pd.read_csv(io.BytesIO(data))
+    dataframe["frame"] += start_frame
+    return dataframe
+
+
 def gaze_vector_2d(
         eye_2d: ndarray,
         gaze_3d,
@@ -55,12 +74,20 @@ class OpenFaceTool(FaceAnalysisTool):
     """
     OpenFace face analysis tool.
 
+    :param shard_size: Number of frames per shard, to write sharded TAR archives.
+    :param resume: Whether to resume an interrupted inference from the output of OpenFace, kept next to the
+        features archive, skipping the frames already processed.
+    :param max_side: Maximum size of the longest side of the frames given to OpenFace, larger videos are
+        downscaled beforehand and the 2D landmarks are mapped back to pixels of the original video.
     :param overwrite: Whether to overwrite existing files, otherwise raise an error.
     :param verbose: Whether to execute the computation verbosely.
     """
 
     def __init__(
             self,
+            shard_size: Optional[int] = None,
+            resume: bool = False,
+            max_side: Optional[int] = None,
             device: str = "cpu",
             overwrite: bool = False,
             verbose: Union[bool, int] = True,
@@ -72,6 +99,9 @@ class OpenFaceTool(FaceAnalysisTool):
         )
         if self.device != "cpu":
             print("Only CPU support is currently available for OpenFace face analysis tool.")
+        self.shard_size = shard_size
+        self.resume = resume
+        self.max_side = max_side
 
     def inference(
             self,
@@ -81,6 +111,13 @@ class OpenFaceTool(FaceAnalysisTool):
         """
         Implementation of OpenFace's face analysis inference method.
 
+        OpenFace writes its output as it goes, in a temporary directory. When resuming, this directory is kept
+        next to the features archive and OpenFace only processes the segment of the video starting from the
+        first missing frame, whose tracking restarts from there.
+
+        When downscaling, OpenFace runs on a lossless downscaled copy of the video. Its default camera
+        intrinsics scale with the image, so only the 2D landmarks need to be mapped back.
+
         :param video_path: The path to the video file.
         :param features_path: The path to the features archive.
         :return:
@@ -94,110 +131,191 @@ class OpenFaceTool(FaceAnalysisTool):
 
         assert video_path.is_file()
         assert EXECUTABLE_PATH is not None, "OpenFace FeatureExtraction was not found, make sure that OpenFace is installed and added to PATH"
-        tar.TarWriter.check(path=features_path, overwrite=self.overwrite)
-
-        tmp_dir = Path(f"/tmp/TEMP_{time.time()}")
-        tmp_dir.mkdir(parents=True)
 
-        args = f"{EXECUTABLE_PATH} -f {video_path} -out_dir {tmp_dir} {DEFAULT_OPTIONS}"
-
-        if self.verbose:
-            print("OpenFace will run with the following command:")
-            print(f"{args}")
-            print("It might take a while, depending on the number of CPUs.")
-
-        try:
-            for i in tqdm(
-                    range(1),
-                    desc="Processing",
-                    disable=not self.verbose,
-            ):
-                process = subprocess.run(
-                    args=shlex.split(args),
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
+        if self.resume:
+            tmp_dir = features_path.parent / f".{archive_stem(features_path)}.openface"
+            if features_path.exists() and not tmp_dir.exists():
+                print(f"Features already computed at {features_path}, skipping.")
+                return
+        else:
+            tmp_dir = Path(f"/tmp/TEMP_{time.time()}")
+
+        columnar = features_path.suffix == ".npz"
+        if columnar:
+            npz.NPZWriter.check(path=features_path, overwrite=self.overwrite)
+        else:
+            tar.TarWriter.check(path=features_path, overwrite=self.overwrite)
+
+        tmp_dir.mkdir(parents=True, exist_ok=self.resume)
+
+        with video.VideoReader(path=video_path, max_side=self.max_side) as video_reader:
+            size = (video_reader.inputwidth, video_reader.inputheight)
+            scaled_size = (video_reader.outputwidth, video_reader.outputheight)
+
+        # Every run of OpenFace processes a segment of the video, in a directory named after its first frame.
+        segments = []
+        for segment_dir in sorted(path for path in tmp_dir.iterdir() if path.is_dir()):
+            segment = read_segment(segment_dir / f"{segment_dir.name}.csv", start_frame=int(segment_dir.name))
+            if len(segment) > 0:
+                segments.append(segment)
+        start_frame = int(segments[-1]["frame"].iloc[-1]) if segments else 0
+
+        if not (tmp_dir / "done").exists():
+            segment_dir = tmp_dir / f"{start_frame:015d}"
+            shutil.rmtree(segment_dir, ignore_errors=True)
+            segment_dir.mkdir()
+            segment_path = segment_dir / f"{segment_dir.name}{video_path.suffix}"
+            if start_frame == 0 and scaled_size == size:
+                segment_path.symlink_to(video_path.resolve())
+            else:
+                if self.verbose and start_frame > 0:
+                    print(f"Resuming from frame {start_frame}.")
+                segment_path = segment_path.with_suffix(".mkv")
+                with (
+                    video.VideoReader(
+                        path=video_path,
+                        start_frame=start_frame,
+                        max_side=self.max_side,
+                    ) as video_reader,
+                    video.VideoWriter(
+                        path=segment_path,
+                        input_dict={"-r": video_reader.frame_rate},
+                        output_dict={
+                            "-c:v": "libx264",
+                            "-qp": "0",
+                            "-preset": "ultrafast",
+                        },
+                    ) as segment_writer,
+                ):
+                    for image in tqdm(video_reader, desc="Cutting", disable=not self.verbose):
+                        segment_writer.write(image=image)
+
+            args = f"{EXECUTABLE_PATH} -f {segment_path} -out_dir {segment_dir} {DEFAULT_OPTIONS}"
+
+            if self.verbose:
+                print("OpenFace will run with the following command:")
+                print(f"{args}")
+                print("It might take a while, depending on the number of CPUs.")
+
+            try:
+                for i in tqdm(
+                        range(1),
+                        desc="Processing",
+                        disable=not self.verbose,
+                ):
+                    process = subprocess.run(
+                        args=shlex.split(args),
+                        check=True,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        text=True,
+                    )
+                (tmp_dir / "done").touch()
+
+                if self.verbose > 1:
+                    print(process.stdout)
+
+            except subprocess.CalledProcessError as error:
+                print(error.stdout)
+                if self.resume:
+                    raise
+
+            segments.append(read_segment(segment_dir / f"{segment_dir.name}.csv", start_frame=start_frame))
+
+        dirty_dataframe = pd.concat(segments, ignore_index=True)
+        if scaled_size != size:
+            for axis in (0, 1):
+                columns = [
+                    column
+                    for column in dirty_dataframe.columns
+                    if re.fullmatch(rf"(eye_lmk_)?{'xy'[axis]}_\d+", column)
+                ]
+                dirty_dataframe[columns] *= size[axis] / scaled_size[axis]
+
+        edges = {
+            "eye_right_keypoints_2d": skeleton.EYE_EDGES,
+            "eye_left_keypoints_2d": skeleton.EYE_EDGES,
+            "eye_right_keypoints_3d": skeleton.EYE_EDGES,
+            "eye_left_keypoints_3d": skeleton.EYE_EDGES,
+            "face_keypoints_2d": skeleton.FACE_EDGES,
+            "face_keypoints_3d": skeleton.FACE_EDGES,
+        }
+        if columnar:
+            # The columns map directly to arrays, one row per frame.
+            with npz.NPZWriter(path=features_path, overwrite=self.overwrite) as features_writer:
+                features_writer.set(key="edges", value=edges)
+                features_writer.append(
+                    key="frames",
+                    value=dirty_dataframe["frame"].to_numpy(dtype=np.int64) - 1,
                 )
+                for clean, dirty in tqdm(
+                        zip(fields.CLEAN_FIELDS, fields.DIRTY_FIELDS),
+                        desc="Parsing",
+                        total=len(fields.CLEAN_FIELDS),
+                        disable=not self.verbose,
+                ):
+                    features_writer.append(
+                        key=clean,
+                        value=dirty_dataframe[dirty].to_numpy(dtype=np.float32),
+                    )
+            shutil.rmtree(tmp_dir)
+            return
 
-            if self.verbose > 1:
-                print(process.stdout)
-
-        except subprocess.CalledProcessError as error:
-            print(error.stdout)
-
-        dirty_dataframe = pd.read_csv(tmp_dir / (video_path.stem + ".csv"))
-
-        clean_dataframe = pd.DataFrame()
-        clean_dataframe["index"] = dirty_dataframe["frame"] - 1
-        for clean, dirty in zip(fields.CLEAN_FIELDS, fields.DIRTY_FIELDS):
-            clean_dataframe[clean] = dirty_dataframe[dirty].values.tolist()
-
-        n_rows, _ = clean_dataframe.shape
-        features = {
-            "edges": {
-                "eye_right_keypoints_2d": skeleton.EYE_EDGES,
-                "eye_left_keypoints_2d": skeleton.EYE_EDGES,
-                "eye_right_keypoints_3d": skeleton.EYE_EDGES,
-                "eye_left_keypoints_3d": skeleton.EYE_EDGES,
-                "face_keypoints_2d": skeleton.FACE_EDGES,
-                "face_keypoints_3d": skeleton.FACE_EDGES,
-            }
+        indices = dirty_dataframe["frame"].to_numpy() - 1
+        columns = {
+            clean: dirty_dataframe[dirty].to_numpy()
+            for clean, dirty in zip(fields.CLEAN_FIELDS, fields.DIRTY_FIELDS)
         }
-        for i in tqdm(
-                range(n_rows),
-                desc="Parsing",
-                disable=not self.verbose,
-        ):
-            index = clean_dataframe["index"][i]
-            features[f"{index: 015d}"] = {
-                field: np.array(clean_dataframe[field][i]).flatten().tolist()
-                for field in fields.CLEAN_FIELDS
-            }
+        with tar.TarWriter(
+                path=features_path,
+                overwrite=self.overwrite,
+                shard_size=self.shard_size,
+        ) as features_writer:
+            features_writer.add(key="edges.json", value=json.dumps(edges))
+            for i, index in enumerate(
+                    tqdm(
+                        indices,
+                        desc="Parsing",
+                        disable=not self.verbose,
+                    )
+            ):
+                # The rows are serialized directly by the JSON codec.
+                feature = {field: column[i] for field, column in columns.items()}
+                features_writer.add(key=f"{index: 015d}.json", value=json.dumps(feature))
 
         shutil.rmtree(tmp_dir)
 
-        features = {
-            f"{k}.json": json.dumps(v)
-            for k, v in tqdm(
-                features.items(),
-                desc="Encoding",
-                disable=not self.verbose,
-            )
-        }
-        tar.TarWriter.write(
-            dictionary=features,
-            path=features_path,
-            overwrite=self.overwrite,
-            verbose=self.verbose,
-        )
-
     def decode(self, features_path: Union[str, Path]):
-        tar.TarReader.check(path=features_path)
+        """
+        Lazily decodes a feature archive, the features are only parsed when accessed.
+
+        :param features_path: The path to the features archive, either a TAR archive or a columnar .npz file.
+        :return: Mapping from frame number to features, and the edges of every part.
+        """
+        if Path(features_path).suffix == ".npz":
+            reader = npz.NPZReader(features_path)
+            features = reader.frames()
+            edges = reader.edges
+            if edges is None:
+                print("Missing edges, only the landmarks will be drawn.")
+                edges = {key: () for key in features.keys_}
+            edges = {k: tuple(v) for k, v in edges.items()}
+            return features, edges
 
-        features = tar.TarReader.read(
+        reader = tar.TarReader(
             features_path,
             verbose=self.verbose,
         )
+        features = reader.frames(decoder=json.loads)
 
         try:
-            edges = features.pop("edges.json")
-            edges = json.loads(edges)
+            edges = json.loads(reader["edges.json"])
             edges = {k: tuple(v) for k, v in edges.items()}
         except KeyError:
             print("Missing or incorrect edges.json, only the landmarks will be drawn.")
-            pose = next(iter(features.values()))
-            pose = json.loads(pose)
-            edges = {key: () for key, value in pose.items()}
-
-        features = {
-            int(k.replace(".json", "")): json.loads(v)
-            for k, v in tqdm(
-                features.items(),
-                desc="Decoding",
-                disable=not self.verbose,
-            )
-        }
+            feature = next(iter(features.values()))
+            edges = {key: () for key, value in feature.items()}
+
         return features, edges
 
     def visualization(
@@ -245,7 +363,7 @@ class OpenFaceTool(FaceAnalysisTool):
         h, w = None, None
         K, K_inverse = None, None
         with (
-            video.VideoReader(path=video_path) as video_reader,
+            video.VideoReader(path=video_path, prefetch=video.PREFETCH_SIZE) as video_reader,
             video.VideoWriter(
                 path=visualization_path,
                 input_dict={"-r": video_reader.frame_rate},
@@ -255,13 +373,15 @@ class OpenFaceTool(FaceAnalysisTool):
                     "-pix_fmt": "yuv420p",
                 },
                 overwrite=self.overwrite,
+                queue_size=video.PREFETCH_SIZE,
             ) as visualization_writer,
         ):
             for frame_idx, image in enumerate(
                     tqdm(video_reader, desc="Processing", disable=not self.verbose)
             ):
                 h_, w_, _ = image.shape
-                image = Image.fromarray(image.copy())
+                # Converting an RGB array to an image already copies it.
+                image = Image.fromarray(image)
                 if h != h_ or w != w_:
                     h, w = h_, w_
 
@@ -325,3 +445,8 @@ class OpenFaceTool(FaceAnalysisTool):
 
                 image = np.asarray(image)
                 visualization_writer.write(image=image)
+            if self.verbose:
+                print(video_reader.report())
+
+        for features, _ in decoded:
+            features.close()
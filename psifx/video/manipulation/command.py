@@ -1,6 +1,7 @@
 import argparse
 from pathlib import Path
 
+from psifx.io.video import BACKENDS
 from psifx.utils.command import Command, register_command
 from psifx.video.manipulation.tool import ManipulationTool
 
@@ -21,6 +22,7 @@ class ManipulationCommand(Command):
         subparsers = parser.add_subparsers(title="available commands")
 
         register_command(subparsers, "process", ProcessCommand)
+        register_command(subparsers, "benchmark", BenchmarkCommand)
 
     @staticmethod
     def execute(parser: argparse.ArgumentParser, args: argparse.Namespace):
@@ -147,3 +149,70 @@ class ProcessCommand(Command):
             height=args.height,
         )
         del tool
+
+
+class BenchmarkCommand(Command):
+    """
+    Command-line interface for comparing the video decoding backends on a video.
+    """
+
+    @staticmethod
+    def setup(parser: argparse.ArgumentParser):
+        """
+        Sets up the command.
+
+        :param parser: The argument parser.
+        :return:
+        """
+        parser.add_argument(
+            "--video",
+            type=Path,
+            required=True,
+            help="path to the video file, such as ``/path/to/video.mp4`` (or .avi, .mkv, etc.)",
+        )
+        parser.add_argument(
+            "--backends",
+            type=str,
+            nargs="+",
+            default=None,
+            choices=BACKENDS,
+            help="backends to compare, by default the ones available on this host",
+        )
+        parser.add_argument(
+            "--n_frames",
+            type=int,
+            default=300,
+            help="number of frames decoded per backend",
+        )
+        parser.add_argument(
+            "--max_side",
+            type=int,
+            default=None,
+            help="maximum size of the longest side of the decoded frames",
+        )
+        parser.add_argument(
+            "--verbose",
+            default=True,
+            action=argparse.BooleanOptionalAction,
+            help="verbosity of the script",
+        )
+
+    @staticmethod
+    def execute(parser: argparse.ArgumentParser, args: argparse.Namespace):
+        """
+        Executes the command.
+
+        :param parser: The argument parser.
+        :param args: The arguments.
+        :return:
+        """
+        tool = ManipulationTool(
+            verbose=args.verbose,
+        )
+        tool.benchmark(
+            video_path=args.video,
+            backends=args.backends,
+            n_frames=args.n_frames,
+            max_side=args.max_side,
+        )
+        del tool
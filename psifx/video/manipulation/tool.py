@@ -1,10 +1,11 @@
 """Video manipulation tool."""
 
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 
 from pathlib import Path
 import ffmpeg
 
+from psifx.io.video import benchmark_backends
 from psifx.video.tool import VideoTool
 
 
@@ -103,3 +104,30 @@ class ManipulationTool(VideoTool):
         out_video_path.parent.mkdir(parents=True, exist_ok=True)
 
         output.overwrite_output().run(quiet=self.verbose <= 1)
+
+    def benchmark(
+        self,
+        video_path: Union[str, Path],
+        backends: Optional[List[str]] = None,
+        n_frames: Optional[int] = 300,
+        max_side: Optional[int] = None,
+    ) -> Dict[str, float]:
+        """
+        Compares the decoding throughput of the video backends, to pick the fastest one on this host.
+
+        :param video_path: Path to the video.
+        :param backends: Backends to compare, by default the ones available on this host.
+        :param n_frames: Number of frames decoded per backend, by default the whole video if ``None``.
+        :param max_side: Maximum size of the longest side of the decoded frames.
+        :return: Frames per second of every backend, fastest first.
+        """
+        results = benchmark_backends(video_path, backends=backends, n_frames=n_frames, max_side=max_side)
+
+        if self.verbose:
+            print(f"video = {video_path}")
+            print(f"{'backend':<10}{'frames/s':>12}")
+            for backend, fps in results.items():
+                print(f"{backend:<10}{fps:>12.1f}")
+            fastest = next(iter(results))
+            print(f"fastest = {fastest}, set PSIFX_VIDEO_BACKEND={fastest} to use it by default")
+        return results
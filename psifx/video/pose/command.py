@@ -4,6 +4,7 @@ import argparse
 import os
 from pathlib import Path
 
+from psifx.io import tar
 from psifx.utils.command import Command, register_command
 from psifx.video.pose.mediapipe.command import MediaPipeCommand
 from psifx.video.pose.tool import PoseEstimationTool
@@ -63,7 +64,7 @@ class VisualizationCommand(Command):
             type=Path,
             required=True,
             nargs='+',
-            help="list of path to the input pose directories or individual archive ``.tar.gz`` files",
+            help="list of path to the input pose directories or individual archive ``.tar.gz`` or ``.npz`` files",
         )
         parser.add_argument(
             "--visualization",
@@ -102,7 +103,7 @@ class VisualizationCommand(Command):
 
         pose_files = []
         for poses in args.poses:
-            if os.path.isdir(poses):
+            if os.path.isdir(poses) and not tar.is_sharded(poses):
                 pose_files += [f for f in poses.iterdir()]
             else:
                 pose_files.append(poses)
@@ -2,14 +2,13 @@
 
 import argparse
 import sys
-import tempfile
 from pathlib import Path
 
 import torch
 
+from psifx.io.mask import mask_tracks
 from psifx.utils.command import Command, register_command
 from psifx.video.pose.mediapipe.tool import MediaPipePoseEstimationTool
-from psifx.video.tracking.tool import TrackingTool
 
 
 class MediaPipeCommand(Command):
@@ -68,7 +67,7 @@ class MediaPipeSingleInferenceCommand(Command):
             "--poses",
             type=Path,
             required=True,
-            help="path to the output pose archive, such as ``/path/to/poses.tar.gz``",
+            help="path to the output pose archive, such as ``/path/to/poses.tar.gz``, or columnar ``/path/to/poses.npz``",
         )
         parser.add_argument(
             "--mask",
@@ -100,6 +99,31 @@ class MediaPipeSingleInferenceCommand(Command):
             default="cuda" if torch.cuda.is_available() else "cpu",
             help="device on which to run the inference, either 'cpu' or 'cuda'",
         )
+        parser.add_argument(
+            "--shard_size",
+            type=int,
+            default=None,
+            help="number of frames per shard, to write sharded TAR archives that can be read in parallel",
+        )
+        parser.add_argument(
+            "--checkpoint_interval",
+            type=int,
+            default=None,
+            help="number of frames between checkpoints, from which an interrupted inference can be resumed",
+        )
+        parser.add_argument(
+            "--resume",
+            default=False,
+            action=argparse.BooleanOptionalAction,
+            help="resume an interrupted inference from its checkpoint, skipping the poses already computed",
+        )
+        parser.add_argument(
+            "--max_side",
+            type=int,
+            default=None,
+            help="maximum size of the longest side of the frames given to the model, larger videos are downscaled "
+                 "while decoding, the poses remain in pixels of the original video",
+        )
         parser.add_argument(
             "--overwrite",
             default=False,
@@ -123,42 +147,23 @@ class MediaPipeSingleInferenceCommand(Command):
         :return:
         """
 
-        def use_mediapipe(args, video_path):
-            mediapipe_tool = MediaPipePoseEstimationTool(
-                model_complexity=args.model_complexity,
-                smooth=args.smooth,
-                device=args.device,
-                overwrite=args.overwrite,
-                verbose=args.verbose,
-            )
-            mediapipe_tool.inference(
-                video_path=video_path,
-                poses_path=args.poses,
-            )
-            del mediapipe_tool
-
-        if args.mask is None:
-            use_mediapipe(args, args.video)
-        else:
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                tmp_dir = Path(tmp_dir)
-
-                tracking_tool = TrackingTool(
-                    device=args.device,
-                    overwrite=args.overwrite,
-                    verbose=args.verbose,
-                )
-
-                tracking_tool.visualize(
-                    video_path=args.video,
-                    mask_paths=args.mask,
-                    visualization_path=tmp_dir / args.mask.name,
-                    blackout=True,
-                    color=False,
-                    labels=False,
-                )
-                del tracking_tool
-                use_mediapipe(args, tmp_dir / args.mask.name)
+        mediapipe_tool = MediaPipePoseEstimationTool(
+            model_complexity=args.model_complexity,
+            smooth=args.smooth,
+            shard_size=args.shard_size,
+            checkpoint_interval=args.checkpoint_interval,
+            resume=args.resume,
+            max_side=args.max_side,
+            device=args.device,
+            overwrite=args.overwrite,
+            verbose=args.verbose,
+        )
+        mediapipe_tool.inference(
+            video_path=args.video,
+            poses_path=args.poses,
+            mask_path=args.mask,
+        )
+        del mediapipe_tool
 
 
 class MediaPipeMultiInferenceCommand(Command):
@@ -186,12 +191,19 @@ class MediaPipeMultiInferenceCommand(Command):
             required=True,
             help="path to the output pose directory, such as ``/path/to/poses``",
         )
+        parser.add_argument(
+            "--format",
+            type=str,
+            default="tar.gz",
+            choices=["tar.gz", "npz"],
+            help="format of the output archives, either JSON frames in a ``.tar.gz`` archive or columnar ``.npz`` arrays",
+        )
         parser.add_argument(
             "--masks",
             type=Path,
             nargs='+',
             required=True,
-            help="list of path to mask directories or individual .mp4 mask files",
+            help="list of path to mask directories, individual .mp4 mask files or .npz mask archives",
         )
 
         def custom_error(message):
@@ -229,6 +241,31 @@ class MediaPipeMultiInferenceCommand(Command):
             default="cuda" if torch.cuda.is_available() else "cpu",
             help="device on which to run the inference, either 'cpu' or 'cuda'",
         )
+        parser.add_argument(
+            "--shard_size",
+            type=int,
+            default=None,
+            help="number of frames per shard, to write sharded TAR archives that can be read in parallel",
+        )
+        parser.add_argument(
+            "--checkpoint_interval",
+            type=int,
+            default=None,
+            help="number of frames between checkpoints, from which an interrupted inference can be resumed",
+        )
+        parser.add_argument(
+            "--resume",
+            default=False,
+            action=argparse.BooleanOptionalAction,
+            help="resume an interrupted inference from its checkpoint, skipping the poses already computed",
+        )
+        parser.add_argument(
+            "--max_side",
+            type=int,
+            default=None,
+            help="maximum size of the longest side of the frames given to the model, larger videos are downscaled "
+                 "while decoding, the poses remain in pixels of the original video",
+        )
         parser.add_argument(
             "--overwrite",
             default=False,
@@ -252,53 +289,29 @@ class MediaPipeMultiInferenceCommand(Command):
         :return:
         """
 
-        if args.poses_dir.exists() and any(args.poses_dir.iterdir()):
+        if args.poses_dir.exists() and any(args.poses_dir.iterdir()) and not args.resume:
             if args.overwrite:
                 print(f"Poses directory {args.poses_dir} is non-empty")
             else:
                 raise FileExistsError(f"Poses directory {args.poses_dir} is non-empty")
 
-        mask_files = []
-        for mask in args.masks:
-            if mask.is_dir():
-                dir_files = list(mask.iterdir())
-                non_mp4_files = [str(f) for f in dir_files if not (f.is_file() and f.suffix == '.mp4')]
-                if non_mp4_files:
-                    raise ValueError(f"Directory {mask} contains non-.mp4 files: {non_mp4_files}")
-                mask_files.extend(dir_files)
-            elif mask.is_file() and mask.suffix == '.mp4':
-                mask_files.append(mask)
-            else:
-                raise FileNotFoundError(f"{mask} is not a directory or a .mp4 file")
-
-        tracking_tool = TrackingTool(
-            device=args.device,
-            overwrite=args.overwrite,
-            verbose=args.verbose,
-        )
+        tracks = mask_tracks(args.masks)
 
         mediapipe_tool = MediaPipePoseEstimationTool(
             model_complexity=args.model_complexity,
             smooth=args.smooth,
+            shard_size=args.shard_size,
+            checkpoint_interval=args.checkpoint_interval,
+            resume=args.resume,
+            max_side=args.max_side,
             device=args.device,
             overwrite=args.overwrite,
             verbose=args.verbose,
         )
-
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            tmp_dir = Path(tmp_dir)
-            for mask in mask_files:
-                tracking_tool.visualize(
-                    video_path=args.video,
-                    mask_paths=[mask],
-                    visualization_path=tmp_dir / mask.name,
-                    blackout=True,
-                    color=False,
-                    labels=False,
-                )
-                mediapipe_tool.inference(
-                    video_path=tmp_dir / mask.name,
-                    poses_path=args.poses_dir / f"{mask.stem}.tar.gz",
-                )
-        del tracking_tool
+        mediapipe_tool.multi_inference(
+            video_path=args.video,
+            poses_paths=[args.poses_dir / f"{name}.{args.format}" for name, _, _ in tracks],
+            mask_paths=[path for _, path, _ in tracks],
+            object_ids=[object_id for _, _, object_id in tracks],
+        )
         del mediapipe_tool
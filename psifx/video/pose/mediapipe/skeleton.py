@@ -7,11 +7,12 @@ from mediapipe.python.solutions.holistic import (
     HAND_CONNECTIONS,
     FACEMESH_TESSELATION,
 )
-from mediapipe.python.solutions.face_mesh import FACEMESH_NUM_LANDMARKS
+from mediapipe.python.solutions.face_mesh import FACEMESH_NUM_LANDMARKS_WITH_IRISES
 
 
 N_POSE_LANDMARKS = len([p.value for p in PoseLandmark])
-N_FACE_LANDMARKS = FACEMESH_NUM_LANDMARKS
+# The face landmarks are refined, which adds the irises.
+N_FACE_LANDMARKS = FACEMESH_NUM_LANDMARKS_WITH_IRISES
 N_LEFT_HAND_LANDMARKS = len([p.value for p in HandLandmark])
 N_RIGHT_HAND_LANDMARKS = len([p.value for p in HandLandmark])
 
@@ -1,17 +1,22 @@
 """MediaPipe pose estimation tool."""
 
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import json
+import shutil
+from contextlib import ExitStack, closing
+from functools import partial
 from pathlib import Path
-from tqdm import tqdm
 
 import numpy as np
 from mediapipe.python.solutions.holistic import Holistic
 
 from psifx.video.pose.tool import PoseEstimationTool
 from psifx.video.pose.mediapipe import skeleton
-from psifx.io import tar, video
+from psifx.io import json, npz, tar, video
+from psifx.io.mask import read_track
+from psifx.io.tool import checkpoint_path, convert_archive
+
+DEFAULT_CHECKPOINT_INTERVAL = 1000
 
 
 class MediaPipePoseEstimationTool(PoseEstimationTool):
@@ -20,6 +25,11 @@ class MediaPipePoseEstimationTool(PoseEstimationTool):
 
     :param model_complexity: Complexity of the model: {0, 1, 2}, higher means more FLOPs, but also more accurate results
     :param smooth: Whether to temporally smooth the inference results to reduce the jitter.
+    :param shard_size: Number of frames per shard, to write sharded TAR archives.
+    :param checkpoint_interval: Number of frames between checkpoints, by default no checkpoint is written.
+    :param resume: Whether to resume from the checkpoint of an interrupted run, skipping the frames already processed.
+    :param max_side: Maximum size of the longest side of the frames given to the model, which are downscaled
+        while decoding if needed, the keypoints are still expressed in pixels of the original video.
     :param device: The device where the computation should be executed.
     :param overwrite: Whether to overwrite existing files, otherwise raise an error.
     :param verbose: Whether to execute the computation verbosely.
@@ -29,6 +39,10 @@ class MediaPipePoseEstimationTool(PoseEstimationTool):
         self,
         model_complexity: int = 2,
         smooth: bool = True,
+        shard_size: Optional[int] = None,
+        checkpoint_interval: Optional[int] = None,
+        resume: bool = False,
+        max_side: Optional[int] = None,
         device: str = "cpu",
         overwrite: bool = False,
         verbose: Union[bool, int] = True,
@@ -43,20 +57,26 @@ class MediaPipePoseEstimationTool(PoseEstimationTool):
             print("Only CPU support is currently available for MediaPipe pose estimation tool.")
         self.model_complexity = model_complexity
         self.smooth = smooth
+        self.shard_size = shard_size
+        if resume and checkpoint_interval is None:
+            checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        self.max_side = max_side
 
     def process_part(
         self,
         landmarks,
         size: Tuple[int, int],
         n_points: int,
-    ) -> List[float]:
+    ) -> np.ndarray:
         """
-        Processes MediaPipe output into a simple flattened list of coordinates.
+        Processes MediaPipe output into an array of coordinates.
 
         :param landmarks: MediaPipe landmarks.
         :param size: Image resolution.
         :param n_points: Expected number of points.
-        :return: Processed keypoint coordinates.
+        :return: [n_points, 3] processed keypoint coordinates.
         """
         h, w = size
         if landmarks is not None:
@@ -66,13 +86,13 @@ class MediaPipePoseEstimationTool(PoseEstimationTool):
             points[:, 1] *= h - 1
         else:
             points = np.zeros((n_points, 3), dtype=np.float32)
-        return points.flatten().tolist()
+        return points
 
     def process_pose(
         self,
         results,
         size: Tuple[int, int],
-    ) -> Dict[str, Any]:
+    ) -> Dict[str, np.ndarray]:
         """
         Process all the parts estimated by MediaPipe, e.g. body, face, hands.
 
@@ -99,7 +119,7 @@ class MediaPipePoseEstimationTool(PoseEstimationTool):
             "hand_right_keypoints_2d": self.process_part(
                 landmarks=results.right_hand_landmarks,
                 size=size,
-                n_points=skeleton.N_LEFT_HAND_LANDMARKS,
+                n_points=skeleton.N_RIGHT_HAND_LANDMARKS,
             ),
         }
 
@@ -107,70 +127,237 @@ class MediaPipePoseEstimationTool(PoseEstimationTool):
         self,
         video_path: Union[str, Path],
         poses_path: Union[str, Path],
+        mask_path: Optional[Union[str, Path]] = None,
     ):
         """
         Runs MediaPipe pose estimation model on a video.
 
         :param video_path: Path to the video file.
         :param poses_path: Path to the pose archive.
+        :param mask_path: Path to a .mp4 mask, to only estimate the pose of the masked person, the rest of the
+            frames being blacked out.
+        :return:
+        """
+        self.multi_inference(
+            video_path=video_path,
+            poses_paths=[poses_path],
+            mask_paths=None if mask_path is None else [mask_path],
+        )
+
+    def multi_inference(
+        self,
+        video_path: Union[str, Path],
+        poses_paths: List[Union[str, Path]],
+        mask_paths: Optional[List[Union[str, Path]]] = None,
+        object_ids: Optional[List[Optional[int]]] = None,
+    ):
+        """
+        Runs MediaPipe pose estimation model on a video, for several people isolated by their masks.
+
+        The video is decoded once, and every frame is dispatched to one model per person, each running in its own
+        thread.
+
+        With checkpoints, the poses are written to a sharded TAR archive, completed every ``checkpoint_interval``
+        frames, and converted into the pose archive at the end. A sharded pose archive is its own checkpoint.
+        When resuming, the video is decoded from the first frame missing from the checkpoints; the temporal
+        smoothing restarts from there.
+
+        :param video_path: Path to the video file.
+        :param poses_paths: Paths to the pose archives, one per person.
+        :param mask_paths: Paths to the .mp4 masks or .npz mask archives, one per person, by default the whole
+            frames are used.
+        :param object_ids: Identifiers of the people in the mask archives, ``None`` for the .mp4 masks.
         :return:
         """
         video_path = Path(video_path)
-        poses_path = Path(poses_path)
+        poses_paths = [Path(path) for path in poses_paths]
+        if mask_paths is None:
+            mask_paths = [None] * len(poses_paths)
+        mask_paths = [None if path is None else Path(path) for path in mask_paths]
+        if object_ids is None:
+            object_ids = [None] * len(mask_paths)
+        if not len(mask_paths) == len(poses_paths) == len(object_ids):
+            raise ValueError(f"Expected one mask per pose archive, got {len(mask_paths)} masks and {len(poses_paths)} archives")
 
         if self.verbose:
             print(f"video   =   {video_path}")
-            print(f"poses   =   {poses_path}")
+            for poses_path, mask_path in zip(poses_paths, mask_paths):
+                print(f"poses   =   {poses_path}")
+                if mask_path is not None:
+                    print(f"mask    =   {mask_path}")
 
-        tar.TarWriter.check(path=poses_path, overwrite=self.overwrite)
-
-        poses = {
-            "edges": {
-                "pose_keypoints_2d": skeleton.POSE_EDGES,
-                "face_keypoints_2d": skeleton.FACE_EDGES,
-                "hand_left_keypoints_2d": skeleton.LEFT_HAND_EDGES,
-                "hand_right_keypoints_2d": skeleton.RIGHT_HAND_EDGES,
-            }
+        edges = {
+            "pose_keypoints_2d": skeleton.POSE_EDGES,
+            "face_keypoints_2d": skeleton.FACE_EDGES,
+            "hand_left_keypoints_2d": skeleton.LEFT_HAND_EDGES,
+            "hand_right_keypoints_2d": skeleton.RIGHT_HAND_EDGES,
         }
 
-        # We have to instantiate the model for every call, because of internal states.
-        # Not that it is very costly anyway.
-        with (
-            Holistic(
-                static_image_mode=False,
-                model_complexity=self.model_complexity,
-                smooth_landmarks=self.smooth,
-                enable_segmentation=False,
-                smooth_segmentation=False,
-                refine_face_landmarks=True,
-            ) as model,
-            video.VideoReader(path=video_path) as video_reader,
-        ):
-            for i, image in enumerate(
-                tqdm(
-                    video_reader,
-                    desc="Processing",
-                    disable=not self.verbose,
+        people = []
+        with ExitStack() as stack:
+            for poses_path, mask_path, object_id in zip(poses_paths, mask_paths, object_ids):
+                opened = self.open_writer(poses_path)
+                if opened is None:
+                    continue
+                poses_writer, checkpoint = opened
+                stack.enter_context(poses_writer)
+                start_frame = poses_writer.next_frame if checkpoint is not None else 0
+                if self.verbose and start_frame > 0:
+                    print(f"Resuming {poses_path} from frame {start_frame}.")
+                # Frames are encoded and archived on the fly to keep the memory footprint flat.
+                if isinstance(poses_writer, npz.NPZWriter):
+                    poses_writer.set(key="edges", value=edges)
+                else:
+                    poses_writer.add(key="edges.json", value=json.dumps(edges))
+                people.append(
+                    {
+                        "poses_path": poses_path,
+                        "mask_path": mask_path,
+                        "object_id": object_id,
+                        "writer": poses_writer,
+                        "checkpoint": checkpoint,
+                        "start_frame": start_frame,
+                    }
                 )
-            ):
-                h, w, _ = image.shape
-                results = model.process(image)
-                poses[f"{i: 015d}"] = self.process_pose(
-                    results=results,
-                    size=(h, w),
+            if not people:
+                return
+
+            start_frame = min(person["start_frame"] for person in people)
+            video_reader = stack.enter_context(
+                video.VideoReader(
+                    path=video_path,
+                    start_frame=start_frame,
+                    max_side=self.max_side,
+                    prefetch=video.PREFETCH_SIZE,
                 )
+            )
+            bus = video.FrameBus(video_reader)
+            for person in people:
+                # We have to instantiate one model per person, because of internal states.
+                # Not that it is very costly anyway.
+                person["model"] = stack.enter_context(
+                    Holistic(
+                        static_image_mode=False,
+                        model_complexity=self.model_complexity,
+                        smooth_landmarks=self.smooth,
+                        enable_segmentation=False,
+                        smooth_segmentation=False,
+                        refine_face_landmarks=True,
+                    )
+                )
+                person["mask_reader"] = None
+                if person["mask_path"] is not None:
+                    person["mask_reader"] = stack.enter_context(
+                        closing(
+                            read_track(
+                                path=person["mask_path"],
+                                object_id=person["object_id"],
+                                start_frame=start_frame,
+                                max_side=self.max_side,
+                            )
+                        )
+                    )
+                bus.register(
+                    partial(
+                        self.process_frame,
+                        person,
+                        (video_reader.inputheight, video_reader.inputwidth),
+                    )
+                )
+            bus.run(desc="Processing", verbose=self.verbose)
+            if self.verbose:
+                print(video_reader.report())
 
-        poses = {
-            f"{k}.json": json.dumps(v)
-            for k, v in tqdm(
-                poses.items(),
-                desc="Encoding",
-                disable=not self.verbose,
+        for person in people:
+            checkpoint = person["checkpoint"]
+            if checkpoint is not None and checkpoint != person["poses_path"]:
+                convert_archive(
+                    input_path=checkpoint,
+                    output_path=person["poses_path"],
+                    overwrite=self.overwrite,
+                )
+                shutil.rmtree(checkpoint)
+
+    def open_writer(
+        self,
+        poses_path: Path,
+    ) -> Optional[Tuple[Union[npz.NPZWriter, tar.TarWriter, tar.ShardedTarWriter], Optional[Path]]]:
+        """
+        Opens the writer of a pose archive, or of its checkpoint.
+
+        :param poses_path: Path to the pose archive.
+        :return: The writer and the checkpoint, if any, ``None`` if the poses are already computed.
+        """
+        columnar = poses_path.suffix == ".npz"
+        checkpointed = self.checkpoint_interval is not None
+        sharded = not columnar and self.shard_size is not None
+        if checkpointed and sharded:
+            checkpoint = poses_path
+        elif checkpointed:
+            checkpoint = checkpoint_path(poses_path)
+        else:
+            checkpoint = None
+
+        if self.resume and poses_path.exists():
+            if checkpoint == poses_path:
+                complete = tar.is_sharded(poses_path) and tar.load_manifest(poses_path)["complete"]
+            else:
+                complete = not checkpoint.exists()
+            if complete:
+                print(f"Poses already computed at {poses_path}, skipping.")
+                return None
+
+        if columnar:
+            npz.NPZWriter.check(path=poses_path, overwrite=self.overwrite)
+        elif checkpoint != poses_path or not self.resume:
+            tar.TarWriter.check(path=poses_path, overwrite=self.overwrite)
+
+        if checkpoint is not None:
+            poses_writer = tar.ShardedTarWriter(
+                path=checkpoint,
+                overwrite=self.overwrite or not self.resume,
+                shard_size=self.shard_size if sharded else self.checkpoint_interval,
+                resume=self.resume,
             )
-        }
-        tar.TarWriter.write(
-            dictionary=poses,
-            path=poses_path,
-            overwrite=self.overwrite,
-            verbose=self.verbose,
-        )
+        elif columnar:
+            poses_writer = npz.NPZWriter(path=poses_path, overwrite=self.overwrite)
+        else:
+            poses_writer = tar.TarWriter(path=poses_path, overwrite=self.overwrite, shard_size=self.shard_size)
+        return poses_writer, checkpoint
+
+    def process_frame(
+        self,
+        person: Dict[str, Any],
+        size: Tuple[int, int],
+        index: int,
+        image: np.ndarray,
+    ):
+        """
+        Estimates and archives the pose of a person in a frame.
+
+        :param person: State of the person: model, writer, mask reader and first frame to process.
+        :param size: Original resolution of the video.
+        :param index: Index of the frame.
+        :param image: [H, W, 3] read-only frame.
+        :return:
+        """
+        if person["mask_reader"] is not None:
+            # The mask is read even for the frames already processed, to keep it in sync with the video.
+            mask = next(person["mask_reader"], None)
+        if index < person["start_frame"]:
+            return
+        if person["mask_reader"] is not None:
+            if mask is None:
+                image = np.zeros_like(image)
+            else:
+                image = np.where(mask[..., None], image, np.uint8(0))
+
+        results = person["model"].process(image)
+        # MediaPipe's landmarks are normalized, they are mapped to the original resolution.
+        pose = self.process_pose(results=results, size=size)
+        poses_writer = person["writer"]
+        if isinstance(poses_writer, npz.NPZWriter):
+            poses_writer.add_frame(frame=index, values=pose)
+        else:
+            pose = {key: value.reshape(-1) for key, value in pose.items()}
+            poses_writer.add(key=f"{index: 015d}.json", value=json.dumps(pose))
@@ -2,7 +2,6 @@
 
 from typing import Union
 
-import json
 from pathlib import Path
 from PIL import Image
 from tqdm import tqdm
@@ -11,7 +10,7 @@ import numpy as np
 
 from psifx.video.tool import VideoTool
 from psifx.utils import draw
-from psifx.io import tar, video
+from psifx.io import json, npz, tar, video
 
 
 class PoseEstimationTool(VideoTool):
@@ -58,32 +57,38 @@ class PoseEstimationTool(VideoTool):
 
         raise NotImplementedError
 
-    def decode(self, poses_path : Union[str, Path]):
-        tar.TarReader.check(path=poses_path)
+    def decode(self, poses_path: Union[str, Path]):
+        """
+        Lazily decodes a pose archive, the poses are only parsed when accessed.
+
+        :param poses_path: Path to the pose archive, either a TAR archive or a columnar .npz file.
+        :return: Mapping from frame number to pose, and the edges of every part.
+        """
+        if Path(poses_path).suffix == ".npz":
+            reader = npz.NPZReader(poses_path)
+            poses = reader.frames()
+            edges = reader.edges
+            if edges is None:
+                print("Missing edges, only the landmarks will be drawn.")
+                edges = {key: () for key in poses.keys_}
+            edges = {k: tuple(tuple(edge) for edge in v) for k, v in edges.items()}
+            return poses, edges
 
-        poses = tar.TarReader.read(
+        reader = tar.TarReader(
             poses_path,
             verbose=self.verbose,
         )
+        poses = reader.frames(decoder=json.loads)
         try:
-            edges = poses.pop("edges.json")
-            edges = json.loads(edges)
+            edges = json.loads(reader["edges.json"])
             edges = {k: tuple(tuple(edge) for edge in v) for k, v in edges.items()}
         except (KeyError, ValueError, TypeError):
             print("Missing or incorrect edges.json, only the landmarks will be drawn.")
             pose = next(iter(poses.values()))
-            pose = json.loads(pose)
             edges = {key: () for key, value in pose.items()}
 
-        poses = {
-            int(k.replace(".json", "")): json.loads(v)
-            for k, v in tqdm(
-                poses.items(),
-                desc="Decoding",
-                disable=not self.verbose,
-            )
-        }
         return poses, edges
+
     def visualization(
         self,
         video_path: Union[str, Path],
@@ -117,7 +122,7 @@ class PoseEstimationTool(VideoTool):
         decoded = [self.decode(pose) for pose in poses_path]
 
         with (
-            video.VideoReader(path=video_path) as video_reader,
+            video.VideoReader(path=video_path, prefetch=video.PREFETCH_SIZE) as video_reader,
             video.VideoWriter(
                 path=visualization_path,
                 input_dict={"-r": video_reader.frame_rate},
@@ -127,13 +132,15 @@ class PoseEstimationTool(VideoTool):
                     "-pix_fmt": "yuv420p",
                 },
                 overwrite=self.overwrite,
+                queue_size=video.PREFETCH_SIZE,
             ) as visualization_writer,
         ):
 
             for frame_idx, image in enumerate(
                     tqdm(video_reader, desc="Processing", disable=not self.verbose)
             ):
-                image = Image.fromarray(image.copy())
+                # Converting an RGB array to an image already copies it.
+                image = Image.fromarray(image)
                 for poses, edges in decoded:
                     pose = poses[frame_idx]
                     for key, value in pose.items():
@@ -151,4 +158,9 @@ class PoseEstimationTool(VideoTool):
                         )
                         # Single color for face? Ellipse with image relative thickness?
                 image = np.asarray(image)
-                visualization_writer.write(image=image)
\ No newline at end of file
+                visualization_writer.write(image=image)
+            if self.verbose:
+                print(video_reader.report())
+
+        for poses, _ in decoded:
+            poses.close()
@@ -1,7 +1,6 @@
 """tracking command-line interface."""
 
 import argparse
-import os
 from pathlib import Path
 
 from psifx.utils.command import Command, register_command
@@ -65,7 +64,7 @@ class VisualizationTrackingCommand(Command):
             type=Path,
             nargs='+',
             required=True,
-            help="list of path to mask directories or individual .mp4 mask files",
+            help="list of path to mask directories, individual .mp4 mask files or .npz mask archives",
         )
 
         parser.add_argument(
@@ -132,16 +131,9 @@ class VisualizationTrackingCommand(Command):
             verbose=args.verbose,
         )
 
-        mask_files = []
-        for masks in args.masks:
-            if os.path.isdir(masks):
-                mask_files += [f for f in masks.iterdir()]
-            else:
-                mask_files.append(masks)
-
         tool.visualize(
             video_path=args.video,
-            mask_paths=mask_files,
+            mask_paths=args.masks,
             visualization_path=args.visualization,
             blackout=args.blackout,
             color=args.color,
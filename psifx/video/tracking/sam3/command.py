@@ -87,6 +87,40 @@ class Sam3InferenceCommand(Command):
             default=0.3,
             help="IoU threshold for stitching chunks together (0.0 to 1.0)",
         )
+        parser.add_argument(
+            "--max_side",
+            type=int,
+            default=None,
+            help="maximum size of the longest side of the frames given to the model, larger videos are downscaled "
+                 "and the masks are upscaled back to the original resolution",
+        )
+        parser.add_argument(
+            "--mask_format",
+            type=str,
+            default="mp4",
+            choices=["mp4", "npz"],
+            help="format of the output masks, either one ``.mp4`` video per object or a single run-length encoded "
+                 "``masks.npz`` archive",
+        )
+        parser.add_argument(
+            "--memory_budget",
+            type=float,
+            default=None,
+            help="maximum memory of the process in GB, the chunks are then resized on the fly to fit in it, "
+                 "--chunk_size being the largest",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=False,
+            action=argparse.BooleanOptionalAction,
+            help="save the masks and the tracking state after every chunk, so that an interrupted inference can be resumed",
+        )
+        parser.add_argument(
+            "--resume",
+            default=False,
+            action=argparse.BooleanOptionalAction,
+            help="resume an interrupted inference from its checkpoint in the mask directory, implies --checkpoint",
+        )
         parser.add_argument(
             "--device",
             type=str,
@@ -131,6 +165,8 @@ class Sam3InferenceCommand(Command):
             device=args.device,
             model_path=args.model_path,
             api_token=args.api_token,
+            checkpoint=args.checkpoint,
+            resume=args.resume,
             overwrite=args.overwrite,
             verbose=args.verbose,
         )
@@ -140,5 +176,8 @@ class Sam3InferenceCommand(Command):
             text_prompt=args.text_prompt,
             chunk_size=args.chunk_size,
             iou_threshold=args.iou_threshold,
+            max_side=args.max_side,
+            mask_format=args.mask_format,
+            memory_budget=args.memory_budget,
         )
         del tool
@@ -1,28 +1,139 @@
 """sam3 tracking tool."""
 
-from collections import deque
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 import os
+import shutil
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import cv2
 import numpy as np
 import torch
 from PIL import Image
+from scipy.optimize import linear_sum_assignment
 from transformers import Sam3VideoModel, Sam3VideoProcessor
 
-from psifx.io.video import VideoReader, VideoWriter
+from psifx.io import json
+from psifx.io.mask import (
+    MaskReader,
+    MaskTrackWriter,
+    MaskWriter,
+    RunLengthMask,
+    concat_tracks,
+    iou_matrix,
+    read_track_index,
+)
+from psifx.io.video import VideoReader, scaled_size
+from psifx.utils.memory import PeakMemory, current_rss
 from psifx.utils.constants import SAM3_PATH
 from psifx.video.tracking.tool import TrackingTool
 
+MASK_FORMATS = ["mp4", "npz"]
+# Hidden directory of the checkpoint, inside the mask directory.
+CHECKPOINT_DIR = ".checkpoint"
+CHECKPOINT_VERSION = 2
+# Resolution of the frames given to the model, and of its mask logits.
+SAM3_IMAGE_SIZE = 1008
+SAM3_MASK_SIZE = 288
+# Fraction of the memory budget kept free, for the estimation errors.
+MEMORY_MARGIN = 0.1
+
+
+def estimate_frame_memory(width: int, height: int, num_objects: int, dtype_size: int = 4) -> int:
+    """
+    Estimates the memory used by every frame of a SAM3 video session: the decoded frame, its resized copy given to
+    the model, and the mask logits of every tracked object.
+
+    :param width: Width of the frames.
+    :param height: Height of the frames.
+    :param num_objects: Number of tracked objects.
+    :param dtype_size: Number of bytes per value of the model.
+    :return: Number of bytes.
+    """
+    frame = 3 * width * height + 3 * SAM3_IMAGE_SIZE ** 2 * dtype_size
+    return frame + num_objects * SAM3_MASK_SIZE ** 2 * 4
+
+
+class ChunkSizer:
+    """
+    Adapts the number of frames per chunk to a memory budget. The memory per frame is first estimated from the
+    resolution and the number of objects, then corrected by the peak memory measured while processing every chunk.
+
+    :param budget: Maximum resident set size of the process, in bytes.
+    :param max_chunk_size: Maximum number of frames per chunk.
+    :param frame_size: Width and height of the frames given to the model.
+    :param dtype_size: Number of bytes per value of the model.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        max_chunk_size: int,
+        frame_size: Tuple[int, int],
+        dtype_size: int = 4,
+    ):
+        self.budget = budget
+        self.max_chunk_size = max_chunk_size
+        self.width, self.height = frame_size
+        self.dtype_size = dtype_size
+        self.num_objects = 1
+        self.correction = 1.0
+        self.chunk_size = self._fit(current_rss())
+
+    def _fit(self, rss: int) -> int:
+        per_frame = self.correction * estimate_frame_memory(self.width, self.height, self.num_objects, self.dtype_size)
+        available = (self.budget - rss) * (1.0 - MEMORY_MARGIN)
+        return int(min(max(available // per_frame, 1), self.max_chunk_size))
+
+    def next_size(self) -> int:
+        """
+        Gives the number of frames of the next chunk.
+
+        :return: The chunk size.
+        """
+        return self.chunk_size
+
+    def update(self, num_frames: int, num_objects: int, peak: PeakMemory):
+        """
+        Corrects the estimate with the memory measured while processing a chunk, and resizes the next chunks.
+        A chunk at most doubles, since the estimate is extrapolated from the previous one, and the correction at
+        most halves, since the memory freed after a chunk is often kept by the allocator and reused silently.
+
+        :param num_frames: Number of frames of the chunk.
+        :param num_objects: Number of objects tracked in the chunk.
+        :param peak: Memory measured while processing the chunk.
+        :return:
+        """
+        estimated = num_frames * estimate_frame_memory(self.width, self.height, num_objects, self.dtype_size)
+        self.correction = max(peak.used / estimated, self.correction / 2)
+        self.num_objects = max(num_objects, 1)
+        self.chunk_size = min(self._fit(peak.start), 2 * num_frames)
+
 
 class Sam3TrackingTool(TrackingTool):
+    """
+    SAM3 tracking tool.
+
+    :param device: Device on which to run the inference, either 'cpu' or 'cuda'.
+    :param model_path: SAM3 model id or local path.
+    :param api_token: Hugging Face token, by default the ``HF_TOKEN`` environment variable.
+    :param checkpoint: Whether to write a checkpoint after every chunk, from which an interrupted inference can be
+        resumed, the masks are then written chunk by chunk and assembled at the end.
+    :param resume: Whether to resume an interrupted inference from its checkpoint, skipping the chunks already
+        processed, implies ``checkpoint``.
+    :param overwrite: Whether to overwrite existing files, otherwise raises an error.
+    :param verbose: Whether to execute the computation verbosely.
+    """
+
     def __init__(
         self,
         device: str = "cpu",
         model_path: str = SAM3_PATH,
         api_token: str = None,
+        checkpoint: bool = False,
+        resume: bool = False,
         overwrite: bool = False,
         verbose: Union[bool, int] = True,
     ):
@@ -31,6 +142,8 @@ class Sam3TrackingTool(TrackingTool):
             overwrite=overwrite,
             verbose=verbose,
         )
+        self.checkpoint = checkpoint or resume
+        self.resume = resume
         self.compute_dtype = torch.bfloat16 if self.device == "cuda" else torch.float32
         self.model_path = model_path
         self.api_token = api_token or os.environ.get("HF_TOKEN")
@@ -60,6 +173,9 @@ class Sam3TrackingTool(TrackingTool):
         text_prompt: str = "people",
         chunk_size: int = 300,
         iou_threshold: float = 0.3,
+        max_side: Optional[int] = None,
+        mask_format: str = "mp4",
+        memory_budget: Optional[float] = None,
     ):
         """
         Perform text-based segmentation and tracking from a video file.
@@ -69,12 +185,41 @@ class Sam3TrackingTool(TrackingTool):
         :param text_prompt: Text description of objects to track.
         :param chunk_size: Number of frames to process at once.
         :param iou_threshold: IoU threshold for stitching chunks together.
+        :param max_side: Maximum size of the longest side of the frames given to the model, larger frames are
+            downscaled and the masks are upscaled back to the original resolution.
+        :param mask_format: Format of the masks, either one ``.mp4`` video per object, or ``npz`` for a single
+            run-length encoded ``masks.npz`` archive, see :class:`psifx.io.mask.MaskWriter`.
+        :param memory_budget: Maximum memory of the process in GB, the chunks are then resized after every chunk to
+            fit in it, ``chunk_size`` being the largest.
         """
         if chunk_size <= 0:
             raise ValueError(f"chunk_size must be > 0, got {chunk_size}.")
+        if mask_format not in MASK_FORMATS:
+            raise ValueError(f"mask_format must be one of {MASK_FORMATS}, got {mask_format}.")
+        if memory_budget is not None and memory_budget <= 0:
+            raise ValueError(f"memory_budget must be > 0, got {memory_budget}.")
 
         mask_dir = Path(mask_dir)
-        if mask_dir.exists() and any(mask_dir.iterdir()):
+        checkpoint_dir = mask_dir / CHECKPOINT_DIR
+        state = None
+        if self.checkpoint and checkpoint_dir.exists():
+            if (checkpoint_dir / "state.json").exists():
+                if self.resume:
+                    state = json.loads((checkpoint_dir / "state.json").read_bytes())
+            else:
+                # Left by an inference interrupted before its first checkpoint, there is nothing to resume.
+                shutil.rmtree(checkpoint_dir)
+        if self.resume and state is None and mask_dir.exists() and any(mask_dir.iterdir()):
+            if self._masks_complete(video_path, mask_dir):
+                print(f"Masks already computed in {mask_dir}.")
+                return
+            if not self.overwrite:
+                raise FileExistsError(
+                    f"Mask directory {mask_dir} holds incomplete masks and no checkpoint to resume from, "
+                    f"rerun with --overwrite."
+                )
+
+        if state is None and mask_dir.exists() and any(mask_dir.iterdir()):
             if self.overwrite:
                 print(f"Mask directory {mask_dir} is non-empty")
             else:
@@ -84,103 +229,221 @@ class Sam3TrackingTool(TrackingTool):
 
         with VideoReader(path=video_path) as video_reader:
             frame_rate = video_reader.frame_rate
+            frame_size: Tuple[int, int] = (video_reader.inputwidth, video_reader.inputheight)
 
-        writers: Dict[int, VideoWriter] = {}
-        written_frames: Dict[int, int] = {}
+        writers: Dict[int, MaskTrackWriter] = {}
         next_global_id = 0
-        prev_last_global_masks: Dict[int, np.ndarray] = {}
-        frame_size: Tuple[int, int] = (0, 0)
+        prev_last_global_masks: Dict[int, RunLengthMask] = {}
         processed_frame_count = 0
 
-        try:
-            for start_frame, chunk in self._iter_video_chunks(video_path, chunk_size):
-                if not frame_size[0] and not frame_size[1]:
-                    frame_size = chunk[0].size
-
-                # If a chunk still OOMs, split and retry recursively in-order.
-                pending_subchunks = deque([(start_frame, chunk)])
-
-                while pending_subchunks:
-                    sub_start_frame, sub_chunk = pending_subchunks.popleft()
-
-                    try:
-                        chunk_outputs = self._segment_chunk(sub_chunk, text_prompt)
-                    except RuntimeError as exc:
-                        if self._is_cuda_oom(exc) and self.device == "cuda" and len(sub_chunk) > 1:
-                            self._clear_cuda_memory()
-                            split_idx = len(sub_chunk) // 2
-                            first_half = sub_chunk[:split_idx]
-                            second_half = sub_chunk[split_idx:]
-                            pending_subchunks.appendleft((sub_start_frame + split_idx, second_half))
-                            pending_subchunks.appendleft((sub_start_frame, first_half))
-                            if self.verbose:
-                                print(
-                                    "CUDA OOM while processing frames "
-                                    f"{sub_start_frame}-{sub_start_frame + len(sub_chunk) - 1}; "
-                                    f"retrying as chunks of {len(first_half)} and {len(second_half)} frames."
+        settings = {
+            "text_prompt": text_prompt,
+            "iou_threshold": iou_threshold,
+            "max_side": max_side,
+            "mask_format": mask_format,
+            "frame_size": list(frame_size),
+        }
+        if state is not None:
+            if state["version"] != CHECKPOINT_VERSION or state["settings"] != settings:
+                raise ValueError(
+                    f"The checkpoint in {checkpoint_dir} was written with other settings: {state['settings']}."
+                )
+            processed_frame_count = state["processed_frame_count"]
+            next_global_id = state["next_global_id"]
+            prev_last_global_masks = {
+                int(key): RunLengthMask(np.asarray(runs, dtype=np.uint32), shape=shape)
+                for key, (runs, shape) in state["last_global_masks"].items()
+            }
+            self._clean_checkpoint(checkpoint_dir, processed_frame_count)
+            if self.verbose:
+                print(f"Resuming from frame {processed_frame_count}.")
+        elif self.checkpoint and checkpoint_dir.exists():
+            # Overwritten rather than resumed.
+            shutil.rmtree(checkpoint_dir)
+
+        if mask_format == "npz" and not self.checkpoint:
+            # The archive is discarded if the inference fails.
+            mask_archive = MaskWriter(path=mask_dir / "masks.npz", size=frame_size, overwrite=self.overwrite)
+        else:
+            mask_archive = nullcontext()
+
+        chunk_sizer = None
+        if memory_budget is not None:
+            chunk_sizer = ChunkSizer(
+                budget=int(memory_budget * 1024 ** 3),
+                max_chunk_size=chunk_size,
+                frame_size=scaled_size(*frame_size, max_side=max_side),
+                dtype_size=torch.finfo(self.compute_dtype).bits // 8,
+            )
+            if self.verbose:
+                print(f"Starting with chunks of {chunk_sizer.chunk_size} frames to fit in {memory_budget} GB.")
+
+        with mask_archive as mask_writer:
+            chunks = self._iter_video_chunks(
+                video_path,
+                chunk_size if chunk_sizer is None else chunk_sizer.next_size,
+                max_side=max_side,
+                start_frame=processed_frame_count,
+            )
+            try:
+                # The next chunk is decoded, and the masks of the previous one are written, while the model runs.
+                with (
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix="sam3-decoder") as decoder,
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix="sam3-encoder") as encoder,
+                ):
+                    next_chunk = decoder.submit(next, chunks, None)
+                    pending_write: Optional[Future] = None
+                    while True:
+                        item = next_chunk.result()
+                        if item is None:
+                            break
+                        next_chunk = decoder.submit(next, chunks, None)
+                        start_frame, chunk = item
+
+                        # If a chunk still OOMs, split and retry recursively in-order.
+                        pending_subchunks = deque([(start_frame, chunk)])
+
+                        while pending_subchunks:
+                            sub_start_frame, sub_chunk = pending_subchunks.popleft()
+                            if chunk_sizer is not None and len(sub_chunk) > chunk_sizer.chunk_size:
+                                # The chunk was decoded ahead, before the chunk size was reduced.
+                                split_idx = chunk_sizer.chunk_size
+                                pending_subchunks.appendleft((sub_start_frame + split_idx, sub_chunk[split_idx:]))
+                                sub_chunk = sub_chunk[:split_idx]
+
+                            try:
+                                with PeakMemory() if chunk_sizer is not None else nullcontext() as peak:
+                                    chunk_outputs = self._segment_chunk(sub_chunk, text_prompt)
+                            except RuntimeError as exc:
+                                if self._is_cuda_oom(exc) and self.device == "cuda" and len(sub_chunk) > 1:
+                                    self._clear_cuda_memory()
+                                    split_idx = len(sub_chunk) // 2
+                                    first_half = sub_chunk[:split_idx]
+                                    second_half = sub_chunk[split_idx:]
+                                    pending_subchunks.appendleft((sub_start_frame + split_idx, second_half))
+                                    pending_subchunks.appendleft((sub_start_frame, first_half))
+                                    if self.verbose:
+                                        print(
+                                            "CUDA OOM while processing frames "
+                                            f"{sub_start_frame}-{sub_start_frame + len(sub_chunk) - 1}; "
+                                            f"retrying as chunks of {len(first_half)} and {len(second_half)} frames."
+                                        )
+                                    continue
+                                raise
+
+                            id_mapping, next_global_id = self._map_chunk_object_ids(
+                                chunk_outputs=chunk_outputs,
+                                prev_last_global_masks=prev_last_global_masks,
+                                iou_threshold=iou_threshold,
+                                next_global_id=next_global_id,
+                            )
+
+                            if chunk_sizer is not None:
+                                previous_size = chunk_sizer.chunk_size
+                                chunk_sizer.update(num_frames=len(sub_chunk), num_objects=len(id_mapping), peak=peak)
+                                if self.verbose and chunk_sizer.chunk_size != previous_size:
+                                    print(
+                                        f"Peak memory of {peak.used / 1024 ** 3:.2f} GB for {len(sub_chunk)} frames; "
+                                        f"resizing the chunks to {chunk_sizer.chunk_size} frames."
+                                    )
+
+                            prev_last_global_masks = self._extract_last_global_masks(chunk_outputs, id_mapping)
+                            processed_frame_count += len(sub_chunk)
+
+                            write_kwargs = dict(
+                                chunk_outputs=chunk_outputs,
+                                id_mapping=id_mapping,
+                                writers=writers,
+                                mask_dir=mask_dir,
+                                frame_rate=frame_rate,
+                                frame_size=frame_size,
+                                start_frame=sub_start_frame,
+                                mask_writer=mask_writer,
+                            )
+                            # The masks are written in order, at most one chunk behind the inference.
+                            if pending_write is not None:
+                                pending_write.result()
+                            if self.checkpoint:
+                                pending_write = encoder.submit(
+                                    self._write_chunk_checkpoint,
+                                    checkpoint_dir=checkpoint_dir,
+                                    state={
+                                        "version": CHECKPOINT_VERSION,
+                                        "settings": settings,
+                                        "processed_frame_count": processed_frame_count,
+                                        "next_global_id": next_global_id,
+                                        "last_global_masks": {
+                                            f"{global_id}": (mask.runs, mask.shape)
+                                            for global_id, mask in prev_last_global_masks.items()
+                                        },
+                                    },
+                                    mask_format=mask_format,
+                                    **write_kwargs,
                                 )
-                            continue
-                        raise
-
-                    id_mapping, next_global_id = self._map_chunk_object_ids(
-                        chunk_outputs=chunk_outputs,
-                        prev_last_global_masks=prev_last_global_masks,
-                        iou_threshold=iou_threshold,
-                        next_global_id=next_global_id,
-                    )
-
-                    self._write_chunk_masks(
-                        chunk_outputs=chunk_outputs,
-                        id_mapping=id_mapping,
-                        writers=writers,
-                        written_frames=written_frames,
-                        mask_dir=mask_dir,
-                        frame_rate=frame_rate,
-                        frame_size=frame_size,
-                        start_frame=sub_start_frame,
-                    )
-
-                    prev_last_global_masks = self._extract_last_global_masks(chunk_outputs, id_mapping)
-                    processed_frame_count += len(sub_chunk)
-
-                    del chunk_outputs
-                    if self.device == "cuda":
-                        self._clear_cuda_memory()
-        finally:
-            for writer in writers.values():
-                writer.close()
-
+                            else:
+                                pending_write = encoder.submit(self._write_chunk_masks, **write_kwargs)
+
+                            del chunk_outputs
+                            if self.device == "cuda":
+                                self._clear_cuda_memory()
+
+                    if pending_write is not None:
+                        pending_write.result()
+                    for writer in writers.values():
+                        writer.advance(processed_frame_count)
+            finally:
+                chunks.close()
+                for writer in writers.values():
+                    writer.close()
+
+            if mask_writer is not None:
+                mask_writer.advance(processed_frame_count)
+
+        object_ids = set(writers)
+        if mask_writer is not None:
+            object_ids |= mask_writer.object_ids
+        if self.checkpoint:
+            object_ids |= self._assemble_checkpoint(
+                checkpoint_dir=checkpoint_dir,
+                mask_dir=mask_dir,
+                mask_format=mask_format,
+                frame_size=frame_size,
+                num_frames=processed_frame_count,
+            )
         if processed_frame_count == 0:
             raise ValueError(f"No frames found in input video: {video_path}")
-        if not writers:
+        if not object_ids:
             print("No masks to write.")
 
     @staticmethod
     def _iter_video_chunks(
-        video_path: Union[str, Path], chunk_size: int
+        video_path: Union[str, Path],
+        chunk_size: Union[int, Callable[[], int]],
+        max_side: Optional[int] = None,
+        start_frame: int = 0,
     ) -> Iterable[Tuple[int, List[Image.Image]]]:
-        cap = cv2.VideoCapture(str(video_path))
-        if not cap.isOpened():
-            raise ValueError(f"Failed to open video for reading: {video_path}")
-
+        # The size of every chunk is given by a callable when it adapts to the memory usage.
+        next_size = chunk_size if callable(chunk_size) else lambda: chunk_size
         chunk: List[Image.Image] = []
-        start_frame = 0
-        try:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                chunk.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
-                if len(chunk) >= chunk_size:
+        size = next_size()
+        # The frames are copied into the images, so they are decoded into the same buffer.
+        with VideoReader(
+            path=video_path,
+            start_frame=start_frame,
+            max_side=max_side,
+            buffers=1,
+            backend="opencv",
+        ) as video_reader:
+            for frame in video_reader:
+                chunk.append(Image.fromarray(frame))
+                if len(chunk) >= size:
                     yield start_frame, chunk
                     start_frame += len(chunk)
                     chunk = []
+                    size = next_size()
 
             if chunk:
                 yield start_frame, chunk
-        finally:
-            cap.release()
 
     def _segment_chunk(self, chunk: List[Image.Image], text_prompt: str):
         chunk_outputs = {idx: {"object_ids": [], "masks": []} for idx in range(len(chunk))}
@@ -197,7 +460,7 @@ class Sam3TrackingTool(TrackingTool):
             for out in self.model.propagate_in_video_iterator(session, max_frame_num_to_track=len(chunk)):
                 processed = self.processor.postprocess_outputs(session, out)
                 object_ids = self._to_int_list(processed["object_ids"])
-                masks = self._to_bool_mask_list(processed["masks"])
+                masks = self._to_compact_mask_list(processed["masks"])
                 chunk_outputs[out.frame_idx] = {"object_ids": object_ids, "masks": masks}
         finally:
             del session
@@ -213,22 +476,16 @@ class Sam3TrackingTool(TrackingTool):
         return [int(value) for value in values]
 
     @staticmethod
-    def _to_bool_mask_list(masks) -> List[np.ndarray]:
+    def _to_compact_mask_list(masks) -> List[RunLengthMask]:
+        # The masks of a whole chunk are kept run-length encoded, only one is decoded at a time.
         if isinstance(masks, torch.Tensor):
-            return [mask.detach().cpu().numpy().astype(bool) for mask in masks]
-        return [np.asarray(mask).astype(bool) for mask in masks]
-
-    @staticmethod
-    def _compute_mask_iou(mask1: np.ndarray, mask2: np.ndarray) -> float:
-        """Compute IoU between two binary masks."""
-        intersection = np.logical_and(mask1, mask2).sum()
-        union = np.logical_or(mask1, mask2).sum()
-        return float(intersection / union) if union > 0 else 0.0
+            return [RunLengthMask.encode(mask.detach().cpu().numpy().astype(bool)) for mask in masks]
+        return [RunLengthMask.encode(np.asarray(mask).astype(bool)) for mask in masks]
 
     def _map_chunk_object_ids(
         self,
         chunk_outputs: Dict[int, Dict[str, List]],
-        prev_last_global_masks: Dict[int, np.ndarray],
+        prev_last_global_masks: Dict[int, RunLengthMask],
         iou_threshold: float,
         next_global_id: int,
     ) -> Tuple[Dict[int, int], int]:
@@ -242,23 +499,19 @@ class Sam3TrackingTool(TrackingTool):
                 break
 
         if curr_first_with_objects and prev_last_global_masks:
-            used_global_ids = set()
+            prev_ids = list(prev_last_global_masks.keys())
             curr_ids = curr_first_with_objects["object_ids"]
-            curr_masks = curr_first_with_objects["masks"]
-            for curr_id, curr_mask in zip(curr_ids, curr_masks):
-                best_iou = 0.0
-                best_global_id = None
-                for global_id, prev_mask in prev_last_global_masks.items():
-                    if global_id in used_global_ids:
-                        continue
-                    iou = self._compute_mask_iou(prev_mask, curr_mask)
-                    if iou > best_iou:
-                        best_iou = iou
-                        best_global_id = global_id
-
-                if best_global_id is not None and best_iou >= iou_threshold:
-                    id_mapping[curr_id] = best_global_id
-                    used_global_ids.add(best_global_id)
+            # The masks are upscaled from the mask logits of the model, so their resolution is enough for the IoU.
+            ious = iou_matrix(
+                list(prev_last_global_masks.values()),
+                curr_first_with_objects["masks"],
+                max_side=SAM3_MASK_SIZE,
+            )
+            # The objects are matched to maximize the total IoU, rather than greedily.
+            for prev_index, curr_index in zip(*linear_sum_assignment(ious, maximize=True)):
+                iou = ious[prev_index, curr_index]
+                if iou > 0.0 and iou >= iou_threshold:
+                    id_mapping[curr_ids[curr_index]] = prev_ids[prev_index]
 
         for frame_idx in sorted(chunk_outputs.keys()):
             frame_out = chunk_outputs[frame_idx]
@@ -272,7 +525,7 @@ class Sam3TrackingTool(TrackingTool):
     @staticmethod
     def _extract_last_global_masks(
         chunk_outputs: Dict[int, Dict[str, List]], id_mapping: Dict[int, int]
-    ) -> Dict[int, np.ndarray]:
+    ) -> Dict[int, RunLengthMask]:
         for frame_idx in sorted(chunk_outputs.keys(), reverse=True):
             frame_out = chunk_outputs[frame_idx]
             if not frame_out["object_ids"]:
@@ -289,51 +542,180 @@ class Sam3TrackingTool(TrackingTool):
         self,
         chunk_outputs: Dict[int, Dict[str, List]],
         id_mapping: Dict[int, int],
-        writers: Dict[int, VideoWriter],
-        written_frames: Dict[int, int],
+        writers: Dict[int, MaskTrackWriter],
         mask_dir: Path,
         frame_rate,
         frame_size: Tuple[int, int],
         start_frame: int,
+        mask_writer: Optional[MaskWriter] = None,
+        segment_dir: Optional[Path] = None,
     ):
         width, height = frame_size
-        empty_mask_rgb = np.zeros((height, width, 3), dtype=np.uint8)
 
         for local_frame_idx in sorted(chunk_outputs.keys()):
             global_frame_idx = start_frame + local_frame_idx
             frame_out = chunk_outputs[local_frame_idx]
 
-            masks_by_global_id: Dict[int, np.ndarray] = {}
+            masks_by_global_id: Dict[int, RunLengthMask] = {}
             for local_obj_id, local_mask in zip(frame_out["object_ids"], frame_out["masks"]):
                 global_obj_id = id_mapping.get(local_obj_id)
                 if global_obj_id is not None:
                     masks_by_global_id[global_obj_id] = local_mask
 
-            for global_obj_id in sorted(masks_by_global_id.keys()):
-                if global_obj_id in writers:
+            # Only the frames where an object is present are written, the missing ones being empty.
+            for global_obj_id, mask in sorted(masks_by_global_id.items()):
+                if mask_writer is not None and mask.shape == (height, width):
+                    # Archived as is, without decoding.
+                    mask_writer.add_runs(frame=global_frame_idx, object_id=global_obj_id, runs=mask.runs)
                     continue
-                writers[global_obj_id] = VideoWriter(
-                    path=mask_dir / f"{global_obj_id}.mp4",
-                    input_dict={"-r": frame_rate},
-                    output_dict={"-c:v": "libx264", "-crf": "0", "-pix_fmt": "yuv420p"},
-                    overwrite=self.overwrite,
-                )
-                written_frames[global_obj_id] = 0
-
-                # Back-fill earlier frames so all mask videos keep identical frame counts.
-                for _ in range(global_frame_idx):
-                    writers[global_obj_id].write(image=empty_mask_rgb)
-                    written_frames[global_obj_id] += 1
-
-            for global_obj_id, writer in sorted(writers.items()):
-                mask = masks_by_global_id.get(global_obj_id)
-                if mask is None:
-                    mask_rgb = empty_mask_rgb
-                else:
-                    mask_uint8 = (mask.astype(np.uint8) * 255)
-                    mask_rgb = np.repeat(mask_uint8[..., np.newaxis], 3, axis=-1)
-                writer.write(image=mask_rgb)
-                written_frames[global_obj_id] += 1
+                mask = mask.decode()
+                if mask.shape != (height, width):
+                    # The model ran on downscaled frames.
+                    mask = cv2.resize(mask.view(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST).view(bool)
+                if mask_writer is not None:
+                    mask_writer.add(frame=global_frame_idx, object_id=global_obj_id, mask=mask)
+                    continue
+
+                if global_obj_id not in writers:
+                    writers[global_obj_id] = self._open_mask_writer(
+                        global_obj_id, mask_dir, frame_rate, frame_size, start_frame, segment_dir
+                    )
+                writers[global_obj_id].add(frame=global_frame_idx, mask=mask)
+
+    def _open_mask_writer(
+        self,
+        global_obj_id: int,
+        mask_dir: Path,
+        frame_rate,
+        frame_size: Tuple[int, int],
+        start_frame: int,
+        segment_dir: Optional[Path] = None,
+    ) -> MaskTrackWriter:
+        if segment_dir is None:
+            path = mask_dir / f"{global_obj_id}.mp4"
+        else:
+            # Named after the first frame of their chunk, so that they sort in order.
+            path = segment_dir / f"{global_obj_id}" / f"{start_frame:09d}.mp4"
+            path.parent.mkdir(parents=True, exist_ok=True)
+        return MaskTrackWriter(path=path, size=frame_size, frame_rate=frame_rate, overwrite=self.overwrite)
+
+    def _write_chunk_checkpoint(
+        self,
+        checkpoint_dir: Path,
+        state: Dict[str, Any],
+        mask_format: str,
+        **write_kwargs,
+    ):
+        """
+        Writes the masks of a chunk as new segments, then the state from which the inference can resume.
+        """
+        chunk_outputs = write_kwargs["chunk_outputs"]
+        start_frame = write_kwargs["start_frame"]
+        end_frame = start_frame + len(chunk_outputs)
+        if mask_format == "npz":
+            segment_path = checkpoint_dir / "masks" / f"{start_frame:09d}.npz"
+            segment_path.parent.mkdir(parents=True, exist_ok=True)
+            with MaskWriter(path=segment_path, size=write_kwargs["frame_size"], overwrite=True) as segment_writer:
+                self._write_chunk_masks(**{**write_kwargs, "mask_writer": segment_writer})
+                segment_writer.advance(end_frame)
+        else:
+            writers = write_kwargs["writers"]
+            try:
+                self._write_chunk_masks(**write_kwargs, segment_dir=checkpoint_dir)
+                for writer in writers.values():
+                    writer.advance(end_frame)
+            finally:
+                for writer in writers.values():
+                    writer.close()
+                writers.clear()
+
+        # Replaced at once, so that an interruption leaves the previous checkpoint intact.
+        state_path = checkpoint_dir / "state.json"
+        temporary_path = checkpoint_dir / "state.json.tmp"
+        temporary_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path.write_bytes(json.dumps(state))
+        os.replace(temporary_path, state_path)
+
+    @staticmethod
+    def _masks_complete(video_path: Union[str, Path], mask_dir: Path) -> bool:
+        """
+        Checks whether the masks of a mask directory cover the whole video, unlike those of an interrupted inference.
+
+        :return: Whether the mask archive, or the index of every mask video, covers every frame of the video.
+        """
+        mask_paths = sorted(mask_dir.glob("*.mp4"))
+        if not (mask_dir / "masks.npz").is_file() and not mask_paths:
+            return False
+        with VideoReader(path=video_path) as video_reader:
+            num_frames = video_reader.num_frames
+        if (mask_dir / "masks.npz").is_file():
+            with MaskReader(mask_dir / "masks.npz") as reader:
+                return reader.num_frames == num_frames
+        for path in mask_paths:
+            index = read_track_index(path)
+            if index is None or index["num_frames"] != num_frames:
+                return False
+        return True
+
+    @staticmethod
+    def _clean_checkpoint(checkpoint_dir: Path, num_frames: int):
+        """
+        Removes the segments, and their temporary files, written after the last checkpoint.
+        """
+        for path in sorted(checkpoint_dir.glob("*/*")):
+            complete = (
+                (path.parent.name == "masks" or path.parent.name.isdigit())
+                and path.is_file()
+                and path.suffix in (".mp4", ".json", ".npz")
+                and path.stem.isdigit()
+                and int(path.stem) < num_frames
+            )
+            if complete:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+
+    def _assemble_checkpoint(
+        self,
+        checkpoint_dir: Path,
+        mask_dir: Path,
+        mask_format: str,
+        frame_size: Tuple[int, int],
+        num_frames: int,
+    ) -> Set[int]:
+        """
+        Assembles the segments of the masks once the inference is complete, then removes the checkpoint.
+
+        :return: Identifiers of the objects.
+        """
+        # The outputs of an interrupted assembly are overwritten, the checkpoint being removed only once complete.
+        object_ids = set()
+        if mask_format == "npz":
+            with MaskWriter(path=mask_dir / "masks.npz", size=frame_size, overwrite=True) as mask_writer:
+                for segment_path in sorted((checkpoint_dir / "masks").glob("*.npz")):
+                    with MaskReader(segment_path) as segment_reader:
+                        for frame, object_id, runs in segment_reader.entries():
+                            mask_writer.add_runs(frame=frame, object_id=object_id, runs=runs)
+                mask_writer.advance(num_frames)
+                object_ids |= mask_writer.object_ids
+        else:
+            for object_dir in sorted(checkpoint_dir.iterdir()):
+                if not (object_dir.is_dir() and object_dir.name.isdigit()):
+                    continue
+                segment_paths = sorted(object_dir.glob("*.mp4"))
+                if segment_paths:
+                    concat_tracks(
+                        segment_paths,
+                        mask_dir / f"{object_dir.name}.mp4",
+                        num_frames=num_frames,
+                        overwrite=True,
+                    )
+                    object_ids.add(int(object_dir.name))
+        if checkpoint_dir.exists():
+            shutil.rmtree(checkpoint_dir)
+        return object_ids
 
     @staticmethod
     def _is_cuda_oom(exc: RuntimeError) -> bool:
@@ -4,11 +4,14 @@ import numpy as np
 import random
 import cv2
 
-from typing import Union
+from contextlib import ExitStack, closing
+from functools import partial
+from typing import Iterator, List, Optional, Union
 from pathlib import Path
 from tqdm import tqdm
 
-from psifx.io.video import VideoReader, VideoWriter
+from psifx.io.mask import mask_tracks, read_sparse_track, read_track
+from psifx.io.video import PREFETCH_SIZE, FrameBus, VideoReader, VideoWriter
 from psifx.video.tool import VideoTool
 
 
@@ -36,7 +39,7 @@ class TrackingTool(VideoTool):
         Applies color masks to the video and writes a new video.
 
         :param video_path: Path to original video.
-        :param mask_paths: Single or list of paths to .mp4 video masks.
+        :param mask_paths: Single or list of paths to .mp4 video masks, directories of them, or .npz mask archives.
         :param visualization_path: Path to save the output video.
         :param blackout: Whether to black out the background.
         :param color: Whether to color each mask.
@@ -44,25 +47,25 @@ class TrackingTool(VideoTool):
         """
         if not isinstance(mask_paths, list):
             mask_paths = [mask_paths]
-        mask_paths = [Path(p) for p in mask_paths]
-        for path in mask_paths:
-            if not path.suffix == ".mp4":
-                raise ValueError(f"Expected .mp4 file, got {path}")
-            if not path.exists():
-                raise FileNotFoundError(f"File missing at path {path}")
+        tracks = mask_tracks(mask_paths)
 
-        obj_ids = [str(p.stem) for p in mask_paths]
+        obj_ids = [name for name, _, _ in tracks]
 
+        # The color of every object, indexed by its label, the background being black.
+        color_table = np.zeros((len(obj_ids) + 1, 3), dtype=np.uint8)
         if color:
-            obj_colors = {
-                obj_id: np.array([random.randint(50, 255) for _ in range(3)], dtype=np.uint8)
-                for obj_id in obj_ids
-            }
+            for label in range(1, len(obj_ids) + 1):
+                color_table[label] = [random.randint(50, 255) for _ in range(3)]
 
-        mask_readers = {obj_id: VideoReader(path=path) for obj_id, path in zip(obj_ids, mask_paths)}
+        # The masks are read only on the frames where their object is present, the others being empty.
+        mask_readers = {
+            name: read_sparse_track(path=path, object_id=object_id, prefetch=PREFETCH_SIZE)
+            for name, path, object_id in tracks
+        }
+        next_masks = {name: next(reader, None) for name, reader in mask_readers.items()}
 
         with (
-            VideoReader(path=video_path) as video_reader,
+            VideoReader(path=video_path, prefetch=PREFETCH_SIZE, buffers=1) as video_reader,
             VideoWriter(
                 path=visualization_path,
                 input_dict={"-r": video_reader.frame_rate},
@@ -72,47 +75,46 @@ class TrackingTool(VideoTool):
                     "-pix_fmt": "yuv420p",
                 },
                 overwrite=self.overwrite,
+                queue_size=PREFETCH_SIZE,
             ) as visualization_writer,
         ):
+            # The per-frame arrays are allocated once and reused.
+            shape = (video_reader.outputheight, video_reader.outputwidth)
+            label_image = np.empty(shape, dtype=np.uint16)
+            composite_mask = np.empty(shape + (3,), dtype=np.uint8)
+            black = np.empty(shape + (3,), dtype=np.uint8)
+            blended = np.empty(shape + (3,), dtype=np.uint8)
             for frame_idx, frame in enumerate(tqdm(video_reader, desc="Overlaying masks", disable=not self.verbose)):
-                composite_mask = np.zeros_like(frame, dtype=np.uint8)
-
-                if blackout:
-                    background = np.zeros_like(frame)
-                else:
-                    background = frame
-
+                # Every object is painted into a label image, which is then colored and blended in one pass.
+                label_image.fill(0)
                 label_positions = {}
 
-                for obj_id, reader in mask_readers.items():
-                    try:
-                        mask_frame = next(reader)
-                    except StopIteration:
+                for label, (obj_id, reader) in enumerate(mask_readers.items(), start=1):
+                    if next_masks[obj_id] is None or next_masks[obj_id][0] != frame_idx:
                         continue
+                    binary_mask = next_masks[obj_id][1]
 
-                    # Convert mask to binary mask
-                    gray = cv2.cvtColor(mask_frame, cv2.COLOR_BGR2GRAY)
-                    binary_mask = gray > 127
-
-                    if np.any(binary_mask):
-
-                        if color:
-                            obj_color = obj_colors[obj_id]
-                            for c in range(3):
-                                composite_mask[..., c] += (binary_mask * obj_color[c]).astype(np.uint8)
-
+                    moments = cv2.moments(binary_mask.view(np.uint8), binaryImage=True)
+                    if moments["m00"] > 0:
+                        if color or blackout:
+                            np.copyto(label_image, label, where=binary_mask)
                         if labels:
-                            ys, xs = np.where(binary_mask)
-                            if len(xs) > 0 and len(ys) > 0:
-                                mean_y = int(np.mean(ys))
-                                mean_x = int(np.mean(xs))
-                                label_positions[obj_id] = (mean_x, mean_y - 10)
+                            mean_x = int(moments["m10"] / moments["m00"])
+                            mean_y = int(moments["m01"] / moments["m00"])
+                            label_positions[obj_id] = (mean_x, mean_y - 10)
+                    # Read once the mask is used, as the same buffer is refilled.
+                    next_masks[obj_id] = next(reader, None)
 
-                        if blackout:
-                            background[binary_mask] = frame[binary_mask]
+                if blackout:
+                    black.fill(0)
+                    np.copyto(black, frame, where=(label_image > 0)[..., None])
+                    background = black
+                else:
+                    background = frame
 
                 if color:
-                    overlay = cv2.addWeighted(background, 1.0, composite_mask, 0.5, 0)
+                    np.take(color_table, label_image, axis=0, out=composite_mask, mode="clip")
+                    overlay = cv2.addWeighted(background, 1.0, composite_mask, 0.5, 0, dst=blended)
                 else:
                     overlay = background
 
@@ -120,10 +122,64 @@ class TrackingTool(VideoTool):
                     self.draw_labels(overlay, label_positions)
 
                 visualization_writer.write(image=overlay)
+            if self.verbose:
+                print(video_reader.report())
 
         for reader in mask_readers.values():
             reader.close()
 
+    def isolate(self,
+                video_path: Union[str, Path],
+                mask_paths: List[Union[str, Path]],
+                output_paths: List[Union[str, Path]],
+                object_ids: Optional[List[Optional[int]]] = None,
+                ):
+        """
+        Blacks out everything but each mask, writing one video per mask, while decoding the video only once.
+
+        :param video_path: Path to original video.
+        :param mask_paths: Paths to .mp4 video masks or .npz mask archives.
+        :param output_paths: Paths to save the output videos, one per mask.
+        :param object_ids: Identifiers of the objects in the mask archives, ``None`` for the mask videos.
+        """
+        if object_ids is None:
+            object_ids = [None] * len(mask_paths)
+        if not len(mask_paths) == len(output_paths) == len(object_ids):
+            raise ValueError(f"Expected one output per mask, got {len(mask_paths)} masks and {len(output_paths)} outputs")
+        for path in mask_paths:
+            if not Path(path).exists():
+                raise FileNotFoundError(f"File missing at path {path}")
+
+        with ExitStack() as stack:
+            video_reader = stack.enter_context(VideoReader(path=video_path, prefetch=PREFETCH_SIZE))
+            bus = FrameBus(video_reader)
+            for mask_path, output_path, object_id in zip(mask_paths, output_paths, object_ids):
+                mask_reader = stack.enter_context(closing(read_track(path=mask_path, object_id=object_id)))
+                writer = stack.enter_context(
+                    VideoWriter(
+                        path=output_path,
+                        input_dict={"-r": video_reader.frame_rate},
+                        output_dict={
+                            "-c:v": "libx264",
+                            "-crf": "15",
+                            "-pix_fmt": "yuv420p",
+                        },
+                        overwrite=self.overwrite,
+                    )
+                )
+                bus.register(partial(self._isolate_frame, mask_reader, writer))
+            bus.run(desc="Isolating masks", verbose=self.verbose)
+            if self.verbose:
+                print(video_reader.report())
+
+    @staticmethod
+    def _isolate_frame(mask_reader: Iterator[np.ndarray], writer: VideoWriter, index: int, frame: np.ndarray):
+        binary_mask = next(mask_reader, None)
+        if binary_mask is None:
+            writer.write(image=np.zeros_like(frame))
+            return
+        writer.write(image=np.where(binary_mask[..., None], frame, np.uint8(0)))
+
     @staticmethod
     def draw_labels(overlay, label_positions):
         for key, pos_tuple in label_positions.items():
@@ -0,0 +1,11 @@
+"""Shared test fixtures."""
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path, monkeypatch):
+    """Keep the persistent caches, e.g. archive indexes, away from the user cache."""
+    monkeypatch.setenv("PSIFX_CACHE_PATH", str(tmp_path / "cache"))
+    monkeypatch.setattr("psifx.utils.cache.CACHE_PATH", tmp_path / "cache")
+    return tmp_path / "cache"
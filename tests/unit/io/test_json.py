@@ -0,0 +1,80 @@
+"""Unit tests for the JSON codecs."""
+
+import json as stdlib_json
+import tarfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from psifx.io import json
+
+
+@pytest.fixture(params=sorted(json.CODECS))
+def codec(request):
+    previous = json.get_codec()
+    json.set_codec(request.param)
+    yield json.get_codec()
+    json.set_codec(previous)
+
+
+@pytest.mark.unit
+def test_codec_serializes_numpy_arrays(codec):
+    points = np.random.default_rng(0).random((33, 3), dtype=np.float32)
+    pose = {"pose_keypoints_2d": points.reshape(-1), "count": np.int64(3), "edges": ((0, 1), (1, 2))}
+
+    data = json.dumps(pose)
+
+    # The payload stays plain JSON, readable without the codec.
+    decoded = stdlib_json.loads(data)
+    assert decoded["count"] == 3
+    assert decoded["edges"] == [[0, 1], [1, 2]]
+    np.testing.assert_array_equal(np.array(decoded["pose_keypoints_2d"], dtype=np.float32), points.reshape(-1))
+    assert json.loads(data) == decoded
+
+
+@pytest.mark.unit
+def test_set_codec_rejects_unknown_codec():
+    with pytest.raises(ValueError):
+        json.set_codec("unknown")
+
+
+@pytest.mark.unit
+def test_codec_round_trips_archive_members(codec):
+    # A member written by the standard library, from the float32 pose arrays.
+    path = Path(__file__).parents[2] / "integration" / "data" / "PosesDir" / "1.tar.gz"
+    with tarfile.open(path) as archive:
+        member = next(member for member in archive.getmembers() if member.name.endswith("00000000000000.json"))
+        data = archive.extractfile(member).read()
+
+    pose = {key: np.asarray(value, dtype=np.float32) for key, value in json.loads(data).items()}
+    decoded = stdlib_json.loads(json.dumps(pose))
+    assert decoded.keys() == pose.keys()
+    for key, value in pose.items():
+        np.testing.assert_array_equal(np.asarray(decoded[key], dtype=np.float32), value)
+    if codec.name == "json":
+        assert json.dumps(pose) == data
+
+
+@pytest.mark.unit
+def test_codec_keeps_nan(codec):
+    for nan in [
+        {"face_keypoints_2d": np.array([np.nan, 0.1], dtype=np.float32)},
+        {"face_keypoints_2d": [float("nan"), 0.1]},
+        {"score": np.float32(np.inf)},
+    ]:
+        data = json.dumps(nan)
+        assert b"null" not in data
+        decoded = json.loads(data)
+        np.testing.assert_array_equal(
+            np.asarray(next(iter(decoded.values())), dtype=np.float32),
+            np.asarray(next(iter(nan.values())), dtype=np.float32),
+        )
+
+
+@pytest.mark.unit
+def test_orjson_codec_serializes_non_contiguous_arrays():
+    pytest.importorskip("orjson")
+    points = np.arange(12, dtype=np.float32).reshape(4, 3)
+    data = json.ORJSONCodec().dumps({"points": points[:, :2], "count": np.int64(3)})
+    assert stdlib_json.loads(data) == {"points": points[:, :2].tolist(), "count": 3}
@@ -0,0 +1,211 @@
+"""Unit tests for the mask archives."""
+
+import numpy as np
+import pytest
+
+from psifx.io.mask import (
+    MaskReader,
+    MaskWriter,
+    RunLengthMask,
+    concat_tracks,
+    decode_rle,
+    encode_rle,
+    iou_matrix,
+    mask_tracks,
+    read_sparse_track,
+    read_track,
+    read_track_index,
+    write_track_index,
+)
+
+
+@pytest.mark.unit
+def test_rle_round_trip():
+    rng = np.random.default_rng(0)
+    for mask in [
+        rng.random((17, 23)) > 0.5,
+        np.zeros((4, 5), dtype=bool),
+        np.ones((4, 5), dtype=bool),
+    ]:
+        runs = encode_rle(mask)
+        assert runs.dtype == np.uint32
+        assert runs.sum() == mask.size
+        np.testing.assert_array_equal(decode_rle(runs, mask.shape), mask)
+
+
+@pytest.mark.unit
+def test_run_length_mask_iou():
+    rng = np.random.default_rng(0)
+    for density in [0.0, 0.1, 0.5, 0.9, 1.0]:
+        first = rng.random((13, 11)) < density
+        second = rng.random((13, 11)) < 0.5
+        encoded, other = RunLengthMask.encode(first), RunLengthMask.encode(second)
+        np.testing.assert_array_equal(encoded.decode(), first)
+        assert encoded.area == first.sum()
+        assert encoded.intersection(other) == np.logical_and(first, second).sum()
+        union = np.logical_or(first, second).sum()
+        assert encoded.iou(other) == pytest.approx(np.logical_and(first, second).sum() / union)
+    empty = RunLengthMask.encode(np.zeros((3, 3), dtype=bool))
+    assert empty.iou(empty) == 0.0
+
+
+@pytest.mark.unit
+def test_iou_matrix():
+    rng = np.random.default_rng(0)
+    masks = [RunLengthMask.encode(rng.random((40, 60)) < density) for density in (0.2, 0.5, 0.8)]
+    masks.append(RunLengthMask.encode(np.zeros((40, 60), dtype=bool)))
+    others = masks[:2] + [RunLengthMask.encode(rng.random((40, 60)) < 0.5)]
+
+    ious = iou_matrix(masks, others)
+    assert ious.shape == (4, 3)
+    for row, mask in enumerate(masks):
+        for column, other in enumerate(others):
+            assert ious[row, column] == pytest.approx(mask.iou(other), abs=1e-5)
+    assert iou_matrix(masks, []).shape == (4, 0)
+
+    # Downscaling keeps the IoU of large blobs.
+    first = np.zeros((400, 600), dtype=bool)
+    first[100:300, 100:400] = True
+    second = np.zeros_like(first)
+    second[150:350, 200:500] = True
+    encoded = [RunLengthMask.encode(first), RunLengthMask.encode(second)]
+    np.testing.assert_array_equal(encoded[0].resize((60, 40)), first[::10, ::10])
+    downscaled = iou_matrix(encoded, encoded, max_side=60)
+    np.testing.assert_allclose(np.diag(downscaled), 1.0, atol=1e-5)
+    assert downscaled[0, 1] == pytest.approx(encoded[0].iou(encoded[1]), abs=0.02)
+
+
+@pytest.mark.unit
+def test_mask_writer_round_trip(tmp_path):
+    path = tmp_path / "masks.npz"
+    first = np.zeros((8, 6), dtype=bool)
+    first[2:5, 1:3] = True
+    second = np.zeros((8, 6), dtype=bool)
+    second[4:, 3:] = True
+
+    with MaskWriter(path=path, size=(6, 8)) as writer:
+        writer.add(frame=0, object_id=3, mask=first)
+        writer.add(frame=2, object_id=3, mask=first)
+        writer.add(frame=2, object_id=7, mask=second)
+        writer.add(frame=3, object_id=7, mask=np.zeros_like(second))
+        writer.advance(5)
+        with pytest.raises(ValueError):
+            writer.add(frame=1, object_id=3, mask=first)
+
+    with MaskReader(path) as reader:
+        assert (reader.width, reader.height, len(reader)) == (6, 8, 5)
+        assert reader.object_ids == [3, 7]
+        assert list(reader.masks(2)) == [3, 7]
+        assert reader.masks(1) == {}
+        np.testing.assert_array_equal(reader.mask(2, 7), second)
+        assert not reader.mask(3, 7).any()
+        labels = reader.labels(2)
+        assert labels[first].tolist() == [1] * first.sum()
+        assert labels[second].tolist() == [2] * second.sum()
+        assert [mask.any() for mask in reader.track(3)] == [True, False, True, False, False]
+        assert [frame for frame, _ in reader.sparse_track(3)] == [0, 2]
+
+    assert mask_tracks([path]) == [("3", path, 3), ("7", path, 7)]
+    masks = list(read_track(path, object_id=3, start_frame=2, max_side=4))
+    assert len(masks) == 3
+    # Downscaled like the frames of the video.
+    assert masks[0].shape == (4, 4) and masks[0].dtype == bool
+
+    # Nothing is written if the writing fails.
+    with pytest.raises(ValueError):
+        with MaskWriter(path=tmp_path / "failed.npz", size=(6, 8)) as writer:
+            writer.add(frame=0, object_id=0, mask=np.ones((2, 2), dtype=bool))
+    assert not (tmp_path / "failed.npz").exists()
+
+
+@pytest.mark.unit
+def test_sparse_mask_video(tmp_path, monkeypatch):
+    import cv2
+
+    monkeypatch.setattr("psifx.io.video.VIDEO_BACKEND", "opencv")
+
+    # A sparse track, encoded as the mask writer does, holding the frames 2, 3 and 6 out of 8.
+    path = tmp_path / "4.mp4"
+    masks = [np.zeros((32, 48), dtype=bool) for _ in range(3)]
+    for value, mask in enumerate(masks):
+        mask[:16, 16 * value:16 * (value + 1)] = True
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, (48, 32))
+    for mask in masks:
+        writer.write(np.repeat(mask[..., None], 3, axis=-1).astype(np.uint8) * 255)
+    writer.release()
+    write_track_index(path, spans=[[2, 4], [6, 7]], size=(48, 32), num_frames=8)
+
+    assert mask_tracks([tmp_path]) == [("4", path, None)]
+    # Along with the checkpoint of an interrupted inference.
+    (tmp_path / ".checkpoint" / "000000000").mkdir(parents=True)
+    assert mask_tracks([tmp_path]) == [("4", path, None)]
+    (tmp_path / "notes.txt").write_text("notes")
+    with pytest.raises(ValueError):
+        mask_tracks([tmp_path])
+    (tmp_path / "notes.txt").unlink()
+    sparse = [(frame, mask.copy()) for frame, mask in read_sparse_track(path)]
+    assert [frame for frame, _ in sparse] == [2, 3, 6]
+    for (_, mask), expected in zip(sparse, masks):
+        np.testing.assert_array_equal(mask, expected)
+    assert [frame for frame, _ in read_sparse_track(path, start_frame=3)] == [3, 6]
+
+    # Read on every frame by the consumers of dense tracks.
+    dense = [mask.copy() for mask in read_track(path, start_frame=1)]
+    assert len(dense) == 7
+    assert [mask.any() for mask in dense] == [False, True, True, False, False, True, False]
+    np.testing.assert_array_equal(dense[5], masks[2])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("ffmpeg", [True, False])
+def test_mask_video_backend(tmp_path, monkeypatch, ffmpeg):
+    import psifx.io.mask as mask_module
+
+    backends = []
+
+    class RecordingVideoReader:
+        outputwidth, outputheight = 4, 2
+
+        def __init__(self, backend=None, **kwargs):
+            assert kwargs["gray"]
+            backends.append(backend)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return None
+
+        def __iter__(self):
+            return iter([np.full((2, 4), 255, dtype=np.uint8)])
+
+    monkeypatch.setattr(mask_module, "VideoReader", RecordingVideoReader)
+    monkeypatch.setattr(mask_module.shutil, "which", lambda name: "/usr/bin/ffmpeg" if ffmpeg else None)
+    path = tmp_path / "1.mp4"
+    path.write_bytes(b"video")
+
+    assert [mask.all() for mask in read_track(path)] == [True]
+    # The masks are decoded to grayscale by ffmpeg when available, by the configured backend otherwise.
+    assert backends == ["ffmpeg" if ffmpeg else None]
+
+
+@pytest.mark.unit
+def test_concat_tracks(tmp_path):
+    with pytest.raises(ValueError):
+        concat_tracks([], tmp_path / "empty.mp4")
+
+    indexed, dense = tmp_path / "0" / "1.mp4", tmp_path / "1" / "1.mp4"
+    for segment_path in [indexed, dense]:
+        segment_path.parent.mkdir()
+        segment_path.write_bytes(b"video")
+    write_track_index(indexed, spans=[[2, 4]], size=(48, 32), num_frames=4)
+
+    # The frames of the mask videos without index are unknown.
+    with pytest.raises(ValueError, match=str(dense)):
+        concat_tracks([indexed, dense], tmp_path / "1.mp4")
+    assert not (tmp_path / "1.mp4").exists()
+
+    concat_tracks([indexed], tmp_path / "1.mp4", num_frames=8)
+    assert (tmp_path / "1.mp4").read_bytes() == b"video"
+    assert read_track_index(tmp_path / "1.mp4")["spans"] == [[2, 4]]
+    assert read_track_index(tmp_path / "1.mp4")["num_frames"] == 8
@@ -0,0 +1,48 @@
+"""Unit tests for the columnar NPZ reader and writer."""
+
+import numpy as np
+import pytest
+
+from psifx.io import npz
+
+
+@pytest.mark.unit
+def test_npz_writer_round_trip_is_memory_mapped(tmp_path):
+    path = tmp_path / "poses.npz"
+    edges = {"pose_keypoints_2d": [[0, 1], [1, 2]]}
+    poses = np.random.default_rng(0).random((50, 3, 3), dtype=np.float32)
+
+    with npz.NPZWriter(path=path) as writer:
+        writer.set(key="edges", value=edges)
+        for i, pose in enumerate(poses):
+            writer.add_frame(frame=2 * i, values={"pose_keypoints_2d": pose})
+
+    with npz.NPZReader(path) as reader:
+        assert isinstance(reader["pose_keypoints_2d"], np.memmap)
+        assert reader["pose_keypoints_2d"].shape == (50, 3, 3)
+        assert reader.edges == edges
+
+        frames = reader.frames()
+        assert len(frames) == 50
+        assert list(frames)[:3] == [0, 2, 4]
+        np.testing.assert_array_equal(frames[10]["pose_keypoints_2d"], poses[5])
+
+    # The file remains a regular NPZ archive.
+    with np.load(path) as archive:
+        np.testing.assert_array_equal(archive["frames"], np.arange(0, 100, 2))
+        np.testing.assert_array_equal(archive["pose_keypoints_2d"], poses)
+
+
+@pytest.mark.unit
+def test_npz_writer_checks_shapes_and_cleans_up(tmp_path):
+    path = tmp_path / "poses.npz"
+
+    with pytest.raises(ValueError):
+        with npz.NPZWriter(path=path) as writer:
+            writer.append(key="points", value=np.zeros((1, 3)))
+            writer.append(key="points", value=np.zeros((1, 2)))
+
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(FileExistsError):
+        npz.NPZWriter.write({"a": np.zeros(3)}, path=path, verbose=False)
+        npz.NPZWriter.check(path=path)
@@ -0,0 +1,191 @@
+"""Unit tests for the TAR archive reader and writer."""
+
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+from psifx.io import tar
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("suffix", [".tar", ".tar.gz"])
+def test_tar_writer_streams_members(tmp_path, suffix):
+    path = tmp_path / f"poses{suffix}"
+
+    with tar.TarWriter(path=path) as writer:
+        writer.add(key="edges.json", value=json.dumps({"pose": [[0, 1]]}))
+        for i in range(3):
+            writer.add(key=f"{i: 015d}.json", value=json.dumps({"pose": [float(i)] * 3}))
+
+    with tarfile.open(path, mode="r") as archive:
+        names = archive.getnames()
+    assert names[0] == "poses/edges.json"
+    assert len(names) == 4
+
+    content = tar.TarReader.read(path, verbose=False)
+    assert json.loads(content[f"{2: 015d}.json"]) == {"pose": [2.0, 2.0, 2.0]}
+
+
+@pytest.mark.unit
+def test_tar_writer_removes_partial_archive_on_error(tmp_path):
+    path = tmp_path / "poses.tar.gz"
+
+    with pytest.raises(RuntimeError):
+        with tar.TarWriter(path=path) as writer:
+            writer.add(key="edges.json", value="{}")
+            raise RuntimeError("inference failed")
+
+    assert not path.exists()
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("suffix", [".tar", ".tar.gz", ".tar.xz"])
+def test_tar_reader_random_access(tmp_path, suffix):
+    path = tmp_path / f"poses{suffix}"
+    frames = {i: {"pose": [float(i)] * 50} for i in range(1000)}
+    tar.TarWriter.write(
+        dictionary={f"{i: 015d}.json": json.dumps(v) for i, v in frames.items()},
+        path=path,
+        verbose=False,
+    )
+
+    with tar.TarReader(path=path, verbose=False) as reader:
+        if suffix != ".tar":
+            assert len(reader.blocks) > 1
+        poses = reader.frames(decoder=json.loads)
+        assert len(poses) == 1000
+        for i in [650, 3, 999, 0, 4]:
+            assert poses[i] == frames[i]
+        assert [i for i, _ in poses.iter_range(start=20, end=25)] == list(range(20, 25))
+
+    # The index is rebuilt when missing from the cache.
+    tar.index_path(path).unlink()
+    with tar.TarReader(path=path, verbose=False) as reader:
+        assert json.loads(reader[f"{123: 015d}.json"]) == frames[123]
+
+
+@pytest.mark.unit
+def test_tar_index_cache_eviction(tmp_path, monkeypatch):
+    paths = [tmp_path / f"poses_{i}.tar" for i in range(4)]
+    for i, path in enumerate(paths[:3]):
+        tar.TarWriter.write(dictionary={"a.json": "{}"}, path=path, verbose=False)
+        os.utime(tar.index_path(path), (i, i))
+    size = tar.index_path(paths[0]).stat().st_size
+
+    # Beyond the maximum size, the least recently used indexes are evicted.
+    with tar.TarReader(path=paths[0], verbose=False):
+        pass
+    monkeypatch.setattr("psifx.utils.cache.CACHE_SIZE", 2 * size)
+    tar.TarWriter.write(dictionary={"a.json": "{}"}, path=paths[3], verbose=False)
+    assert [tar.index_path(path).exists() for path in paths] == [True, False, False, True]
+
+
+@pytest.mark.unit
+def test_tar_index_cache_disabled(tmp_path, cache_path, monkeypatch):
+    monkeypatch.setattr("psifx.utils.cache.CACHE", False)
+    path = tmp_path / "poses.tar"
+    tar.TarWriter.write(dictionary={"a.json": "{}"}, path=path, verbose=False)
+    with tar.TarReader(path=path, verbose=False) as reader:
+        assert reader["a.json"] == b"{}"
+    assert not cache_path.exists()
+
+
+@pytest.mark.unit
+def test_tar_reader_legacy_archive(tmp_path):
+    path = tmp_path / "legacy.tar.gz"
+    with tarfile.open(path, mode="w:gz") as archive:
+        for i in range(10):
+            value = json.dumps({"pose": [i]}).encode()
+            tarinfo = tarfile.TarInfo(name=f"legacy/{i: 015d}.json")
+            tarinfo.size = len(value)
+            archive.addfile(tarinfo, io.BytesIO(value))
+
+    with tar.TarReader(path=path, verbose=False) as reader:
+        poses = reader.frames(decoder=json.loads)
+        assert poses[7] == {"pose": [7]}
+        assert poses[2] == {"pose": [2]}
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("suffix", [".tar.gz", ".tar.zst"])
+def test_tar_writer_threaded_compression(tmp_path, suffix):
+    if suffix == ".tar.zst":
+        pytest.importorskip("zstandard")
+    dictionary = {f"{i: 015d}.json": json.dumps({"pose": [i / 7] * 50}) for i in range(2000)}
+
+    tar.TarWriter.write(dictionary, path=tmp_path / f"single{suffix}", verbose=False)
+    tar.TarWriter.write(dictionary, path=tmp_path / f"threaded{suffix}", verbose=False, level=1, threads=4)
+
+    with tar.TarReader(tmp_path / f"threaded{suffix}", verbose=False) as reader:
+        assert len(reader.blocks) > 1
+        assert reader[f"{1234: 015d}.json"] == dictionary[f"{1234: 015d}.json"].encode()
+    assert tar.TarReader.read(tmp_path / f"single{suffix}", verbose=False) == {
+        key: value.encode() for key, value in dictionary.items()
+    }
+
+
+@pytest.mark.unit
+def test_sharded_tar_archive(tmp_path):
+    path = tmp_path / "poses.tar.gz"
+    dictionary = {"edges.json": json.dumps({"pose": [[0, 1]]})}
+    dictionary.update({f"{i: 015d}.json": json.dumps({"pose": [float(i)] * 3}) for i in range(3, 250)})
+
+    tar.TarWriter.write(dictionary, path=path, verbose=False, shard_size=100)
+
+    assert tar.is_sharded(path)
+    assert sorted(p.name for p in path.iterdir()) == ["00000.tar.gz", "00001.tar.gz", "00002.tar.gz", "manifest.json"]
+    with tar.TarReader(path, verbose=False) as reader:
+        assert isinstance(reader, tar.ShardedTarReader)
+        assert len(reader) == len(dictionary)
+        assert reader["edges.json"] == dictionary["edges.json"].encode()
+        assert reader[f"{150: 015d}.json"] == dictionary[f"{150: 015d}.json"].encode()
+        frames = list(reader.iter_frames(start=90, end=210, decoder=json.loads))
+        assert [frame for frame, _ in frames] == list(range(90, 210))
+        assert frames[-1][1] == {"pose": [209.0, 209.0, 209.0]}
+        with pytest.raises(KeyError):
+            reader[f"{250: 015d}.json"]
+
+    with pytest.raises(ValueError):
+        with tar.TarWriter(path=tmp_path / "unordered.tar", shard_size=10) as writer:
+            writer.add(key=f"{20: 015d}.json", value="{}")
+            writer.add(key=f"{5: 015d}.json", value="{}")
+    assert not (tmp_path / "unordered.tar").exists()
+
+
+@pytest.mark.unit
+def test_sharded_tar_archive_resume(tmp_path):
+    path = tmp_path / "poses.tar"
+    frames = {f"{i: 015d}.json": json.dumps({"pose": [float(i)]}) for i in range(250)}
+
+    # The run is interrupted within the third shard, only the completed shards are kept.
+    with pytest.raises(KeyboardInterrupt):
+        with tar.ShardedTarWriter(path=path, shard_size=100, resume=True) as writer:
+            writer.add(key="edges.json", value="{}")
+            for i, (key, value) in enumerate(frames.items()):
+                if i == 230:
+                    raise KeyboardInterrupt
+                writer.add(key=key, value=value)
+    assert not tar.load_manifest(path)["complete"]
+    # The truncated archive is not read as if it were complete.
+    with pytest.raises(ValueError):
+        tar.TarReader(path, verbose=False)
+    with tar.TarReader(path, verbose=False, allow_incomplete=True) as reader:
+        assert [frame for frame, _ in reader.iter_frames()] == list(range(200))
+
+    with tar.ShardedTarWriter(path=path, shard_size=100, resume=True) as writer:
+        assert writer.next_frame == 200
+        writer.add(key="edges.json", value="{}")
+        for key, value in list(frames.items())[writer.next_frame:]:
+            writer.add(key=key, value=value)
+
+    assert tar.load_manifest(path)["complete"]
+    with tar.TarReader(path, verbose=False) as reader:
+        assert len(reader) == len(frames) + 1
+        assert [frame for frame, _ in reader.iter_frames()] == list(range(250))
+
+    # A single archive replaces the sharded one.
+    tar.TarWriter.write(frames, path=path, overwrite=True, verbose=False)
+    assert path.is_file() and not tar.is_sharded(path)
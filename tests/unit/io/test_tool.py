@@ -0,0 +1,67 @@
+"""Unit tests for the archive conversion tool."""
+
+import json
+import tarfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from psifx.io import npz, tar
+from psifx.io.tool import ConversionTool, convert_archive
+
+
+@pytest.mark.unit
+def test_conversion_tool_round_trip(tmp_path):
+    edges = {"pose_keypoints_2d": [[0, 1]]}
+    for name in ["a", "nested/b"]:
+        path = tmp_path / "poses" / f"{name}.tar.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tar.TarWriter(path=path) as writer:
+            writer.add(key="edges.json", value=json.dumps(edges))
+            for i in range(5):
+                writer.add(key=f"{i: 015d}.json", value=json.dumps({"pose_keypoints_2d": [i, 0.5, 1.0]}))
+
+    tool = ConversionTool(num_workers=2, verbose=False)
+    tool.convert(input_path=tmp_path / "poses", output_path=tmp_path / "npz", format="npz")
+
+    with npz.NPZReader(tmp_path / "npz" / "nested" / "b.npz") as reader:
+        assert reader.edges == edges
+        np.testing.assert_allclose(reader.frames()[3]["pose_keypoints_2d"], [[3, 0.5, 1.0]])
+
+    tool.convert(input_path=tmp_path / "npz", format="tar.gz")
+
+    content = tar.TarReader.read(tmp_path / "npz" / "a.tar.gz", verbose=False)
+    assert json.loads(content["edges.json"]) == edges
+    assert json.loads(content[f"{4: 015d}.json"]) == {"pose_keypoints_2d": [4.0, 0.5, 1.0]}
+
+    with pytest.raises(FileExistsError):
+        tool.convert(input_path=tmp_path / "npz", format="tar.gz")
+
+
+@pytest.mark.unit
+def test_convert_legacy_pose_archive(tmp_path):
+    # Its frames without face were filled with 468 points, while the refined faces have 478, with the irises.
+    path = Path(__file__).parents[2] / "integration" / "data" / "PosesDir" / "1.tar.gz"
+    with tarfile.open(path) as archive:
+        members = {
+            int(Path(member.name).stem): json.loads(archive.extractfile(member).read())
+            for member in archive.getmembers()
+            if member.name.endswith(".json") and not member.name.endswith("edges.json")
+        }
+    sizes = {len(values["face_keypoints_2d"]) for values in members.values()}
+    assert sizes == {468 * 3, 478 * 3}
+
+    convert_archive(input_path=path, output_path=tmp_path / "poses.npz")
+
+    with npz.NPZReader(tmp_path / "poses.npz") as reader:
+        frames = reader.frames()
+        assert len(frames) == len(members)
+        for frame, values in members.items():
+            face = frames[frame]["face_keypoints_2d"]
+            # Laid out per point, as the pose estimation tool writes them.
+            assert face.shape == (478, 3)
+            # The legacy rows are zero-padded.
+            face = face.reshape(-1)
+            np.testing.assert_array_equal(face[:len(values["face_keypoints_2d"])], values["face_keypoints_2d"])
+            assert not face[len(values["face_keypoints_2d"]):].any()
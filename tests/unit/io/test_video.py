@@ -0,0 +1,278 @@
+"""Unit tests for the video reader."""
+
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="FFmpeg is not installed.")
+
+VIDEO_PATH = Path(__file__).parents[2] / "integration" / "data" / "1.mp4"
+
+
+@pytest.mark.unit
+@requires_ffmpeg
+def test_video_reader_prefetch_and_start_frame():
+    from psifx.io.video import VideoReader
+
+    with VideoReader(path=VIDEO_PATH) as reader:
+        frames = list(reader)
+
+    with VideoReader(path=VIDEO_PATH, prefetch=4) as reader:
+        prefetched = list(reader)
+        assert reader.stats["frames"] == len(frames)
+        assert "frames" in reader.report()
+    assert len(prefetched) == len(frames)
+    assert all(np.array_equal(a, b) for a, b in zip(prefetched, frames))
+
+    with VideoReader(path=VIDEO_PATH, start_frame=10, prefetch=4) as reader:
+        assert len(reader) == len(frames) - 10
+        np.testing.assert_array_equal(next(reader), frames[10])
+
+
+@pytest.mark.unit
+@requires_ffmpeg
+def test_video_reader_range():
+    from psifx.io.video import VideoReader
+
+    with VideoReader(path=VIDEO_PATH) as reader:
+        frame_rate = reader.inputfps
+        frames = list(reader)
+
+    with VideoReader(path=VIDEO_PATH, start_frame=5, end_frame=12) as reader:
+        assert len(reader) == 7
+        ranged = list(reader)
+    assert len(ranged) == 7
+    np.testing.assert_array_equal(ranged[0], frames[5])
+    np.testing.assert_array_equal(ranged[-1], frames[11])
+
+    with VideoReader(path=VIDEO_PATH, start=5 / frame_rate, end=12 / frame_rate) as reader:
+        assert len(reader) == 7
+        np.testing.assert_array_equal(next(reader), frames[5])
+
+    with VideoReader(path=VIDEO_PATH, start_frame=len(frames) + 10) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+
+    with pytest.raises(ValueError):
+        VideoReader(path=VIDEO_PATH, start_frame=12, end_frame=5)
+
+
+@pytest.mark.unit
+@requires_ffmpeg
+def test_video_reader_downscaling():
+    from psifx.io.video import VideoReader
+
+    with VideoReader(path=VIDEO_PATH, max_side=64) as reader:
+        frame = next(reader)
+        assert max(frame.shape[:2]) <= 64
+        assert (reader.outputwidth, reader.outputheight) == (frame.shape[1], frame.shape[0])
+        assert max(reader.inputwidth, reader.inputheight) > 64
+
+
+@pytest.mark.unit
+def test_video_reader_opencv_backend():
+    from psifx.io.video import VideoReader, benchmark_backends
+
+    with VideoReader(path=VIDEO_PATH, backend="opencv") as reader:
+        assert type(reader).__name__ == "OpenCVVideoReader"
+        frames = list(reader)
+    assert len(frames) == len(reader)
+    assert frames[0].ndim == 3 and frames[0].shape[2] == 3
+
+    with VideoReader(path=VIDEO_PATH, start_frame=5, end_frame=12, prefetch=4, backend="opencv") as reader:
+        ranged = list(reader)
+    assert len(ranged) == 7
+    np.testing.assert_array_equal(ranged[0], frames[5])
+    np.testing.assert_array_equal(ranged[-1], frames[11])
+
+    with VideoReader(path=VIDEO_PATH, max_side=64, backend="opencv") as reader:
+        assert max(next(reader).shape[:2]) <= 64
+
+    with pytest.raises(ValueError):
+        VideoReader(path=VIDEO_PATH, backend="unknown")
+
+    assert list(benchmark_backends(VIDEO_PATH, backends=["opencv"], n_frames=10)) == ["opencv"]
+
+
+@pytest.mark.unit
+@requires_ffmpeg
+def test_video_writer_queue(tmp_path):
+    from psifx.io.video import VideoReader, VideoWriter
+
+    path = tmp_path / "video.mp4"
+    image = np.zeros((32, 48, 3), dtype=np.uint8)
+    with VideoWriter(path=path, output_dict={"-c:v": "libx264", "-qp": "0"}, queue_size=2) as writer:
+        for value in range(10):
+            # The buffered frames are copies, so the image can be reused.
+            image[:] = 20 * value
+            writer.write(image=image)
+
+    with VideoReader(path=path) as reader:
+        frames = list(reader)
+    assert len(frames) == 10
+    for value, frame in enumerate(frames):
+        assert abs(int(np.median(frame)) - 20 * value) <= 2
+
+
+@pytest.mark.unit
+def test_probe_cache(tmp_path, monkeypatch):
+    from psifx.io import video
+
+    monkeypatch.setattr(video, "PROBE_CACHE", True)
+    monkeypatch.setattr(video, "_probes", {})
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"video")
+
+    assert video.load_probe(path) is None
+    video.save_probe(path, {"info": {"video": {"@nb_frames": "42"}}})
+    assert video.load_probe(path)["info"]["video"]["@nb_frames"] == "42"
+
+    # Reloaded from disk by another process.
+    monkeypatch.setattr(video, "_probes", {})
+    assert video.load_probe(path)["info"]["video"]["@nb_frames"] == "42"
+
+    # Invalidated once the video changes.
+    path.write_bytes(b"another video")
+    assert video.load_probe(path) is None
+
+
+class _FakeReader:
+    start_frame = 2
+
+    def __init__(self, n_frames):
+        self.frames = [np.full((4, 4, 3), index, dtype=np.uint8) for index in range(self.start_frame, n_frames)]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+
+@pytest.mark.unit
+def test_frame_bus():
+    from psifx.io.video import FrameBus
+
+    received = {"a": [], "b": []}
+    bus = FrameBus(_FakeReader(10), queue_size=2)
+    for name in received:
+        bus.register(lambda index, frame, name=name: received[name].append((index, int(frame[0, 0, 0]))))
+    bus.run(verbose=False)
+    assert received["a"] == received["b"] == [(index, index) for index in range(2, 10)]
+
+    def fail(index, frame):
+        # The frames are shared, so they are read-only.
+        frame[0, 0, 0] = 0
+
+    bus = FrameBus(_FakeReader(100), queue_size=2)
+    bus.register(fail)
+    bus.register(lambda index, frame: None)
+    with pytest.raises(ValueError):
+        bus.run(verbose=False)
+
+
+@pytest.mark.unit
+def test_video_reader_buffers():
+    from psifx.io.video import VideoReader
+
+    with VideoReader(path=VIDEO_PATH, backend="opencv") as reader:
+        frames = list(reader)
+
+    with VideoReader(path=VIDEO_PATH, buffers=2, prefetch=4, backend="opencv") as reader:
+        ids = set()
+        for frame, expected in zip(reader, frames):
+            np.testing.assert_array_equal(frame, expected)
+            ids.add(id(frame))
+    # The ring holds the frames of the caller, the prefetched ones and the one being decoded.
+    assert len(ids) == 2 + 4 + 1
+
+    out = np.empty_like(frames[0])
+    with VideoReader(path=VIDEO_PATH, start_frame=3, backend="opencv") as reader:
+        assert reader.read(out=out) is out
+        np.testing.assert_array_equal(out, frames[3])
+        while reader.read(out=out) is not None:
+            pass
+        np.testing.assert_array_equal(out, frames[-1])
+
+
+@pytest.mark.unit
+def test_frame_bus_buffers():
+    from psifx.io.video import FrameBus, VideoReader
+
+    with VideoReader(path=VIDEO_PATH, backend="opencv") as reader:
+        frames = list(reader)
+
+    with VideoReader(path=VIDEO_PATH, buffers=2, backend="opencv") as reader:
+        with pytest.raises(ValueError):
+            FrameBus(reader, queue_size=2)
+
+    received = []
+
+    def consume(index, frame):
+        time.sleep(0.001)
+        received.append((index, frame.copy()))
+
+    with VideoReader(path=VIDEO_PATH, buffers=4, prefetch=2, backend="opencv") as reader:
+        bus = FrameBus(reader, queue_size=2)
+        bus.register(consume)
+        bus.run(verbose=False)
+    assert [index for index, _ in received] == list(range(len(frames)))
+    for (_, frame), expected in zip(received, frames):
+        np.testing.assert_array_equal(frame, expected)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("accurate", [True, False])
+def test_opencv_video_reader_seek(monkeypatch, accurate):
+    import cv2
+    from psifx.io.video import VideoReader
+
+    with VideoReader(path=VIDEO_PATH, backend="opencv") as reader:
+        frames = list(reader)
+
+    class InaccurateCapture:
+        def __init__(self, path):
+            self.capture = video_capture(path)
+            self.position = 0.0
+
+        def __getattr__(self, name):
+            return getattr(self.capture, name)
+
+        def set(self, prop, value):
+            # Lands a few frames early, yet reports the requested position.
+            if prop == cv2.CAP_PROP_POS_FRAMES:
+                self.capture.set(prop, max(value - 3, 0))
+                self.position = value
+                return True
+            return self.capture.set(prop, value)
+
+        def get(self, prop):
+            if prop == cv2.CAP_PROP_POS_FRAMES:
+                return self.position
+            return self.capture.get(prop)
+
+    video_capture = cv2.VideoCapture
+    if not accurate:
+        monkeypatch.setattr(cv2, "VideoCapture", InaccurateCapture)
+    for start_frame in [1, 7, 40, len(frames) - 1]:
+        end_frame = start_frame + 2
+        with VideoReader(path=VIDEO_PATH, start_frame=start_frame, end_frame=end_frame, backend="opencv") as reader:
+            for frame, expected in zip(reader, frames[start_frame:end_frame], strict=True):
+                np.testing.assert_array_equal(frame, expected)
+
+
+@pytest.mark.unit
+def test_video_reader_gray():
+    import cv2
+    from psifx.io.video import VideoReader
+
+    with VideoReader(path=VIDEO_PATH, end_frame=5, backend="opencv") as reader:
+        frames = list(reader)
+
+    with VideoReader(path=VIDEO_PATH, end_frame=5, prefetch=2, buffers=1, gray=True, backend="opencv") as reader:
+        for frame, expected in zip(reader, frames):
+            assert frame.shape == expected.shape[:2]
+            np.testing.assert_allclose(frame, cv2.cvtColor(expected, cv2.COLOR_RGB2GRAY), atol=1)
@@ -0,0 +1,116 @@
+"""Unit tests for the MediaPipe pose estimation tool."""
+
+import enum
+from pathlib import Path
+import sys
+import types
+
+import numpy as np
+import pytest
+
+try:
+    import mediapipe  # noqa: F401
+except ImportError:
+    holistic_module = types.ModuleType("mediapipe.python.solutions.holistic")
+    holistic_module.Holistic = object
+    holistic_module.PoseLandmark = enum.Enum("PoseLandmark", [f"POINT_{i}" for i in range(33)])
+    holistic_module.HandLandmark = enum.Enum("HandLandmark", [f"POINT_{i}" for i in range(21)])
+    holistic_module.POSE_CONNECTIONS = frozenset({(0, 1), (1, 2)})
+    holistic_module.HAND_CONNECTIONS = frozenset({(0, 1), (1, 2)})
+    holistic_module.FACEMESH_TESSELATION = frozenset({(0, 1), (1, 2)})
+    face_mesh_module = types.ModuleType("mediapipe.python.solutions.face_mesh")
+    face_mesh_module.FACEMESH_NUM_LANDMARKS_WITH_IRISES = 478
+    for name in ["mediapipe", "mediapipe.python", "mediapipe.python.solutions"]:
+        sys.modules[name] = types.ModuleType(name)
+    sys.modules["mediapipe.python.solutions.holistic"] = holistic_module
+    sys.modules["mediapipe.python.solutions.face_mesh"] = face_mesh_module
+
+import psifx.video.pose.mediapipe.tool as mediapipe_tool_module
+from psifx.io import npz
+from psifx.video.pose.mediapipe import skeleton
+from psifx.video.pose.mediapipe.tool import MediaPipePoseEstimationTool
+
+VIDEO_PATH = Path(__file__).parents[3] / "integration" / "data" / "1.mp4"
+
+
+class FakeHolistic:
+    """Deterministic stand-in for the MediaPipe model, whose landmarks depend on the frame only."""
+
+    interrupt_at = None
+
+    def __init__(self, **kwargs):
+        self.calls = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return None
+
+    def process(self, image):
+        if self.calls == FakeHolistic.interrupt_at:
+            raise KeyboardInterrupt
+        self.calls += 1
+        value = float(image.mean()) / 255
+
+        def landmarks(n_points):
+            return types.SimpleNamespace(
+                landmark=[
+                    types.SimpleNamespace(x=value, y=1 - value, visibility=point / n_points)
+                    for point in range(n_points)
+                ]
+            )
+
+        return types.SimpleNamespace(
+            pose_landmarks=landmarks(skeleton.N_POSE_LANDMARKS),
+            # Frames without face are filled with zeros.
+            face_landmarks=landmarks(skeleton.N_FACE_LANDMARKS) if value > 0.3 else None,
+            left_hand_landmarks=None,
+            right_hand_landmarks=landmarks(skeleton.N_RIGHT_HAND_LANDMARKS),
+        )
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    monkeypatch.setattr(mediapipe_tool_module, "Holistic", FakeHolistic)
+    monkeypatch.setattr(FakeHolistic, "interrupt_at", None)
+    monkeypatch.setattr("psifx.io.video.VIDEO_BACKEND", "opencv")
+
+
+def read_npz(path):
+    with npz.NPZReader(path) as reader:
+        return {key: np.array(reader[key]) for key in reader.keys()}
+
+
+@pytest.mark.unit
+def test_checkpointed_npz_matches_uncheckpointed(tmp_path):
+    MediaPipePoseEstimationTool(verbose=False).inference(
+        video_path=VIDEO_PATH,
+        poses_path=tmp_path / "plain.npz",
+    )
+    MediaPipePoseEstimationTool(checkpoint_interval=10, verbose=False).inference(
+        video_path=VIDEO_PATH,
+        poses_path=tmp_path / "checkpointed.npz",
+    )
+
+    # Interrupted, then resumed from its checkpoint.
+    FakeHolistic.interrupt_at = 25
+    with pytest.raises(KeyboardInterrupt):
+        MediaPipePoseEstimationTool(checkpoint_interval=10, verbose=False).inference(
+            video_path=VIDEO_PATH,
+            poses_path=tmp_path / "resumed.npz",
+        )
+    FakeHolistic.interrupt_at = None
+    MediaPipePoseEstimationTool(checkpoint_interval=10, resume=True, verbose=False).inference(
+        video_path=VIDEO_PATH,
+        poses_path=tmp_path / "resumed.npz",
+    )
+
+    plain = read_npz(tmp_path / "plain.npz")
+    assert plain["face_keypoints_2d"].shape == (75, skeleton.N_FACE_LANDMARKS, 3)
+    for name in ["checkpointed", "resumed"]:
+        arrays = read_npz(tmp_path / f"{name}.npz")
+        assert arrays.keys() == plain.keys()
+        for key, value in plain.items():
+            assert arrays[key].dtype == value.dtype, key
+            np.testing.assert_array_equal(arrays[key], value, err_msg=key)
@@ -38,7 +38,9 @@ if not hasattr(transformers, "Sam3VideoModel"):
 if not hasattr(transformers, "Sam3VideoProcessor"):
     transformers.Sam3VideoProcessor = object
 
+import psifx.io.mask as mask_module
 import psifx.video.tracking.sam3.tool as sam3_tool_module
+from psifx.io.mask import RunLengthMask
 from psifx.video.tracking.sam3.tool import Sam3TrackingTool
 
 
@@ -59,10 +61,12 @@ class DummyVideoWriter:
         return None
 
 
-def make_tool() -> Sam3TrackingTool:
+def make_tool(overwrite: bool = True) -> Sam3TrackingTool:
     tool = Sam3TrackingTool.__new__(Sam3TrackingTool)
     tool.device = "cpu"
-    tool.overwrite = True
+    tool.checkpoint = False
+    tool.resume = False
+    tool.overwrite = overwrite
     tool.verbose = False
     return tool
 
@@ -70,8 +74,8 @@ def make_tool() -> Sam3TrackingTool:
 @pytest.mark.unit
 def test_map_chunk_object_ids_reuses_previous_global_id():
     tool = make_tool()
-    prev_mask = np.array([[1, 0], [0, 0]], dtype=bool)
-    new_mask = np.array([[0, 1], [0, 0]], dtype=bool)
+    prev_mask = RunLengthMask.encode(np.array([[1, 0], [0, 0]], dtype=bool))
+    new_mask = RunLengthMask.encode(np.array([[0, 1], [0, 0]], dtype=bool))
 
     chunk_outputs = {
         0: {"object_ids": [10], "masks": [prev_mask]},
@@ -92,36 +96,379 @@ def test_map_chunk_object_ids_reuses_previous_global_id():
 
 
 @pytest.mark.unit
-def test_write_chunk_masks_backfills_new_writer(monkeypatch):
-    monkeypatch.setattr(sam3_tool_module, "VideoWriter", DummyVideoWriter)
+def test_map_chunk_object_ids_maximizes_total_iou():
     tool = make_tool()
 
-    mask = np.array([[1, 0], [0, 0]], dtype=bool)
+    def strip(end):
+        mask = np.zeros((4, 10), dtype=bool)
+        mask[:, :end] = True
+        return RunLengthMask.encode(mask)
+
+    # Matching greedily would give the previous object 1 to the object 20, then leave the object 21 unmatched.
+    chunk_outputs = {0: {"object_ids": [20, 21], "masks": [strip(4), strip(2)]}}
+    prev_last_global_masks = {1: strip(2), 2: strip(10)}
+
+    mapping, next_global_id = tool._map_chunk_object_ids(
+        chunk_outputs=chunk_outputs,
+        prev_last_global_masks=prev_last_global_masks,
+        iou_threshold=0.3,
+        next_global_id=3,
+    )
+
+    assert mapping == {20: 2, 21: 1}
+    assert next_global_id == 3
+
+
+@pytest.mark.unit
+def test_write_chunk_masks_writes_sparse_tracks(monkeypatch, tmp_path):
+    monkeypatch.setattr(mask_module, "VideoWriter", DummyVideoWriter)
+    tool = make_tool()
+
+    mask = RunLengthMask.encode(np.array([[1, 0], [0, 0]], dtype=bool))
     chunk_outputs = {
         0: {"object_ids": [], "masks": []},
         1: {"object_ids": [7], "masks": [mask]},
+        2: {"object_ids": [], "masks": []},
+        3: {"object_ids": [7], "masks": [mask]},
     }
-    id_mapping = {7: 2}
     writers = {}
-    written_frames = {}
 
     tool._write_chunk_masks(
         chunk_outputs=chunk_outputs,
-        id_mapping=id_mapping,
+        id_mapping={7: 2},
         writers=writers,
-        written_frames=written_frames,
-        mask_dir=Path("/tmp/masks"),
+        mask_dir=tmp_path,
         frame_rate="25/1",
         frame_size=(2, 2),
         start_frame=2,
     )
+    writers[2].advance(8)
+    video_writer = writers[2]._writer
+    writers[2].close()
+
+    # Only the frames where the object is present are encoded, without any back-fill.
+    assert len(video_writer.frames) == 2
+    assert all(frame[0, 0].min() == 255 for frame in video_writer.frames)
+    index = mask_module.read_track_index(tmp_path / "2.mp4")
+    assert index["spans"] == [[3, 4], [5, 6]]
+    assert index["num_frames"] == 8
+
+
+@pytest.mark.unit
+def test_write_chunk_masks_upscales_downscaled_masks(monkeypatch, tmp_path):
+    monkeypatch.setattr(mask_module, "VideoWriter", DummyVideoWriter)
+    tool = make_tool()
+
+    mask = RunLengthMask.encode(np.array([[1, 0], [0, 0]], dtype=bool))
+    writers = {}
+
+    tool._write_chunk_masks(
+        chunk_outputs={0: {"object_ids": [1], "masks": [mask]}},
+        id_mapping={1: 0},
+        writers=writers,
+        mask_dir=tmp_path,
+        frame_rate="25/1",
+        frame_size=(4, 4),
+        start_frame=0,
+    )
+
+    frame = writers[0]._writer.frames[0]
+    assert frame.shape == (4, 4, 3)
+    assert frame[:2, :2].min() == 255
+    assert frame[2:].max() == 0 and frame[:, 2:].max() == 0
+
+
+@pytest.mark.unit
+def test_write_chunk_masks_to_mask_archive(tmp_path):
+    from psifx.io.mask import MaskReader, MaskWriter
+
+    tool = make_tool()
+    mask = np.array([[1, 0], [0, 0]], dtype=bool)
+    writers = {}
+
+    with MaskWriter(path=tmp_path / "masks.npz", size=(4, 4)) as mask_writer:
+        tool._write_chunk_masks(
+            chunk_outputs={
+                0: {"object_ids": [1], "masks": [RunLengthMask.encode(mask)]},
+                1: {"object_ids": [1, 2], "masks": [RunLengthMask.encode(mask), RunLengthMask.encode(~mask)]},
+            },
+            id_mapping={1: 0, 2: 5},
+            writers=writers,
+            mask_dir=tmp_path,
+            frame_rate="25/1",
+            frame_size=(4, 4),
+            start_frame=3,
+            mask_writer=mask_writer,
+        )
+        mask_writer.advance(6)
+
+    assert writers == {}
+    with MaskReader(tmp_path / "masks.npz") as reader:
+        assert reader.num_frames == 6
+        assert reader.object_ids == [0, 5]
+        assert reader.masks(0) == {}
+        assert list(reader.masks(4)) == [0, 5]
+        # The masks are upscaled back to the original resolution.
+        np.testing.assert_array_equal(reader.mask(4, 0), np.kron(mask, np.ones((2, 2), dtype=bool)))
+        assert not reader.mask(3, 5).any()
+
+
+class DummyVideoReader:
+    """Stand-in for VideoReader, only probing the video."""
+
+    def __init__(self, path, **kwargs):
+        self.frame_rate = "25/1"
+        self.inputwidth, self.inputheight = 2, 2
+        self.num_frames = 10
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+
+class RecordingVideoWriter(DummyVideoWriter):
+    """In-memory stand-in for VideoWriter, keeping track of its instances."""
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instances.append(self)
+
+
+@pytest.mark.unit
+def test_infer_writes_chunks_in_order(monkeypatch, tmp_path):
+    monkeypatch.setattr(mask_module, "VideoWriter", RecordingVideoWriter)
+    monkeypatch.setattr(sam3_tool_module, "VideoReader", DummyVideoReader)
+    monkeypatch.setattr(RecordingVideoWriter, "instances", [])
+    tool = make_tool()
+
+    # The "frames" are the masks the dummy model returns for them.
+    frames = [np.array([[i % 2, 0], [0, 1]], dtype=bool) for i in range(7)]
+
+    def iter_video_chunks(video_path, chunk_size, max_side=None, start_frame=0):
+        for start in range(start_frame, len(frames), chunk_size):
+            yield start, frames[start:start + chunk_size]
 
-    assert 2 in writers
-    assert written_frames[2] == 4
-    assert len(writers[2].frames) == 4
+    def segment_chunk(chunk, text_prompt):
+        return {idx: {"object_ids": [1], "masks": [RunLengthMask.encode(mask)]} for idx, mask in enumerate(chunk)}
+
+    monkeypatch.setattr(tool, "_iter_video_chunks", iter_video_chunks)
+    monkeypatch.setattr(tool, "_segment_chunk", segment_chunk)
+
+    tool.infer(video_path=tmp_path / "video.mp4", mask_dir=tmp_path / "masks", chunk_size=3)
+
+    [writer] = RecordingVideoWriter.instances
+    assert [int(frame[0, 0, 0]) for frame in writer.frames] == [255 * (i % 2) for i in range(7)]
+
+    def failing_write_chunk_masks(**kwargs):
+        raise OSError("disk full")
+
+    # The errors of the background writing are raised by the inference.
+    monkeypatch.setattr(tool, "_write_chunk_masks", failing_write_chunk_masks)
+    with pytest.raises(OSError):
+        tool.infer(video_path=tmp_path / "video.mp4", mask_dir=tmp_path / "masks", chunk_size=3)
+
+
+@pytest.mark.unit
+def test_chunk_sizer_fits_measured_memory(monkeypatch):
+    from psifx.utils.memory import PeakMemory
+
+    gb = 1024 ** 3
+    monkeypatch.setattr(sam3_tool_module, "current_rss", lambda: 2 * gb)
+    per_frame = sam3_tool_module.estimate_frame_memory(640, 360, num_objects=1)
+    sizer = sam3_tool_module.ChunkSizer(budget=8 * gb, max_chunk_size=1000, frame_size=(640, 360))
+    assert sizer.next_size() == int(6 * gb * 0.9 // per_frame)
+
+    # The frames used twice the estimated memory, the chunks shrink.
+    peak = PeakMemory()
+    peak.start, peak.peak = 2 * gb, 2 * gb + 2 * 150 * per_frame
+    sizer.update(num_frames=150, num_objects=1, peak=peak)
+    assert sizer.next_size() == int(6 * gb * 0.9 // (2 * per_frame))
+
+    # Far below the budget, the chunks at most double, up to the largest size.
+    peak.peak = 2 * gb + 10 * per_frame
+    sizer.update(num_frames=100, num_objects=1, peak=peak)
+    assert sizer.next_size() == 200
+    for _ in range(3):
+        sizer.update(num_frames=sizer.next_size(), num_objects=1, peak=peak)
+    assert sizer.next_size() == 1000
+
+    # Over the budget, one frame at a time.
+    peak.start = 9 * gb
+    sizer.update(num_frames=10, num_objects=3, peak=peak)
+    assert sizer.next_size() == 1
+
+
+@pytest.mark.unit
+def test_infer_resumes_from_checkpoint(monkeypatch, tmp_path):
+    from psifx.io.mask import MaskReader
+
+    monkeypatch.setattr(sam3_tool_module, "VideoReader", DummyVideoReader)
+    tool = make_tool(overwrite=False)
+    tool.checkpoint = True
+
+    frames = [np.array([[i % 2, 0], [0, 1]], dtype=bool) for i in range(10)]
+    segmented = []
+
+    def iter_video_chunks(video_path, chunk_size, max_side=None, start_frame=0):
+        for start in range(start_frame, len(frames), chunk_size):
+            yield start, frames[start:start + chunk_size]
+
+    def segment_chunk(chunk, text_prompt):
+        if len(segmented) == 2 and not tool.resume:
+            raise KeyboardInterrupt
+        segmented.append(len(chunk))
+        return {idx: {"object_ids": [1], "masks": [RunLengthMask.encode(mask)]} for idx, mask in enumerate(chunk)}
+
+    monkeypatch.setattr(tool, "_iter_video_chunks", iter_video_chunks)
+    monkeypatch.setattr(tool, "_segment_chunk", segment_chunk)
+
+    mask_dir = tmp_path / "masks"
+    write_chunk_checkpoint = tool._write_chunk_checkpoint
+
+    def interrupted_write_chunk_checkpoint(checkpoint_dir, **kwargs):
+        checkpoint_dir.mkdir(parents=True)
+        raise KeyboardInterrupt
+
+    # Interrupted before the first checkpoint, the inference starts over.
+    monkeypatch.setattr(tool, "_write_chunk_checkpoint", interrupted_write_chunk_checkpoint)
+    with pytest.raises(KeyboardInterrupt):
+        tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3, mask_format="npz")
+    assert not (mask_dir / ".checkpoint" / "state.json").exists()
+    monkeypatch.setattr(tool, "_write_chunk_checkpoint", write_chunk_checkpoint)
+    segmented.clear()
+
+    with pytest.raises(KeyboardInterrupt):
+        tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3, mask_format="npz")
+    assert (mask_dir / ".checkpoint" / "state.json").exists()
+    assert not (mask_dir / "masks.npz").exists()
+
+    # The settings of the interrupted inference are required.
+    tool.resume = True
+    with pytest.raises(ValueError):
+        tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3, text_prompt="cars")
+
+    tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3, mask_format="npz")
+    assert segmented == [3, 3, 3, 1]
+    assert not (mask_dir / ".checkpoint").exists()
+    with MaskReader(mask_dir / "masks.npz") as reader:
+        assert len(reader) == 10
+        assert reader.object_ids == [0]
+        for index, frame in enumerate(frames):
+            np.testing.assert_array_equal(reader.mask(index, 0), frame)
+
+
+class FileVideoWriter(DummyVideoWriter):
+    """Stand-in for VideoWriter, writing the number of frames into the file."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path.write_bytes(b"")
+
+    def close(self):
+        self.path.write_text(f"{len(self.frames)}")
+
+
+@pytest.mark.unit
+def test_infer_resumes_mask_videos_from_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(sam3_tool_module, "VideoReader", DummyVideoReader)
+    monkeypatch.setattr(mask_module, "VideoWriter", FileVideoWriter)
+    concatenated = []
+
+    def concat_videos(paths, path, overwrite=False):
+        concatenated.append([path.name for path in paths])
+        path.write_text(f"{sum(int(path.read_text()) for path in paths)}")
+
+    monkeypatch.setattr(mask_module, "concat_videos", concat_videos)
+    tool = make_tool(overwrite=False)
+    tool.checkpoint = True
+
+    # The object is present on the frames 4 to 8 out of 10.
+    mask = RunLengthMask.encode(np.array([[1, 0], [0, 1]], dtype=bool))
+    frames = list(range(10))
+    segmented = []
+
+    def iter_video_chunks(video_path, chunk_size, max_side=None, start_frame=0):
+        for start in range(start_frame, len(frames), chunk_size):
+            yield start, frames[start:start + chunk_size]
+
+    def segment_chunk(chunk, text_prompt):
+        if len(segmented) == 2 and not tool.resume:
+            raise KeyboardInterrupt
+        segmented.append(chunk[0])
+        return {
+            idx: {"object_ids": [1], "masks": [mask]} if 4 <= frame < 9 else {"object_ids": [], "masks": []}
+            for idx, frame in enumerate(chunk)
+        }
+
+    monkeypatch.setattr(tool, "_iter_video_chunks", iter_video_chunks)
+    monkeypatch.setattr(tool, "_segment_chunk", segment_chunk)
+
+    mask_dir = tmp_path / "masks"
+    with pytest.raises(KeyboardInterrupt):
+        tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3)
+    # A segment left by a chunk after the last checkpoint is removed on resume.
+    (mask_dir / ".checkpoint" / "0" / "000000006.mp4").write_text("3")
+    assert sorted(path.name for path in (mask_dir / ".checkpoint" / "0").iterdir()) == [
+        "000000003.json", "000000003.mp4", "000000006.mp4",
+    ]
+
+    tool.resume = True
+    tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3)
+    assert segmented == [0, 3, 6, 9]
+    assert concatenated == [["000000003.mp4", "000000006.mp4"]]
+    assert sorted(path.name for path in mask_dir.iterdir()) == ["0.json", "0.mp4"]
+    assert (mask_dir / "0.mp4").read_text() == "5"
+    index = mask_module.read_track_index(mask_dir / "0.mp4")
+    assert index["spans"] == [[4, 9]]
+    assert index["num_frames"] == 10
+
+
+@pytest.mark.unit
+def test_infer_resume_requires_complete_masks(monkeypatch, tmp_path):
+    monkeypatch.setattr(sam3_tool_module, "VideoReader", DummyVideoReader)
+    monkeypatch.setattr(mask_module, "VideoWriter", FileVideoWriter)
+    monkeypatch.setattr(mask_module, "concat_videos", lambda paths, path, overwrite=False: path.write_text("10"))
+    tool = make_tool(overwrite=False)
+
+    mask = RunLengthMask.encode(np.array([[1, 0], [0, 1]], dtype=bool))
+    frames = list(range(10))
+    segmented = []
+
+    def iter_video_chunks(video_path, chunk_size, max_side=None, start_frame=0):
+        for start in range(start_frame, len(frames), chunk_size):
+            yield start, frames[start:start + chunk_size]
+
+    def segment_chunk(chunk, text_prompt):
+        if len(segmented) == 2 and not tool.overwrite:
+            raise KeyboardInterrupt
+        segmented.append(chunk[0])
+        return {idx: {"object_ids": [1], "masks": [mask]} for idx in range(len(chunk))}
+
+    monkeypatch.setattr(tool, "_iter_video_chunks", iter_video_chunks)
+    monkeypatch.setattr(tool, "_segment_chunk", segment_chunk)
+
+    # Interrupted without checkpoint, the masks written so far are incomplete.
+    mask_dir = tmp_path / "masks"
+    with pytest.raises(KeyboardInterrupt):
+        tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3)
+    assert mask_module.read_track_index(mask_dir / "0.mp4")["num_frames"] == 6
+
+    tool.checkpoint = tool.resume = True
+    with pytest.raises(FileExistsError, match="--overwrite"):
+        tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3)
+
+    tool.overwrite = True
+    segmented.clear()
+    tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3)
+    assert segmented == [0, 3, 6, 9]
 
-    # First 3 frames are backfill, last frame contains the detected mask.
-    assert writers[2].frames[0].sum() == 0
-    assert writers[2].frames[1].sum() == 0
-    assert writers[2].frames[2].sum() == 0
-    assert writers[2].frames[3].sum() > 0
+    # Complete, the masks are kept as they are.
+    tool.overwrite = False
+    segmented.clear()
+    tool.infer(video_path=tmp_path / "video.mp4", mask_dir=mask_dir, chunk_size=3)
+    assert segmented == []
+    assert mask_module.read_track_index(mask_dir / "0.mp4")["num_frames"] == 10